@@ -0,0 +1,128 @@
+"""
+Benchmark of the Solar Assistant MQTT ingestion path (no broker needed)
+
+Usage: python bench_mqtt_decode.py [recording.jsonl.gz] [speed]
+
+Reports decoding throughput and per-message latency, then replays the
+traffic at the given speed (default 10x) with event-driven emission to
+measure the end-to-end reading latency of the MQTT mode.
+"""
+
+import random
+import sys
+import time
+from typing import List
+from mqtt_replay import Message, load_recording, replay
+from solar_assistant_mqtt import SolarAssistantMQTT, KNOWN_METRICS
+
+
+def synthetic_traffic(inverters: int = 2, count: int = 200000, period: float = 1.0) -> List[Message]:
+    """Solar Assistant-like traffic: every metric of every inverter, once per period"""
+    topics = [
+        f"solar_assistant/inverter_{index}/{metric}/state"
+        for index in range(1, inverters + 1)
+        for metric in KNOWN_METRICS
+    ]
+    topics.append("solar_assistant/inverter_1/device_mode/state")
+    step = period / len(topics)
+    return [
+        Message(topics[i % len(topics)], f"{random.uniform(0, 5000):.1f}".encode(), i * step)
+        if not topics[i % len(topics)].endswith("device_mode/state")
+        else Message(topics[i % len(topics)], b"Solar/Battery", i * step)
+        for i in range(count)
+    ]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench_throughput(messages: List[Message], rounds: int = 5):
+    """Messages/sec through _on_message, after a warm-up filling the topic cache"""
+    client = SolarAssistantMQTT("localhost")
+    for msg in messages[:1000]:
+        client._on_message(None, None, msg)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for msg in messages:
+            client._on_message(None, None, msg)
+    elapsed = time.perf_counter() - start
+
+    total = len(messages) * rounds
+    print(f"📊 {total} messages in {elapsed:.2f}s")
+    print(f"   {total / elapsed:,.0f} messages/sec")
+    print(f"   {elapsed / total * 1e6:.2f} µs/message")
+    print(f"   {len(client.inverter_slots)} inverter(s), {len(client.metric_names)} metric slots")
+
+
+def bench_decode_latency(messages: List[Message]):
+    """Distribution of the time spent in _on_message per message"""
+    client = SolarAssistantMQTT("localhost")
+    on_message = client._on_message
+    clock = time.perf_counter_ns
+    latencies = []
+    for msg in messages:
+        start = clock()
+        on_message(None, None, msg)
+        latencies.append((clock() - start) / 1000)
+
+    print(f"⏱️ Decode latency: p50 {percentile(latencies, 0.5):.2f} µs, "
+          f"p99 {percentile(latencies, 0.99):.2f} µs, max {max(latencies):.2f} µs")
+
+
+def bench_reading_latency(messages: List[Message], speed: float = 10.0):
+    """
+    End-to-end reading latency with event-driven emission
+
+    The emit interval is scaled with the replay speed. Data age is the time
+    between the first message not yet in a reading and the reading built
+    from it, in recorded (real-time) seconds; build time is the wall time of
+    emit_reading itself. Storing in MongoDB is not included.
+    """
+    client = SolarAssistantMQTT("localhost")
+    client.emit_interval = client.emit_interval / speed
+    on_message = client._on_message
+    pending = []
+    ages, build_times = [], []
+
+    def on_update():
+        start = time.perf_counter()
+        client.emit_reading()
+        done = time.perf_counter()
+        build_times.append((done - start) * 1e6)
+        if pending:
+            ages.append((done - pending[0]) * speed)
+            pending.clear()
+
+    def deliver(msg):
+        if not pending:
+            pending.append(time.perf_counter())
+        on_message(None, None, msg)
+
+    client.on_update = on_update
+    elapsed = replay(messages, deliver, speed)
+
+    print(f"🔁 Replayed {len(messages)} messages at {speed:g}x in {elapsed:.2f}s, {len(build_times)} readings")
+    print(f"   Data age at emit: p50 {percentile(ages, 0.5):.2f} s, max {max(ages, default=0.0):.2f} s")
+    print(f"   Reading build time: p50 {percentile(build_times, 0.5):.1f} µs, "
+          f"p99 {percentile(build_times, 0.99):.1f} µs")
+
+
+if __name__ == "__main__":
+    messages = load_recording(sys.argv[1]) if len(sys.argv) > 1 else synthetic_traffic()
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+
+    bench_throughput(messages)
+    bench_decode_latency(messages)
+
+    # Keep the replay short: at most ~10 s of wall time
+    duration = messages[-1].timestamp - messages[0].timestamp if messages else 0.0
+    if duration > 10 * speed:
+        cutoff = messages[0].timestamp + 10 * speed
+        messages = [msg for msg in messages if msg.timestamp <= cutoff]
+    bench_reading_latency(messages, speed)
@@ -0,0 +1,116 @@
+"""
+Benchmark of the per-reading CPU cost of the polling path (no hardware needed)
+
+Usage: python bench_reading_decode.py [readings]
+
+Decodes one full GROWATT poll (every register block of the default map)
+and builds the MongoDB document, three ways:
+- before: blocks decoded into a dict, InverterReading Pydantic model built
+  from it as collect_readings used to, then model_dump()
+- serial: register lists (pymodbus RTU) packed and decoded into a
+  ReadingRecord, then to_document()
+- tcp: response bytes (Modbus TCP gateway) decoded in place, no copy
+
+Needs the backend environment (server.py is imported for InverterReading).
+"""
+
+import random
+import struct
+import sys
+import time
+from typing import Any, Dict, List
+
+from growatt_driver import finalize_growatt_record
+from growatt_registers import GROWATT_DEFAULT_MAP, IDENTITY_GROUP, plan_reads
+from reading_record import ReadingRecord
+from server import InverterReading
+
+
+def synthetic_poll():
+    """Plan of a full poll and random register values for each block"""
+    plan = [block for block in plan_reads(GROWATT_DEFAULT_MAP) if block.group != IDENTITY_GROUP]
+    registers = [[random.randrange(0, 5000) for _ in range(block.count)] for block in plan]
+    return plan, registers
+
+
+def read_before(plan, registers: List[List[int]]) -> Dict[str, Any]:
+    """Former path: dict decode, then InverterReading validation and dump"""
+    data: Dict[str, Any] = {}
+    for block, block_registers in zip(plan, registers):
+        values = block.layout.unpack(struct.pack(f'>{block.count}H', *block_registers))
+        for (name, _, divisor), value in zip(block.targets, values):
+            if name in data:
+                data[name] += value / divisor
+            else:
+                data[name] = value / divisor
+    data['status'] = 'ok' if data.pop('status_code', 1) == 1 else 'error'
+    if 'battery_power' not in data and 'battery_voltage' in data and 'battery_current' in data:
+        data['battery_power'] = data['battery_voltage'] * data['battery_current']
+
+    reading = InverterReading(
+        inverter_id="bench",
+        ac_power=data.get('ac_power', 0.0),
+        dc_power=data.get('dc_power', 0.0),
+        ac_voltage=data.get('ac_voltage', 0.0),
+        dc_voltage=data.get('dc_voltage', 0.0),
+        ac_current=data.get('ac_current', 0.0),
+        dc_current=data.get('dc_current', 0.0),
+        frequency=data.get('frequency', 50.0),
+        energy_today=data.get('energy_today', 0.0),
+        energy_total=data.get('energy_total', 0.0),
+        temperature=data.get('temperature', 0.0),
+        battery_voltage=data.get('battery_voltage', 0.0),
+        battery_current=data.get('battery_current', 0.0),
+        battery_soc=data.get('battery_soc', 0.0),
+        battery_temperature=data.get('battery_temperature', 0.0),
+        battery_power=data.get('battery_power', 0.0),
+        grid_power=data.get('grid_power', 0.0),
+        grid_voltage=data.get('grid_voltage', 0.0),
+        grid_frequency=data.get('grid_frequency', 50.0),
+        status=data.get('status', 'ok')
+    )
+    document = reading.model_dump()
+    document['timestamp'] = document['timestamp'].isoformat()
+    return document
+
+
+def read_record(plan, raw_blocks) -> Dict[str, Any]:
+    """New path: decode into a ReadingRecord, one conversion to the document"""
+    record = ReadingRecord()
+    values = record.values
+    for block, raw in zip(plan, raw_blocks):
+        block.decode(raw, values)
+    finalize_growatt_record(record)
+    return record.to_document("bench")
+
+
+def bench(label: str, function, count: int) -> float:
+    """CPU µs per call"""
+    start = time.process_time()
+    for _ in range(count):
+        function()
+    cost = (time.process_time() - start) / count * 1e6
+    print(f"   {label:<8} {cost:8.2f} µs/reading")
+    return cost
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    plan, registers = synthetic_poll()
+    responses = [bytes([0, 0]) + struct.pack(f'>{len(r)}H', *r) for r in registers]
+
+    # Same document both ways (apart from id and timestamp)
+    before = read_before(plan, registers)
+    after = read_record(plan, [memoryview(response)[2:] for response in responses])
+    for document in (before, after):
+        del document['id'], document['timestamp']
+    assert before == after, (before, after)
+    print(f"✅ Same document, {len(after)} fields, {len(plan)} register blocks per poll\n")
+
+    print(f"⏱️ CPU cost over {count} readings:")
+    reference = bench("before", lambda: read_before(plan, registers), count)
+    serial = bench("serial", lambda: read_record(
+        plan, [struct.pack(f'>{len(r)}H', *r) for r in registers]), count)
+    tcp = bench("tcp", lambda: read_record(
+        plan, [memoryview(response)[2:] for response in responses]), count)
+    print(f"\n📊 Speedup: {reference / serial:.1f}x (serial), {reference / tcp:.1f}x (tcp)")
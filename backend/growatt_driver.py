@@ -0,0 +1,606 @@
+"""
+Driver Modbus asynchrone pour onduleurs GROWATT
+
+Reads are awaitable, can be cancelled and have a per-transaction timeout,
+so the collector can poll many inverters concurrently from the event loop
+without threads. Slaves sharing a port or gateway share one connection.
+
+Inverter ports:
+- /dev/ttyUSB0: local RS485 (Modbus RTU), transactions serialized
+- rtu+tcp://host:port: RS485-to-Ethernet gateway in transparent mode (RTU
+  frames over TCP), transactions serialized
+- tcp://host[:502]: Modbus TCP gateway or dongle; requests for any unit ID
+  are pipelined on one connection and matched by transaction ID
+"""
+
+import asyncio
+import itertools
+import logging
+import struct
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from pymodbus import FramerType
+from pymodbus.client import AsyncModbusSerialClient, AsyncModbusTcpClient
+
+from growatt_registers import (
+    IDENTITY_GROUP,
+    REQUIRED_GROUP,
+    TIER_FAST,
+    TIER_IDENTITY,
+    TIER_SLOW,
+    ReadBlock,
+    get_register_map,
+    plan_reads
+)
+from reading_record import FIELD_INDEX, ReadingRecord
+from transport_stats import ERROR, EXCEPTION, TIMEOUT, TransportStats
+
+logger = logging.getLogger(__name__)
+
+# Record indexes used by the driver
+AC_POWER = FIELD_INDEX['ac_power']
+STATUS_CODE = FIELD_INDEX['status_code']
+BATTERY_POWER = FIELD_INDEX['battery_power']
+BATTERY_VOLTAGE = FIELD_INDEX['battery_voltage']
+BATTERY_CURRENT = FIELD_INDEX['battery_current']
+
+# Seconds allowed for one Modbus transaction (request + response)
+DEFAULT_TRANSACTION_TIMEOUT = 3.0
+
+# Slow tier (counters, temperatures) read every N polls: 1 min at 5 s
+SLOW_TIER_EVERY = 12
+
+# Modbus exception codes meaning the device lacks the registers: illegal
+# function, illegal data address
+UNSUPPORTED_EXCEPTION_CODES = (1, 2)
+
+# Requests in flight on one Modbus TCP connection
+MAX_IN_FLIGHT = 8
+
+# Seconds before pipelining is tried again on a gateway that fell back to
+# one request at a time
+PIPELINING_RETRY_SECONDS = 600
+
+MODBUS_TCP_PORT = 502
+
+# Modbus RTU frame sizes (bytes): read request, exception answer, answer header + CRC
+RTU_REQUEST_SIZE = 8
+RTU_EXCEPTION_SIZE = 5
+RTU_RESPONSE_OVERHEAD = 5
+
+# Modbus TCP read request size (MBAP header + PDU)
+TCP_REQUEST_SIZE = 12
+MBAP_HEADER_SIZE = 7
+
+
+class ModbusTransactionError(Exception):
+    """Modbus exception response (illegal address, function...)"""
+
+    def __init__(self, message: str, exception_code: Optional[int] = None):
+        super().__init__(message)
+        self.exception_code = exception_code
+
+
+class AsyncModbusBus:
+    """One RS485 bus: a single async client shared by all the slaves of a port"""
+
+    # Transactions wait for each other: one request on the wire at a time
+    pipelined = False
+
+    def __init__(self, port: str, baudrate: int = 9600, timeout: float = DEFAULT_TRANSACTION_TIMEOUT):
+        """
+        Initialize bus
+
+        Args:
+            port: Serial port (e.g., /dev/ttyUSB0) or rtu+tcp://host:port gateway
+            baudrate: Serial speed
+            timeout: Default transaction timeout in seconds
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.client = None
+        # One transaction at a time on a half-duplex bus
+        self.lock = asyncio.Lock()
+        self.stats: Dict[int, TransportStats] = {}  # Slave -> transport statistics
+        self.connects = 0
+
+    def stats_for(self, slave_id: int) -> TransportStats:
+        """Transport statistics of a slave"""
+        stats = self.stats.get(slave_id)
+        if stats is None:
+            stats = TransportStats(counts_retries=False)  # A failed read is not re-sent
+            self.stats[slave_id] = stats
+        return stats
+
+    def _create_client(self):
+        """pymodbus client for the port"""
+        if self.port.startswith('rtu+tcp://'):
+            address = urlsplit(self.port)
+            return AsyncModbusTcpClient(
+                address.hostname,
+                port=address.port or MODBUS_TCP_PORT,
+                framer=FramerType.RTU,
+                timeout=self.timeout,
+                retries=0
+            )
+        return AsyncModbusSerialClient(
+            port=self.port,
+            baudrate=self.baudrate,
+            parity='N',
+            stopbits=1,
+            bytesize=8,
+            timeout=self.timeout,
+            retries=0
+        )
+
+    async def _ensure_connected(self):
+        """Open the port if needed"""
+        if self.client is None:
+            self.client = self._create_client()
+        if not self.client.connected:
+            self.connects += 1
+            if not await self.client.connect():
+                self.close()
+                raise ConnectionError(f"Impossible de se connecter au port {self.port}")
+
+    async def read_registers(self, slave_id: int, address: int, count: int, table: str = "holding",
+                             timeout: Optional[float] = None) -> List[int]:
+        """
+        Read holding or input registers in one transaction
+
+        Args:
+            slave_id: Modbus device ID
+            address: First register
+            count: Number of registers
+            table: "holding" (function 03) or "input" (function 04)
+            timeout: Transaction timeout (default: bus timeout)
+
+        Returns:
+            Register values
+
+        Raises:
+            asyncio.TimeoutError: No answer within the timeout
+            ModbusTransactionError: Exception response from the device
+        """
+        stats = self.stats_for(slave_id)
+        async with self.lock:
+            try:
+                await self._ensure_connected()
+            except Exception as e:
+                stats.failure(ERROR, 0.0, error=e)
+                raise
+            if table == "input":
+                request = self.client.read_input_registers(address, count=count, device_id=slave_id)
+            else:
+                request = self.client.read_holding_registers(address, count=count, device_id=slave_id)
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(request, timeout or self.timeout)
+            except (Exception, asyncio.CancelledError) as e:
+                # Timeout, cancellation or transport error: a late answer
+                # would be taken for the next request's, so start over
+                if isinstance(e, Exception):
+                    kind = TIMEOUT if isinstance(e, asyncio.TimeoutError) else ERROR
+                    stats.failure(kind, time.perf_counter() - start, RTU_REQUEST_SIZE, error=e)
+                self.close()
+                raise
+            latency = time.perf_counter() - start
+
+        if result.isError():
+            exception_code = getattr(result, 'exception_code', None)
+            stats.failure(EXCEPTION, latency, RTU_REQUEST_SIZE, RTU_EXCEPTION_SIZE,
+                          error=f"exception {exception_code}", code=exception_code)
+            raise ModbusTransactionError(
+                f"Registres {address}-{address + count - 1}: {result}",
+                exception_code
+            )
+        stats.success(latency, RTU_REQUEST_SIZE, RTU_RESPONSE_OVERHEAD + 2 * len(result.registers))
+        return result.registers
+
+    async def read_block(self, slave_id: int, address: int, count: int, table: str = "holding",
+                         timeout: Optional[float] = None) -> bytes:
+        """Read registers as big-endian bytes (ReadBlock.decode input)"""
+        registers = await self.read_registers(slave_id, address, count, table, timeout)
+        return struct.pack(f'>{len(registers)}H', *registers)
+
+    def close(self):
+        """Close the port (reopened by the next transaction)"""
+        if self.client is not None:
+            try:
+                self.client.close()
+            except Exception as e:
+                logger.debug(f"Erreur fermeture {self.port}: {e}")
+            self.client = None
+
+
+class ModbusTcpGateway:
+    """
+    Persistent Modbus TCP connection to a gateway, shared by all its unit IDs
+
+    Requests are written without waiting for the previous answers (up to
+    MAX_IN_FLIGHT) and answers are matched by MBAP transaction ID, so units
+    behind one gateway are polled in parallel and a late answer can never
+    be taken for another request's.
+
+    Gateways that drop requests arriving while one is in flight answer some
+    requests of a burst (requests sent while others are pending) and lose
+    the others. The gateway falls back to one request at a time only on
+    that pattern: an overlapped request times out while other requests of
+    its burst were answered, and its unit is alive (another of its requests
+    in the burst was answered, or its previous request was). A unit that
+    does not answer at all (dead, unplugged, wrong ID) times out on its own
+    and pipelining stays on for the other units. Pipelining is tried again
+    PIPELINING_RETRY_SECONDS after a fallback.
+    """
+
+    def __init__(self, port: str, timeout: float = DEFAULT_TRANSACTION_TIMEOUT,
+                 max_in_flight: int = MAX_IN_FLIGHT):
+        """
+        Initialize gateway
+
+        Args:
+            port: tcp://host[:port]
+            timeout: Default transaction timeout in seconds
+            max_in_flight: Requests written before waiting for answers
+        """
+        address = urlsplit(port)
+        self.port = port
+        self.host = address.hostname
+        self.tcp_port = address.port or MODBUS_TCP_PORT
+        self.timeout = timeout
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.receiver: Optional[asyncio.Task] = None
+        # Transaction ID -> (answer future, unit ID)
+        self.pending: Dict[int, Tuple[asyncio.Future, int]] = {}
+        self.transaction_ids = itertools.cycle(range(1, 0x10000))
+        self.connect_lock = asyncio.Lock()
+        self.configured_in_flight = max_in_flight
+        self.max_in_flight = max_in_flight
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.pipelined = max_in_flight > 1
+        # Units answered in the current burst (requests sent while others
+        # are pending)
+        self.burst_units: Set[int] = set()
+        # Unit ID -> whether its last request was answered
+        self.unit_answered: Dict[int, bool] = {}
+        self.fallbacks = 0
+        self.fallback_at: Optional[float] = None
+        self.stats: Dict[int, TransportStats] = {}  # Unit ID -> transport statistics
+        self.connects = 0
+
+    def stats_for(self, slave_id: int) -> TransportStats:
+        """Transport statistics of a unit"""
+        stats = self.stats.get(slave_id)
+        if stats is None:
+            stats = TransportStats(counts_retries=False)  # A failed read is not re-sent
+            self.stats[slave_id] = stats
+        return stats
+
+    async def _ensure_connected(self):
+        """Open the connection if needed"""
+        async with self.connect_lock:
+            if self.writer is not None:
+                return
+            self.connects += 1
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.tcp_port), self.timeout
+            )
+            self.receiver = asyncio.create_task(self._receive_loop())
+            logger.info(f"🔌 Passerelle Modbus TCP {self.host}:{self.tcp_port} connectée")
+
+    async def _receive_loop(self):
+        """Dispatch answers to their pending requests by transaction ID"""
+        try:
+            while True:
+                header = await self.reader.readexactly(7)
+                transaction_id, _, length, _ = struct.unpack('>HHHB', header)
+                pdu = await self.reader.readexactly(length - 1)
+                request = self.pending.pop(transaction_id, None)
+                if request is None:
+                    continue
+                future, unit = request
+                self.burst_units.add(unit)
+                self.unit_answered[unit] = True
+                if not future.done():
+                    future.set_result(pdu)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Passerelle {self.host}:{self.tcp_port} déconnectée: {e!r}")
+            self.close(ConnectionError(f"Passerelle {self.host}:{self.tcp_port} déconnectée"))
+
+    async def read_registers(self, slave_id: int, address: int, count: int, table: str = "holding",
+                             timeout: Optional[float] = None) -> List[int]:
+        """Read holding or input registers in one transaction (see read_block)"""
+        raw = await self.read_block(slave_id, address, count, table, timeout)
+        return list(struct.unpack(f'>{len(raw) // 2}H', raw))
+
+    async def read_block(self, slave_id: int, address: int, count: int, table: str = "holding",
+                         timeout: Optional[float] = None) -> memoryview:
+        """
+        Read holding or input registers in one transaction
+
+        Args:
+            slave_id: Unit ID behind the gateway
+            address: First register
+            count: Number of registers
+            table: "holding" (function 03) or "input" (function 04)
+            timeout: Transaction timeout (default: gateway timeout)
+
+        Returns:
+            Register values as big-endian bytes, a view on the response (no copy)
+
+        Raises:
+            asyncio.TimeoutError: No answer within the timeout
+            ModbusTransactionError: Exception response from the device
+        """
+        function = 0x04 if table == "input" else 0x03
+        stats = self.stats_for(slave_id)
+        if self.fallback_at is not None and time.monotonic() - self.fallback_at >= PIPELINING_RETRY_SECONDS:
+            self._enable_pipelining()
+        async with self.in_flight:
+            try:
+                await self._ensure_connected()
+            except Exception as e:
+                stats.failure(ERROR, 0.0, error=e)
+                raise
+            transaction_id = next(self.transaction_ids)
+            future = asyncio.get_running_loop().create_future()
+            if not self.pending:
+                self.burst_units = set()  # New burst
+            self.pending[transaction_id] = (future, slave_id)
+            overlapped = len(self.pending) > 1
+            start = time.perf_counter()
+            try:
+                self.writer.write(struct.pack('>HHHBBHH', transaction_id, 0, 6, slave_id, function, address, count))
+                pdu = await asyncio.wait_for(future, timeout or self.timeout)
+            except asyncio.TimeoutError as e:
+                stats.failure(TIMEOUT, time.perf_counter() - start, TCP_REQUEST_SIZE, error=e)
+                if overlapped and self._dropped_by_gateway(slave_id):
+                    if self.pipelined:
+                        self._disable_pipelining()
+                else:
+                    self.unit_answered[slave_id] = False
+                raise
+            except Exception as e:
+                stats.failure(ERROR, time.perf_counter() - start, TCP_REQUEST_SIZE, error=e)
+                raise
+            finally:
+                self.pending.pop(transaction_id, None)
+            latency = time.perf_counter() - start
+
+        received = MBAP_HEADER_SIZE + len(pdu)
+        if pdu[0] & 0x80:
+            stats.failure(EXCEPTION, latency, TCP_REQUEST_SIZE, received, error=f"exception {pdu[1]}", code=pdu[1])
+            raise ModbusTransactionError(
+                f"Registres {address}-{address + count - 1}: exception {pdu[1]} (unit {slave_id})",
+                pdu[1]
+            )
+        stats.success(latency, TCP_REQUEST_SIZE, received)
+        return memoryview(pdu)[2:2 + pdu[1]]
+
+    def _dropped_by_gateway(self, slave_id: int) -> bool:
+        """A request of the current burst timed out: lost by the gateway rather than by a silent unit?"""
+        if not self.burst_units:
+            return False  # Nothing answered: gateway or connection down
+        return slave_id in self.burst_units or self.unit_answered.get(slave_id, False)
+
+    def _disable_pipelining(self):
+        """Fall back to one request at a time (gateway without request queue)"""
+        logger.warning(f"⚠️ Passerelle {self.host}:{self.tcp_port}: requêtes simultanées perdues, "
+                       f"passage en requêtes séquentielles "
+                       f"(nouvel essai dans {PIPELINING_RETRY_SECONDS}s)")
+        self.max_in_flight = 1
+        self.in_flight = asyncio.Semaphore(1)
+        self.pipelined = False
+        self.fallbacks += 1
+        self.fallback_at = time.monotonic()
+
+    def _enable_pipelining(self):
+        """Try pipelined requests again after a fallback"""
+        logger.info(f"🔁 Passerelle {self.host}:{self.tcp_port}: nouvel essai des requêtes simultanées")
+        self.max_in_flight = self.configured_in_flight
+        self.in_flight = asyncio.Semaphore(self.configured_in_flight)
+        self.pipelined = self.configured_in_flight > 1
+        self.fallback_at = None
+
+    def pipelining_info(self) -> Dict[str, Any]:
+        """Pipelining state of the gateway (transport statistics)"""
+        return {
+            "pipelined": self.pipelined,
+            "max_in_flight": self.max_in_flight,
+            "fallbacks": self.fallbacks,
+            "retry_in_s": (
+                max(0.0, round(PIPELINING_RETRY_SECONDS - (time.monotonic() - self.fallback_at), 1))
+                if self.fallback_at is not None else None
+            ),
+        }
+
+    def close(self, error: Optional[Exception] = None):
+        """Close the connection and fail the requests in flight"""
+        for future, _ in self.pending.values():
+            if not future.done():
+                future.set_exception(error or ConnectionError("Connexion fermée"))
+        self.pending.clear()
+        if self.receiver is not None and self.receiver is not asyncio.current_task():
+            self.receiver.cancel()
+        self.receiver = None
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class GrowattDeviceState:
+    """Polling state of one inverter (port + slave)"""
+
+    def __init__(self):
+        self.cycle = 0
+        self.identity: Dict[str, Any] = {}
+        self.identity_read = False
+        # Negative capability cache: optional groups the device rejected
+        self.unsupported_groups: Set[str] = set()
+        # Last slow tier values (record index, value), reported again on fast-only polls
+        self.slow_values: List[Tuple[int, float]] = []
+
+    def due_tiers(self) -> FrozenSet[str]:
+        """Tiers to read this poll"""
+        tiers = {TIER_FAST}
+        if self.cycle % SLOW_TIER_EVERY == 0:
+            tiers.add(TIER_SLOW)
+        # Identity until read once (retried with the slow tier after a failure)
+        if not self.identity_read and IDENTITY_GROUP not in self.unsupported_groups and TIER_SLOW in tiers:
+            tiers.add(TIER_IDENTITY)
+        return frozenset(tiers)
+
+
+class GrowattAsyncDriver:
+    """Lecture asynchrone des onduleurs GROWATT via Modbus RTU"""
+
+    def __init__(self, timeout: float = DEFAULT_TRANSACTION_TIMEOUT):
+        self.timeout = timeout
+        self.buses: Dict[str, Any] = {}  # Port or gateway -> AsyncModbusBus / ModbusTcpGateway
+        self.devices: Dict[Tuple[str, int], GrowattDeviceState] = {}  # (port, slave) -> state
+        # (register map, tiers, unsupported groups) -> read plan
+        self.plans: Dict[Tuple[str, FrozenSet[str], FrozenSet[str]], List[ReadBlock]] = {}
+
+    def get_bus(self, config: Dict[str, Any]):
+        """Get or create the (pooled) connection of an inverter's port or gateway"""
+        port = config['port'].strip()
+        bus = self.buses.get(port)
+        if bus is None:
+            if port.startswith('tcp://'):
+                bus = ModbusTcpGateway(port, self.timeout)
+            else:
+                bus = AsyncModbusBus(port, config.get('baudrate', 9600), self.timeout)
+            self.buses[port] = bus
+        return bus
+
+    def get_device(self, config: Dict[str, Any]) -> GrowattDeviceState:
+        """Get or create the polling state of an inverter"""
+        key = (config['port'], config.get('slave_id', 1))
+        state = self.devices.get(key)
+        if state is None:
+            state = GrowattDeviceState()
+            self.devices[key] = state
+        return state
+
+    def get_plan(self, model: Optional[str], tiers: FrozenSet[str],
+                 unsupported_groups: FrozenSet[str] = frozenset()) -> List[ReadBlock]:
+        """Get the (cached) read plan of a model for the due tiers and supported groups"""
+        name, fields = get_register_map(model)
+        key = (name, tiers, unsupported_groups)
+        plan = self.plans.get(key)
+        if plan is None:
+            plan = plan_reads([
+                field for field in fields
+                if field.tier in tiers and field.group not in unsupported_groups
+            ])
+            self.plans[key] = plan
+            logger.info(f"📋 Plan de lecture GROWATT '{name}' {sorted(tiers)}: {plan}")
+        return plan
+
+    async def read(self, config: Dict[str, Any]) -> Optional[ReadingRecord]:
+        """
+        Lit les données d'un onduleur GROWATT
+
+        Registers come from the model's register map (growatt_registers.py),
+        read in the planned blocks. Only the due tiers are read: power every
+        poll, counters/temperatures every SLOW_TIER_EVERY polls (last values
+        reported in between), identity once. An optional block rejected by
+        the device (illegal function/address) is never requested again.
+        Blocks are decoded from the response bytes straight into the record.
+
+        Args:
+            config: Inverter configuration (port or gateway URL, slave_id, baudrate, model)
+
+        Returns:
+            Relevé lu ou None en cas d'erreur
+        """
+        bus = self.get_bus(config)
+        state = self.get_device(config)
+        slave_id = config.get('slave_id', 1)
+        tiers = state.due_tiers()
+        record = ReadingRecord()
+        values = record.values
+
+        plan = self.get_plan(config.get('model'), tiers, frozenset(state.unsupported_groups))
+        if bus.pipelined:
+            # Modbus TCP: every block on the wire at once, answers matched by transaction ID
+            results = await asyncio.gather(
+                *(bus.read_block(slave_id, block.address, block.count, block.table) for block in plan),
+                return_exceptions=True
+            )
+        else:
+            results = None
+
+        for index, block in enumerate(plan):
+            try:
+                if results is None:
+                    raw = await bus.read_block(slave_id, block.address, block.count, block.table)
+                else:
+                    raw = results[index]
+                    if isinstance(raw, BaseException):
+                        raise raw
+                if block.group == IDENTITY_GROUP:
+                    state.identity.update(block.decode_fields(raw))
+                    state.identity_read = True
+                else:
+                    block.decode(raw, values)
+            except Exception as e:
+                if block.group == REQUIRED_GROUP:
+                    logger.error(f"Erreur lecture GROWATT {bus.port} (slave {slave_id}) {block}: {e!r}")
+                    return None
+                if isinstance(e, ModbusTransactionError) and e.exception_code in UNSUPPORTED_EXCEPTION_CODES:
+                    state.unsupported_groups.add(block.group)
+                    logger.info(f"ℹ️ GROWATT {bus.port} (slave {slave_id}): bloc {block.group} non supporté, ignoré désormais")
+                else:
+                    logger.debug(f"Pas de données {block.group} disponibles: {e!r}")
+
+        state.cycle += 1
+        if TIER_SLOW in tiers:
+            state.slow_values = [
+                (index, values[index]) for index in self.slow_indexes(config.get('model'))
+                if values[index] is not None
+            ]
+        else:
+            for index, value in state.slow_values:
+                if values[index] is None:
+                    values[index] = value
+
+        finalize_growatt_record(record)
+        logger.debug(f"✅ GROWATT lu avec succès: {values[AC_POWER]}W")
+        return record
+
+    def slow_indexes(self, model: Optional[str]) -> Set[int]:
+        """Record indexes of the slow tier fields of a model"""
+        return {FIELD_INDEX[field.name] for field in get_register_map(model)[1]
+                if field.tier == TIER_SLOW and field.name in FIELD_INDEX}
+
+    def get_device_info(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Identity registers and capabilities learnt for an inverter"""
+        state = self.get_device(config)
+        return {
+            **state.identity,
+            "unsupported_groups": sorted(state.unsupported_groups),
+            "polls": state.cycle
+        }
+
+    def close_all(self):
+        """Ferme tous les bus"""
+        for port, bus in self.buses.items():
+            bus.close()
+            logger.info(f"Connexion Modbus {port} fermée")
+        self.buses.clear()
+
+
+def finalize_growatt_record(record: ReadingRecord):
+    """Derived fields common to all GROWATT register maps"""
+    values = record.values
+    status_code = values[STATUS_CODE]
+    record.status = 'ok' if status_code is None or status_code == 1 else 'error'
+    if values[BATTERY_POWER] is None and values[BATTERY_VOLTAGE] is not None and values[BATTERY_CURRENT] is not None:
+        values[BATTERY_POWER] = values[BATTERY_VOLTAGE] * values[BATTERY_CURRENT]  # W
@@ -0,0 +1,209 @@
+"""
+Tables de registres Modbus GROWATT et planification des lectures
+
+Each inverter model is described by a declarative register map. The read
+planner merges the registers of a map into as few Modbus transactions as
+possible and precomputes, for each transaction, the struct layout that
+decodes the whole block at once, straight from the response bytes into a
+ReadingRecord (reading_record.py).
+
+Adding a model is a data change: add a tuple of RegisterField to
+REGISTER_MAPS under the model name (matched as a prefix of the inverter's
+model, e.g. "SPH" matches "SPH 6000TL3"). Fields of the "main" group are
+required; other groups (battery, grid...) are optional blocks that some
+models do not have.
+
+Fields are also tiered by volatility: "fast" fields (power) are read every
+poll, "slow" ones (counters, temperatures) every few polls and "identity"
+ones (model, serial number) once.
+"""
+
+import struct
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from reading_record import FIELD_INDEX
+
+# Modbus limit for one read (function 03/04)
+MAX_REGISTERS_PER_READ = 125
+
+# Group whose registers every model must answer
+REQUIRED_GROUP = "main"
+
+# Group of the identity registers (not part of readings)
+IDENTITY_GROUP = "identity"
+
+# Polling tiers
+TIER_FAST = "fast"
+TIER_SLOW = "slow"
+TIER_IDENTITY = "identity"
+
+# struct codes per (width, signed)
+_STRUCT_CODES = {(1, False): 'H', (1, True): 'h', (2, False): 'I', (2, True): 'i'}
+
+
+class RegisterField(NamedTuple):
+    """One value of a register map"""
+    name: str                # Target ReadingRecord field (fields sharing a name are summed)
+    address: int             # First register
+    width: int = 1           # 1 = 16 bits, 2 = 32 bits (high word first), more = ASCII string
+    scale: float = 1.0       # Multiplier applied to the raw value
+    signed: bool = False     # Two's complement value
+    group: str = REQUIRED_GROUP
+    table: str = "holding"   # "holding" (function 03) or "input" (function 04)
+    tier: str = TIER_FAST
+
+
+# Registres GROWATT (documentation officielle)
+GROWATT_DEFAULT_MAP: Tuple[RegisterField, ...] = (
+    # 0-2: Status, Puissance PV1, Puissance PV2
+    RegisterField('status_code', 0),
+    RegisterField('dc_power', 1, scale=0.1),   # W (PV1 + PV2)
+    RegisterField('dc_power', 2, scale=0.1),
+    # 3-10: Tensions et courants DC
+    RegisterField('dc_voltage', 3, scale=0.1),  # V
+    RegisterField('dc_current', 4, scale=0.1),  # A
+    # 11-20: Puissance AC, tension, courant, fréquence
+    RegisterField('ac_power', 11, width=2, scale=0.1),  # W
+    RegisterField('ac_voltage', 13, scale=0.1),  # V
+    RegisterField('ac_current', 14, scale=0.1),  # A
+    RegisterField('frequency', 15, scale=0.01),  # Hz
+    # 53: Température
+    RegisterField('temperature', 53, scale=0.1, tier=TIER_SLOW),  # °C
+    # 59-62: Énergie aujourd'hui, totale
+    RegisterField('energy_today', 59, width=2, scale=0.1, tier=TIER_SLOW),  # kWh
+    RegisterField('energy_total', 61, width=2, scale=0.1, tier=TIER_SLOW),  # kWh
+    # 23-29: Identité (holding, hors des plages de mesure ci-dessus):
+    # numéro de série (ASCII, 10 caractères), code module/modèle
+    RegisterField('serial', 23, width=5, group=IDENTITY_GROUP, table="holding", tier=TIER_IDENTITY),
+    RegisterField('module_code', 28, width=2, group=IDENTITY_GROUP, table="holding", tier=TIER_IDENTITY),
+    # 1000+: Batterie (selon modèle)
+    RegisterField('battery_voltage', 1000, scale=0.1, group='battery'),  # V
+    RegisterField('battery_current', 1001, scale=0.1, signed=True, group='battery'),  # A (+ charge, - décharge)
+    RegisterField('battery_soc', 1002, group='battery'),  # %
+    RegisterField('battery_temperature', 1003, scale=0.1, group='battery', tier=TIER_SLOW),  # °C
+    # 2000+: Réseau (selon modèle)
+    RegisterField('grid_voltage', 2000, scale=0.1, group='grid'),  # V
+    RegisterField('grid_frequency', 2001, scale=0.01, group='grid'),  # Hz
+    RegisterField('grid_power', 2002, scale=0.1, signed=True, group='grid'),  # W (+ import, - export)
+)
+
+REGISTER_MAPS: Dict[str, Tuple[RegisterField, ...]] = {
+    "default": GROWATT_DEFAULT_MAP,
+}
+
+
+def get_register_map(model: Optional[str]) -> Tuple[str, Tuple[RegisterField, ...]]:
+    """
+    Find the register map of a model (longest matching prefix, else default)
+
+    Returns:
+        (map name, fields)
+    """
+    key = (model or '').upper()
+    matches = [name for name in REGISTER_MAPS if name != "default" and key.startswith(name.upper())]
+    name = max(matches, key=len) if matches else "default"
+    return name, REGISTER_MAPS[name]
+
+
+class ReadBlock:
+    """One planned Modbus transaction and its precomputed decoder"""
+
+    __slots__ = ('group', 'table', 'address', 'count', 'fields', 'layout', 'targets')
+
+    def __init__(self, group: str, table: str, fields: Sequence[RegisterField]):
+        self.group = group
+        self.table = table
+        self.fields = tuple(sorted(fields, key=lambda f: f.address))
+        self.address = self.fields[0].address
+        self.count = max(f.address + f.width for f in self.fields) - self.address
+
+        # One unpack of every field from the response bytes, with padding
+        # over the registers in between
+        fmt = '>'
+        position = self.address
+        for field in self.fields:
+            if field.address < position:
+                raise ValueError(f"Registre {field.address} ({field.name}) chevauche le champ précédent")
+            if field.address > position:
+                fmt += f'{2 * (field.address - position)}x'
+            fmt += _STRUCT_CODES.get((field.width, field.signed), f'{2 * field.width}s')
+            position = field.address + field.width
+        end = self.address + self.count
+        if end > position:
+            fmt += f'{2 * (end - position)}x'
+        self.layout = struct.Struct(fmt)
+        # (name, record index, divisor): dividing by 1/scale keeps values
+        # like 2301 * 0.1 printing as 230.1 (no divisor for strings)
+        targets = []
+        for field in self.fields:
+            index = FIELD_INDEX.get(field.name)
+            if field.width <= 2 and index is None and group != IDENTITY_GROUP:
+                raise ValueError(f"Registre {field.address}: champ {field.name} inconnu de ReadingRecord")
+            targets.append((field.name, index, 1 / field.scale if field.width <= 2 else None))
+        self.targets = tuple(targets)
+
+    def decode(self, raw, values: List[Optional[float]]):
+        """
+        Decode the block's numeric fields into a ReadingRecord's values
+
+        Args:
+            raw: Response registers as big-endian bytes (bytes, bytearray or
+                memoryview, read in place)
+            values: ReadingRecord.values (values of repeated targets are summed)
+        """
+        for (_, index, divisor), value in zip(self.targets, self.layout.unpack_from(raw)):
+            if divisor is None:
+                continue
+            current = values[index]
+            values[index] = value / divisor if current is None else current + value / divisor
+
+    def decode_fields(self, raw) -> Dict[str, Any]:
+        """Decode every field by name (identity block: serial number, module code...)"""
+        data: Dict[str, Any] = {}
+        for (name, _, divisor), value in zip(self.targets, self.layout.unpack_from(raw)):
+            if divisor is None:
+                data[name] = value.decode('ascii', errors='ignore').strip('\x00 ')
+            else:
+                data[name] = data.get(name, 0) + value / divisor
+        return data
+
+    def __repr__(self):
+        return f"ReadBlock({self.group}, {self.table}, {self.address}-{self.address + self.count - 1})"
+
+
+def plan_reads(fields: Sequence[RegisterField], max_count: int = MAX_REGISTERS_PER_READ) -> List[ReadBlock]:
+    """
+    Merge fields into the minimum number of read transactions
+
+    Fields are merged per (group, table), so a missing optional block
+    never fails a required one. Within a group, sorted fields are added
+    greedily to the current block while its span stays within max_count,
+    which is optimal for interval covering.
+
+    Args:
+        fields: Register fields to read
+        max_count: Maximum registers per transaction
+
+    Returns:
+        Read blocks, required group first
+    """
+    by_group: Dict[Tuple[str, str], List[RegisterField]] = {}
+    for field in fields:
+        by_group.setdefault((field.group, field.table), []).append(field)
+
+    blocks = []
+    for (group, table), group_fields in sorted(by_group.items(), key=lambda item: item[0][0] != REQUIRED_GROUP):
+        current: List[RegisterField] = []
+        start = 0
+        for field in sorted(group_fields, key=lambda f: f.address):
+            end = field.address + field.width
+            if current and end - start > max_count:
+                blocks.append(ReadBlock(group, table, current))
+                current = []
+            if not current:
+                start = field.address
+            current.append(field)
+        if current:
+            blocks.append(ReadBlock(group, table, current))
+
+    return blocks
@@ -0,0 +1,301 @@
+"""
+Import Home Assistant Long-Term Statistics
+Récupère les statistiques horaires long terme de Home Assistant (WebSocket)
+et les importe dans les agrégats horaires MongoDB (readings_hourly)
+
+Home Assistant keeps hourly statistics (mean/min/max for power sensors,
+sum/state for energy counters) long after the recorder purged the raw
+states, so years of history can be backfilled with a few thousand rows.
+
+Run as an import job (POST /api/home-assistant/import?statistics=true) or
+from the command line: python ha_statistics_import.py [days]
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import websockets
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from home_assistant_reader import AggregationPlan
+
+logger = logging.getLogger(__name__)
+
+# Statistics are requested chunk by chunk to keep WebSocket messages small
+DEFAULT_CHUNK_DAYS = 30
+
+# Reading fields stored in the hourly rollups (HA metric -> reading field)
+ROLLUP_FIELDS = {
+    "solar_power": "ac_power",
+    "load_power": "load_power",
+    "grid_power": "grid_power",
+    "battery_power": "battery_power",
+    "battery_soc": "battery_soc",
+    "battery_voltage": "battery_voltage",
+    "grid_voltage": "grid_voltage",
+    "grid_frequency": "grid_frequency",
+    "energy_today": "energy_today",
+    "energy_total": "energy_total",
+}
+
+
+def parse_statistic_time(value: Any) -> datetime:
+    """Parse a statistic start (epoch milliseconds on recent HA, ISO string on older versions)"""
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).astimezone(timezone.utc)
+
+
+def statistic_value(row: Dict[str, Any]) -> Optional[float]:
+    """Representative hourly value: mean for measurements, state for counters"""
+    for key in ("mean", "state", "sum"):
+        if row.get(key) is not None:
+            return float(row[key])
+    return None
+
+
+class HomeAssistantStatisticsClient:
+    """Minimal Home Assistant WebSocket API client for recorder statistics"""
+    
+    def __init__(self, url: str, token: str):
+        """
+        Initialize client
+        
+        Args:
+            url: Home Assistant URL (http:// or https://)
+            token: Long-Lived Access Token
+        """
+        base = url.rstrip('/')
+        if base.startswith('https://'):
+            self.ws_url = 'wss://' + base[len('https://'):] + '/api/websocket'
+        else:
+            self.ws_url = 'ws://' + base.replace('http://', '', 1) + '/api/websocket'
+        self.token = token
+        self.websocket = None
+        self.message_ids = itertools.count(1)
+    
+    async def connect(self):
+        """Open the WebSocket and authenticate"""
+        self.websocket = await websockets.connect(self.ws_url, max_size=None)
+        
+        message = json.loads(await self.websocket.recv())
+        if message.get("type") != "auth_required":
+            raise ConnectionError(f"Unexpected handshake message: {message.get('type')}")
+        
+        await self.websocket.send(json.dumps({"type": "auth", "access_token": self.token}))
+        message = json.loads(await self.websocket.recv())
+        if message.get("type") != "auth_ok":
+            raise ConnectionError(message.get("message", "Authentication failed"))
+    
+    async def close(self):
+        """Close the WebSocket"""
+        if self.websocket:
+            await self.websocket.close()
+            self.websocket = None
+    
+    async def statistics_during_period(
+        self,
+        statistic_ids: List[str],
+        start_time: datetime,
+        end_time: datetime,
+        period: str = "hour"
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Call recorder/statistics_during_period
+        
+        Args:
+            statistic_ids: Entity IDs
+            start_time: Start (UTC)
+            end_time: End (UTC)
+            period: Statistics period (5minute, hour, day, ...)
+        
+        Returns:
+            Entity ID -> list of statistic rows
+        """
+        message_id = next(self.message_ids)
+        await self.websocket.send(json.dumps({
+            "id": message_id,
+            "type": "recorder/statistics_during_period",
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "statistic_ids": statistic_ids,
+            "period": period,
+            "types": ["mean", "max", "sum", "state"]
+        }))
+        
+        while True:
+            message = json.loads(await self.websocket.recv())
+            if message.get("id") != message_id:
+                continue
+            if not message.get("success"):
+                error = message.get("error", {})
+                raise RuntimeError(f"Statistics request failed: {error.get('message', error)}")
+            return message.get("result") or {}
+
+
+def build_hourly_rollups(
+    plan: AggregationPlan,
+    statistics: Dict[str, List[Dict[str, Any]]],
+    inverter_id: str
+) -> List[Dict[str, Any]]:
+    """
+    Build one rollup document per hour from per-entity statistics
+    
+    Inverters are combined with the aggregation plan: the mean of a sum is
+    the sum of the means, so hourly site power stays exact. The hourly
+    maxima of the solar power give peak_ac_power, exact for one inverter
+    and an upper bound for several (their peaks need not coincide).
+    
+    Args:
+        plan: Compiled entity mapping
+        statistics: Entity ID -> statistic rows
+        inverter_id: Virtual inverter ID
+    
+    Returns:
+        Rollup documents sorted by hour
+    """
+    hours: Dict[datetime, Dict[str, Optional[float]]] = {}
+    peaks: Dict[datetime, Dict[str, float]] = {}
+    for entity_id, rows in statistics.items():
+        for row in rows:
+            hour = parse_statistic_time(row["start"])
+            hours.setdefault(hour, {})[entity_id] = statistic_value(row)
+            if row.get("max") is not None:
+                peaks.setdefault(hour, {})[entity_id] = float(row["max"])
+    
+    rollups = []
+    for hour in sorted(hours):
+        site = plan.aggregate(hours[hour])["site"]
+        doc = {
+            "inverter_id": inverter_id,
+            "hour": hour.isoformat(),
+            "source": "ha_statistics",
+        }
+        for metric, field in ROLLUP_FIELDS.items():
+            if metric in site:
+                doc[field] = site[metric]
+        if hour in peaks:
+            peak = plan.aggregate(peaks[hour])["site"].get("solar_power")
+            if peak is not None:
+                doc["peak_ac_power"] = peak
+        rollups.append(doc)
+    
+    return rollups
+
+
+async def ensure_rollup_index(db):
+    """Create the unique (inverter_id, hour) index on hourly rollups"""
+    await db.readings_hourly.create_index(
+        [("inverter_id", 1), ("hour", 1)],
+        unique=True,
+        name="inverter_hour_unique"
+    )
+
+
+async def import_statistics(
+    db,
+    url: str,
+    token: str,
+    days: int = 365,
+    chunk_days: int = DEFAULT_CHUNK_DAYS,
+    job=None
+) -> Dict[str, Any]:
+    """
+    Import Home Assistant hourly long-term statistics into readings_hourly
+    
+    Args:
+        db: Motor database
+        url: Home Assistant URL
+        token: Access token
+        days: Number of days to import
+        chunk_days: Days requested per WebSocket call
+        job: Import job (ha_sync.ImportJob) to report progress to, and
+            cancelled between chunks
+    
+    Returns:
+        Report with hour counts
+    """
+    ha_config = await db.home_assistant_config.find_one({}, {"_id": 0})
+    if not ha_config or not ha_config.get('entity_mapping'):
+        return {"status": "error", "message": "No entity mapping configured"}
+    
+    virtual_inv = await db.inverters.find_one({"name": "Home Assistant"})
+    if not virtual_inv:
+        return {"status": "error", "message": "Virtual inverter 'Home Assistant' not found"}
+    
+    plan = AggregationPlan(ha_config['entity_mapping'])
+    await ensure_rollup_index(db)
+    
+    end_time = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    start_time = end_time - timedelta(days=days)
+    report = {"status": "ok", "from": start_time.isoformat(), "chunks": 0, "hours_written": 0}
+    if job:
+        job.start(plan.entity_ids, math.ceil(days / chunk_days), report)
+    
+    client = HomeAssistantStatisticsClient(url, token)
+    await client.connect()
+    try:
+        chunk_start = start_time
+        while chunk_start < end_time:
+            if job and job.cancel_requested:
+                report["status"] = "cancelled"
+                break
+            chunk_end = min(chunk_start + timedelta(days=chunk_days), end_time)
+            statistics = await client.statistics_during_period(plan.entity_ids, chunk_start, chunk_end)
+            rollups = build_hourly_rollups(plan, statistics, virtual_inv['id'])
+            
+            if rollups:
+                operations = [
+                    UpdateOne(
+                        {"inverter_id": rollup["inverter_id"], "hour": rollup["hour"]},
+                        {"$set": rollup},
+                        upsert=True
+                    )
+                    for rollup in rollups
+                ]
+                await db.readings_hourly.bulk_write(operations, ordered=False)
+                report["hours_written"] += len(rollups)
+            
+            report["chunks"] += 1
+            if job:
+                job.record_window({entity_id: len(statistics.get(entity_id, [])) for entity_id in plan.entity_ids}, chunk_end)
+            logger.info(f"✅ Statistics {chunk_start.date()} → {chunk_end.date()}: {len(rollups)} hours")
+            chunk_start = chunk_end
+    finally:
+        await client.close()
+    
+    return report
+
+
+if __name__ == "__main__":
+    import sys
+    from motor.motor_asyncio import AsyncIOMotorClient
+    
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv(Path(__file__).parent / '.env')
+    
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    
+    async def main():
+        mongo_client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = mongo_client[os.environ['DB_NAME']]
+        report = await import_statistics(
+            db,
+            os.environ.get('HOME_ASSISTANT_URL', ''),
+            os.environ.get('HOME_ASSISTANT_TOKEN', ''),
+            days
+        )
+        print(report)
+        mongo_client.close()
+    
+    print(f"🚀 Starting Home Assistant long-term statistics import ({days} days)...")
+    asyncio.run(main())
+    print("✅ Done!")
@@ -0,0 +1,739 @@
+"""
+Home Assistant Sync Engine
+Synchronisation incrémentale de l'historique Home Assistant vers MongoDB
+
+A per-entity high-water mark is kept in MongoDB: each run only fetches the
+history newer than that mark, aligns it on a fixed time grid and writes the
+rows the live collector did not already store (restarts, outages).
+
+Explicit imports (backfill) do not use that mark, which the periodic sync
+keeps close to now: each entity has a backfill checkpoint holding the range
+already imported, and an import resumes from it only when that range
+contains the start of the requested one.
+"""
+
+import asyncio
+import bisect
+import codecs
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from pymongo import UpdateOne
+
+from ha_statistics_import import import_statistics
+from history_alignment import align_histories, parse_timestamp, DEFAULT_STEP_SECONDS
+from home_assistant_reader import AggregationPlan, HomeAssistantReader
+from readings_store import ensure_readings_index, insert_readings
+
+logger = logging.getLogger(__name__)
+
+# Number of entity histories fetched concurrently from Home Assistant
+DEFAULT_FETCH_WORKERS = 4
+
+# History is requested window by window so that no request covers too much data
+DEFAULT_WINDOW_HOURS = 24
+
+# Size of the chunks read from the streamed history response
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Aligned row chunks waiting for the writer (bounds memory while streaming)
+ROW_QUEUE_CHUNKS = 2
+
+# Background import jobs write smaller batches and pause after each one,
+# so the live collection loop keeps priority over the database
+JOB_BATCH_SIZE = 500
+JOB_THROTTLE_SECONDS = 0.1
+
+# Number of finished import jobs kept for the API
+MAX_KEPT_JOBS = 20
+
+
+def iter_history_states(chunks):
+    """
+    Parse a Home Assistant history response incrementally
+    
+    The response looks like [[{state}, {state}, ...]] (one inner list per
+    filtered entity). States are decoded one by one as chunks arrive, so the
+    whole document is never held in memory.
+    
+    Args:
+        chunks: Iterable of text chunks
+    
+    Yields:
+        State dictionaries of the first entity
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    depth = 0  # Opening brackets consumed before the first state
+    
+    for chunk in chunks:
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buffer):
+                break
+            
+            char = buffer[pos]
+            if char == ']':
+                # End of the entity list (or empty response)
+                return
+            if depth < 2:
+                if char != '[':
+                    raise ValueError(f"Unexpected history format near {buffer[pos:pos + 20]!r}")
+                depth += 1
+                pos += 1
+                continue
+            
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Incomplete state, wait for the next chunk
+                break
+            
+            yield item
+            pos = end
+
+
+def iter_response_text(response):
+    """Decode a streamed response body into UTF-8 text chunks"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for raw_chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+        yield decoder.decode(raw_chunk)
+    yield decoder.decode(b'', final=True)
+
+
+class HistoryStream:
+    """(timestamp, state) points of a streamed history response, parsed as they are iterated"""
+    
+    def __init__(self, entity_id: str, response):
+        self.entity_id = entity_id
+        self.response = response
+    
+    def __iter__(self) -> Iterator[Tuple[str, Any]]:
+        count = 0
+        try:
+            for item in iter_history_states(iter_response_text(self.response)):
+                # Handle different response formats
+                timestamp_key = item.get('last_updated') or item.get('timestamp') or item.get('last_changed')
+                if timestamp_key:
+                    count += 1
+                    yield timestamp_key, item.get('state')
+        finally:
+            self.response.close()
+        logger.debug(f"Retrieved {count} data points for {self.entity_id}")
+    
+    def close(self):
+        """Release the connection (stream not fully read)"""
+        self.response.close()
+
+
+def iter_windows(start_time: datetime, end_time: datetime, window: timedelta):
+    """Split [start_time, end_time) into consecutive windows"""
+    window_start = start_time
+    while window_start < end_time:
+        window_end = min(window_start + window, end_time)
+        yield window_start, window_end
+        window_start = window_end
+
+
+class ImportJob:
+    """History import running in the background, with progress and cancellation"""
+    
+    def __init__(
+        self,
+        days: int,
+        use_high_water_mark: bool = True,
+        fill_gaps_only: bool = False,
+        backfill: bool = True,
+        statistics: bool = False
+    ):
+        """
+        Initialize job
+        
+        Args:
+            days: Number of days to import
+            use_high_water_mark: Resume from the backfill checkpoints
+            fill_gaps_only: Skip rows already covered by collected readings
+            backfill: Import the whole range, regardless of the live sync mark
+            statistics: Import the hourly long-term statistics into
+                readings_hourly instead of the history (windows are then
+                the statistics chunks, rows the hours written)
+        """
+        self.id = str(uuid.uuid4())
+        self.days = days
+        self.use_high_water_mark = use_high_water_mark
+        self.fill_gaps_only = fill_gaps_only
+        self.backfill = backfill
+        self.statistics = statistics
+        self.status = "queued"  # queued, running, ok, partial, error, cancelled
+        self.created_at = datetime.now(timezone.utc).isoformat()
+        self.cancel_requested = False
+        self.report: Dict[str, Any] = {}
+        self.entities: Dict[str, Dict[str, Any]] = {}
+        self.windows_total = 0
+        self.started: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+    
+    def cancel(self):
+        """Request cancellation (effective at the next batch or window)"""
+        self.cancel_requested = True
+    
+    def start(self, entity_ids: List[str], windows_total: int, report: Dict[str, Any]):
+        """Mark the job as running"""
+        self.status = "running"
+        self.started = time.monotonic()
+        self.windows_total = windows_total
+        self.report = report
+        self.entities = {entity_id: {"points": 0, "synced_until": None} for entity_id in entity_ids}
+    
+    def record_window(self, fetched: Dict[str, int], window_end: datetime):
+        """Record the number of points fetched for each entity in a completed window"""
+        for entity_id, points in fetched.items():
+            self.entities[entity_id]["points"] += points
+            self.entities[entity_id]["synced_until"] = window_end.isoformat()
+    
+    def get_progress(self) -> Dict[str, Any]:
+        """Get job progress: rows/sec, ETA and per-entity progress"""
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        if self.statistics:
+            windows_done = self.report.get("chunks", 0)
+            rows = self.report.get("hours_written", 0)
+        else:
+            windows_done = self.report.get("windows", 0)
+            rows = self.report.get("rows_inserted", 0)
+        
+        eta_seconds = None
+        if self.status == "running" and windows_done > 0:
+            eta_seconds = round(elapsed / windows_done * (self.windows_total - windows_done), 1)
+        
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "days": self.days,
+            "statistics": self.statistics,
+            "created_at": self.created_at,
+            "cancel_requested": self.cancel_requested,
+            "windows_done": windows_done,
+            "windows_total": self.windows_total,
+            "percent": round(windows_done / self.windows_total * 100, 1) if self.windows_total else 0.0,
+            "rows_inserted": rows,
+            "rows_per_second": round(rows / elapsed, 1) if elapsed > 0 else 0.0,
+            "elapsed_seconds": round(elapsed, 1),
+            "eta_seconds": eta_seconds,
+            "entities": self.entities,
+            "report": self.report
+        }
+
+
+class HomeAssistantSync:
+    """Incremental sync of Home Assistant history into the readings collection"""
+    
+    def __init__(
+        self,
+        db,
+        url: str,
+        token: str,
+        fetch_workers: int = DEFAULT_FETCH_WORKERS,
+        window_hours: int = DEFAULT_WINDOW_HOURS,
+        step_seconds: int = DEFAULT_STEP_SECONDS,
+        batch_size: int = 1000
+    ):
+        """
+        Initialize sync engine
+        
+        Args:
+            db: Motor database
+            url: Home Assistant URL
+            token: Long-Lived Access Token
+            fetch_workers: Entity histories fetched concurrently
+            window_hours: Size of each history request window in hours
+            step_seconds: Resampling step of the imported readings in seconds
+            batch_size: Number of readings inserted at once
+        """
+        self.db = db
+        self.url = url.rstrip('/')
+        self.token = token
+        self.headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+        self.fetch_workers = fetch_workers
+        self.window_hours = window_hours
+        self.step_seconds = step_seconds
+        self.batch_size = batch_size
+        
+        # Used only for its reading mapping, no request goes through it
+        self.mapper = HomeAssistantReader(url, token)
+        
+        self.run_lock = asyncio.Lock()
+        self.reports = deque(maxlen=10)
+        self.jobs: Dict[str, ImportJob] = {}
+    
+    def fetch_history(self, entity_id: str, start_time: datetime, end_time: datetime) -> Optional['HistoryStream']:
+        """
+        Fetch history for an entity over a time window
+        
+        The request is sent now; the response is then streamed and parsed
+        incrementally as the returned stream is iterated.
+        
+        Args:
+            entity_id: Entity ID to fetch
+            start_time: Window start (UTC)
+            end_time: Window end (UTC)
+        
+        Returns:
+            Stream of (timestamp, state) tuples in chronological order,
+            or None if the request failed
+        """
+        url = f"{self.url}/api/history/period/{start_time.isoformat()}"
+        params = {
+            "filter_entity_id": entity_id,
+            "end_time": end_time.isoformat(),
+            "minimal_response": "true",
+            "no_attributes": "true"
+        }
+        
+        try:
+            response = requests.get(url, params=params, headers=self.headers, timeout=60, stream=True)
+        except Exception as e:
+            logger.error(f"Error fetching history for {entity_id}: {e}")
+            return None
+        
+        if response.status_code != 200:
+            logger.error(f"Failed to fetch history for {entity_id}: HTTP {response.status_code}")
+            response.close()
+            return None
+        
+        return HistoryStream(entity_id, response)
+    
+    def stream_aligned_rows(
+        self,
+        histories: Dict[str, HistoryStream],
+        window_start: datetime,
+        window_end: datetime,
+        batch_size: int,
+        rows: asyncio.Queue,
+        loop: asyncio.AbstractEventLoop,
+        stop: threading.Event,
+        counts: Dict[str, int]
+    ):
+        """
+        Align streamed histories and hand the rows to the writer (worker thread)
+        
+        Rows are put on the queue in chunks of batch_size; the bounded queue
+        makes reading the responses wait for the writer, so memory does not
+        grow with the window size. The last item is None, or the exception
+        that interrupted the stream.
+        """
+        def counted(entity_id, points):
+            for point in points:
+                counts[entity_id] += 1
+                yield point
+        
+        def put(item):
+            asyncio.run_coroutine_threadsafe(rows.put(item), loop).result()
+        
+        try:
+            chunk = []
+            streams = {entity_id: counted(entity_id, points) for entity_id, points in histories.items()}
+            for row in align_histories(streams, window_start, window_end, self.step_seconds):
+                chunk.append(row)
+                if len(chunk) >= batch_size:
+                    put(chunk)
+                    chunk = []
+                    if stop.is_set():
+                        break
+            else:
+                if chunk:
+                    put(chunk)
+            put(None)
+        except Exception as e:
+            put(e)
+        finally:
+            for points in histories.values():
+                points.close()
+    
+    async def load_high_water_marks(self, entity_ids: List[str]) -> Dict[str, datetime]:
+        """
+        Load the high-water mark of each entity
+        
+        Returns:
+            Entity ID -> end of the last synced window
+        """
+        marks = {}
+        async for doc in self.db.ha_import_checkpoints.find({"entity_id": {"$in": entity_ids}}, {"_id": 0}):
+            marks[doc['entity_id']] = datetime.fromisoformat(doc['last_window_end'])
+        return marks
+    
+    async def save_high_water_marks(self, entity_ids: List[str], window_end: datetime):
+        """Move the high-water mark of the given entities to window_end"""
+        now = datetime.now(timezone.utc).isoformat()
+        operations = [
+            UpdateOne(
+                {"entity_id": entity_id},
+                {"$set": {"last_window_end": window_end.isoformat(), "updated_at": now}},
+                upsert=True
+            )
+            for entity_id in entity_ids
+        ]
+        if operations:
+            await self.db.ha_import_checkpoints.bulk_write(operations, ordered=False)
+    
+    async def load_backfill_checkpoints(self, entity_ids: List[str]) -> Dict[str, Tuple[datetime, datetime]]:
+        """
+        Load the backfill checkpoint of each entity
+        
+        Returns:
+            Entity ID -> (start, end) of the range already imported
+        """
+        checkpoints = {}
+        async for doc in self.db.ha_backfill_checkpoints.find({"entity_id": {"$in": entity_ids}}, {"_id": 0}):
+            checkpoints[doc['entity_id']] = (
+                datetime.fromisoformat(doc['covered_from']),
+                datetime.fromisoformat(doc['covered_until'])
+            )
+        return checkpoints
+    
+    async def save_backfill_checkpoints(self, covered: Dict[str, Tuple[datetime, datetime]]):
+        """Store the range imported for each entity"""
+        now = datetime.now(timezone.utc).isoformat()
+        operations = [
+            UpdateOne(
+                {"entity_id": entity_id},
+                {"$set": {
+                    "covered_from": covered_from.isoformat(),
+                    "covered_until": covered_until.isoformat(),
+                    "updated_at": now
+                }},
+                upsert=True
+            )
+            for entity_id, (covered_from, covered_until) in covered.items()
+        ]
+        if operations:
+            await self.db.ha_backfill_checkpoints.bulk_write(operations, ordered=False)
+    
+    async def load_existing_timestamps(self, inverter_id: str, start_time: datetime, end_time: datetime) -> List[datetime]:
+        """Sorted timestamps of the readings already stored in a window"""
+        cursor = self.db.readings.find(
+            {
+                "inverter_id": inverter_id,
+                "timestamp": {"$gte": start_time.isoformat(), "$lt": end_time.isoformat()}
+            },
+            {"_id": 0, "timestamp": 1}
+        ).sort("timestamp", 1)
+        return [parse_timestamp(doc['timestamp']) async for doc in cursor]
+    
+    def is_covered(self, timestamp: datetime, existing: List[datetime]) -> bool:
+        """True if a stored reading lies within one grid step of timestamp"""
+        step = timedelta(seconds=self.step_seconds)
+        index = bisect.bisect_left(existing, timestamp - step)
+        return index < len(existing) and existing[index] <= timestamp + step
+    
+    async def run(
+        self,
+        days: int = 1,
+        start_time: Optional[datetime] = None,
+        use_high_water_mark: bool = True,
+        fill_gaps_only: bool = True,
+        backfill: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Run one sync
+        
+        Args:
+            days: How far back to go for entities without high-water mark
+            start_time: Explicit start (overrides days)
+            use_high_water_mark: Resume from the entities' high-water mark
+                (backfill checkpoint for backfills)
+            fill_gaps_only: Skip rows already covered by collected readings
+            backfill: Explicit import of the whole range: uses the backfill
+                checkpoints instead of the live sync high-water mark
+        
+        Returns:
+            Report with row counts and timings
+        """
+        if self.run_lock.locked():
+            return {"status": "already_running"}
+        
+        async with self.run_lock:
+            report = await self._run(days, start_time, use_high_water_mark, fill_gaps_only, backfill)
+        
+        self.reports.append(report)
+        return report
+    
+    def start_import_job(self, days: int, statistics: bool = False) -> ImportJob:
+        """
+        Start a full history import in the background
+        
+        Jobs run one at a time (they wait for any running sync) and are
+        throttled so that live collection keeps priority.
+        
+        Args:
+            days: Number of days to import
+            statistics: Import the hourly long-term statistics
+                (readings_hourly) instead of the history
+            
+        Returns:
+            The job, already scheduled
+        """
+        job = ImportJob(days, statistics=statistics)
+        self.jobs[job.id] = job
+        
+        # Forget the oldest finished jobs
+        finished = [job_id for job_id, kept in self.jobs.items() if kept.task and kept.task.done()]
+        for job_id in finished[:max(0, len(self.jobs) - MAX_KEPT_JOBS)]:
+            del self.jobs[job_id]
+        
+        job.task = asyncio.create_task(self._run_job(job))
+        return job
+    
+    async def _run_job(self, job: ImportJob):
+        try:
+            async with self.run_lock:
+                if job.cancel_requested:
+                    job.status = "cancelled"
+                    return
+                if job.statistics:
+                    report = await import_statistics(self.db, self.url, self.token, job.days, job=job)
+                else:
+                    report = await self._run(
+                        job.days, None, job.use_high_water_mark, job.fill_gaps_only, job.backfill, job
+                    )
+            job.report = report
+            job.status = report["status"]
+            self.reports.append(report)
+        except Exception as e:
+            logger.error(f"Error in import job {job.id}: {e}")
+            job.status = "error"
+            job.report["message"] = str(e)
+    
+    def get_job(self, job_id: str) -> Optional[ImportJob]:
+        """Get an import job by ID"""
+        return self.jobs.get(job_id)
+    
+    async def _run(self, days, start_time, use_high_water_mark, fill_gaps_only, backfill,
+                   job: Optional[ImportJob] = None) -> Dict[str, Any]:
+        started = time.monotonic()
+        end_time = datetime.now(timezone.utc)
+        report = {
+            "status": "ok",
+            "started_at": end_time.isoformat(),
+            "windows": 0,
+            "rows_fetched": 0,
+            "rows_inserted": 0,
+            "rows_duplicate": 0,
+            "rows_covered": 0,
+            "fetch_seconds": 0.0,
+            "write_seconds": 0.0,
+            "duration_seconds": 0.0
+        }
+        
+        def finish(status: str, message: Optional[str] = None) -> Dict[str, Any]:
+            report["status"] = status
+            if message:
+                report["message"] = message
+            report["duration_seconds"] = round(time.monotonic() - started, 2)
+            report["fetch_seconds"] = round(report["fetch_seconds"], 2)
+            report["write_seconds"] = round(report["write_seconds"], 2)
+            return report
+        
+        ha_config = await self.db.home_assistant_config.find_one({}, {"_id": 0})
+        if not ha_config or not ha_config.get('entity_mapping'):
+            return finish("error", "No entity mapping configured")
+        
+        virtual_inv = await self.db.inverters.find_one({"name": "Home Assistant"})
+        if not virtual_inv:
+            return finish("error", "Virtual inverter 'Home Assistant' not found")
+        inverter_id = virtual_inv['id']
+        
+        plan = AggregationPlan(ha_config['entity_mapping'])
+        entity_ids = plan.entity_ids
+        if not entity_ids:
+            return finish("error", "No entity configured in the mapping")
+        
+        # Duplicates are rejected by the unique index instead of one lookup per row
+        unique_index = await ensure_readings_index(self.db)
+        
+        range_start = start_time or end_time - timedelta(days=days)
+        sync_from = range_start
+        if backfill:
+            # Resume where a previous import covering range_start stopped;
+            # the imported range grows from its start
+            checkpoints = await self.load_backfill_checkpoints(entity_ids)
+            covered = {}
+            for entity_id in entity_ids:
+                checkpoint = checkpoints.get(entity_id)
+                if checkpoint and checkpoint[0] <= range_start <= checkpoint[1]:
+                    covered[entity_id] = checkpoint
+                else:
+                    covered[entity_id] = (range_start, range_start)
+            if use_high_water_mark:
+                sync_from = min(covered_until for _, covered_until in covered.values())
+        elif use_high_water_mark:
+            # Start from the oldest high-water mark, bounded by the requested range
+            marks = await self.load_high_water_marks(entity_ids)
+            sync_from = max(min(marks.get(entity_id, range_start) for entity_id in entity_ids), range_start)
+        report["from"] = sync_from.isoformat()
+        
+        windows = list(iter_windows(sync_from, end_time, timedelta(hours=self.window_hours)))
+        batch_size = self.batch_size
+        if job:
+            job.start(entity_ids, len(windows), report)
+            batch_size = min(batch_size, JOB_BATCH_SIZE)
+        
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=self.fetch_workers) as executor:
+            for window_start, window_end in windows:
+                if job and job.cancel_requested:
+                    return finish("cancelled", f"Cancelled before window {window_start.isoformat()}")
+                
+                # Open the window's history for all entities concurrently (requests is blocking)
+                fetch_started = time.monotonic()
+                results = await asyncio.gather(*[
+                    loop.run_in_executor(executor, self.fetch_history, entity_id, window_start, window_end)
+                    for entity_id in entity_ids
+                ])
+                report["fetch_seconds"] += time.monotonic() - fetch_started
+                
+                histories = {entity_id: points for entity_id, points in zip(entity_ids, results) if points is not None}
+                if len(histories) < len(entity_ids):
+                    for points in histories.values():
+                        points.close()
+                    # High-water mark stays on the last completed window
+                    return finish("partial", f"Window {window_start.isoformat()} failed")
+                
+                existing = await self.load_existing_timestamps(inverter_id, window_start, window_end) if fill_gaps_only else []
+                
+                # The responses are aligned in a worker thread as they stream in,
+                # and each chunk of rows is written as soon as it is complete
+                rows = asyncio.Queue(maxsize=ROW_QUEUE_CHUNKS)
+                stop = threading.Event()
+                counts = dict.fromkeys(entity_ids, 0)
+                producer = loop.run_in_executor(
+                    executor, self.stream_aligned_rows,
+                    histories, window_start, window_end, batch_size, rows, loop, stop, counts
+                )
+                failure = None
+                cancelled = False
+                try:
+                    while True:
+                        wait_started = time.monotonic()
+                        chunk = await rows.get()
+                        report["fetch_seconds"] += time.monotonic() - wait_started
+                        if chunk is None:
+                            break
+                        if isinstance(chunk, Exception):
+                            failure = chunk
+                            break
+                        
+                        write_started = time.monotonic()
+                        readings_to_insert = []
+                        for timestamp, values in chunk:
+                            report["rows_fetched"] += 1
+                            if existing and self.is_covered(timestamp, existing):
+                                report["rows_covered"] += 1
+                                continue
+                            
+                            reading = self.mapper.map_to_inverter_reading(plan.aggregate(values)['site'])
+                            reading['id'] = str(uuid.uuid4())
+                            reading['inverter_id'] = inverter_id
+                            reading['timestamp'] = timestamp.isoformat()
+                            reading['interval_seconds'] = self.step_seconds
+                            readings_to_insert.append(reading)
+                        
+                        if readings_to_insert:
+                            result = await insert_readings(self.db, readings_to_insert, unique_index)
+                            report["rows_inserted"] += result['inserted']
+                            report["rows_duplicate"] += result['duplicates']
+                        report["write_seconds"] += time.monotonic() - write_started
+                        
+                        if job:
+                            # Let the collector reach the database between batches
+                            await asyncio.sleep(JOB_THROTTLE_SECONDS)
+                            if job.cancel_requested:
+                                cancelled = True
+                                break
+                finally:
+                    stop.set()
+                    while not producer.done():
+                        # Unblock the worker if it waits on a full queue
+                        try:
+                            rows.get_nowait()
+                        except asyncio.QueueEmpty:
+                            await asyncio.sleep(0.01)
+                
+                # High-water mark stays on the last completed window; rows
+                # already written are skipped as duplicates by the next run
+                if failure is not None:
+                    logger.error(f"History stream of window {window_start.isoformat()} failed: {failure}")
+                    return finish("partial", f"Window {window_start.isoformat()} failed: {failure}")
+                if cancelled:
+                    return finish("cancelled", f"Cancelled during window {window_start.isoformat()}")
+                if job:
+                    job.record_window(counts, window_end)
+                
+                if backfill:
+                    await self.save_backfill_checkpoints({
+                        entity_id: (covered_from, max(covered_until, window_end))
+                        for entity_id, (covered_from, covered_until) in covered.items()
+                    })
+                else:
+                    await self.save_high_water_marks(entity_ids, window_end)
+                report["windows"] += 1
+        
+        finish("ok")
+        logger.info(
+            f"🔄 Home Assistant sync: {report['rows_inserted']} rows inserted, "
+            f"{report['rows_covered']} already collected, {report['windows']} window(s) "
+            f"in {report['duration_seconds']}s (fetch {report['fetch_seconds']}s, write {report['write_seconds']}s)"
+        )
+        return report
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get sync state, the reports of the last runs and the import jobs"""
+        return {
+            "running": self.run_lock.locked(),
+            "reports": list(self.reports),
+            "jobs": [
+                {"job_id": job.id, "status": job.status, "days": job.days, "created_at": job.created_at}
+                for job in self.jobs.values()
+            ]
+        }
+
+
+# Global instance (will be initialized when Home Assistant is configured)
+ha_sync: Optional[HomeAssistantSync] = None
+
+
+def initialize_ha_sync(db, url: str, token: str, **kwargs) -> HomeAssistantSync:
+    """
+    Initialize the global Home Assistant sync engine
+    
+    Args:
+        db: Motor database
+        url: Home Assistant URL
+        token: Access token
+    
+    Returns:
+        The sync engine
+    """
+    global ha_sync
+    ha_sync = HomeAssistantSync(db, url, token, **kwargs)
+    return ha_sync
+
+
+def get_ha_sync() -> Optional[HomeAssistantSync]:
+    """Get the global Home Assistant sync engine"""
+    return ha_sync
@@ -0,0 +1,89 @@
+"""
+History Alignment
+Alignement des historiques Home Assistant de plusieurs entités sur une grille de temps fixe
+"""
+
+import heapq
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+# Default resampling step of the aligned rows (seconds)
+DEFAULT_STEP_SECONDS = 10
+
+
+def parse_timestamp(ts_str: str) -> datetime:
+    """Parse a Home Assistant timestamp (ISO 8601, possibly ending with Z)"""
+    timestamp = datetime.fromisoformat(ts_str.replace('Z', '+00:00'))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+def parse_state(state: Any) -> Optional[float]:
+    """Convert a state to float, None for unknown/unavailable/non-numeric states"""
+    if state in ["unknown", "unavailable", None]:
+        return None
+    try:
+        return float(state)
+    except (ValueError, TypeError):
+        return None
+
+
+def _iter_events(key: str, points: Iterable[Tuple[str, Any]]) -> Iterator[Tuple[datetime, int, str, Optional[float]]]:
+    """Turn one entity history into (timestamp, sequence, key, value) events"""
+    # The sequence number keeps equal timestamps of one entity in order
+    for sequence, (ts_str, state) in enumerate(points):
+        yield parse_timestamp(ts_str), sequence, key, parse_state(state)
+
+
+def align_histories(
+    histories: Dict[str, Iterable[Tuple[str, Any]]],
+    start_time: datetime,
+    end_time: datetime,
+    step_seconds: int = DEFAULT_STEP_SECONDS
+) -> Iterator[Tuple[datetime, Dict[str, float]]]:
+    """
+    Align several time-sorted histories on a fixed time grid
+    
+    The histories are k-way merged in a single linear pass and consumed
+    lazily, so they can be streamed responses. Each entity keeps
+    its last known value until its next state change (forward fill), so an
+    entity that did not change exactly at a grid instant still contributes
+    its real value instead of 0. A non-numeric state (unavailable, ...)
+    clears the value until the next numeric one.
+    
+    Args:
+        histories: Key (entity ID) -> (timestamp, state) iterable, sorted by time
+        start_time: Start of the grid (UTC)
+        end_time: End of the grid, exclusive (UTC)
+        step_seconds: Grid step in seconds
+        
+    Yields:
+        (grid timestamp, {key: value}) for every grid instant where at least
+        one value is known
+    """
+    step = timedelta(seconds=step_seconds)
+    
+    # First grid instant: start_time rounded up to a multiple of the step
+    first_grid = math.ceil(start_time.timestamp() / step_seconds) * step_seconds
+    grid_time = datetime.fromtimestamp(first_grid, tz=timezone.utc)
+    
+    events = heapq.merge(*[_iter_events(key, points) for key, points in histories.items()])
+    current: Dict[str, float] = {}
+    next_event = next(events, None)
+    
+    while grid_time < end_time:
+        # Apply every state change that happened up to this grid instant
+        while next_event is not None and next_event[0] <= grid_time:
+            _, _, key, value = next_event
+            if value is None:
+                current.pop(key, None)
+            else:
+                current[key] = value
+            next_event = next(events, None)
+        
+        if current:
+            yield grid_time, dict(current)
+        
+        grid_time += step
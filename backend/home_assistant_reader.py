@@ -3,13 +3,212 @@ Home Assistant Reader Module
 Connects to Home Assistant API to read solar data from Solar Assistant or other integrations
 """
 
+import re
+import time
 import requests
 import logging
-from typing import Dict, List, Optional, Any
-from datetime import datetime
+from collections import deque
+from threading import Lock
+from typing import Dict, List, Optional, Any, Tuple
+from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
+# Metrics summed across inverters to build the site total
+SUM_METRICS = {
+    "solar_power", "battery_power", "battery_current", "grid_power",
+    "load_power", "energy_today", "energy_total"
+}
+
+# Metrics averaged across inverters (shared battery bank, shared grid)
+AVERAGE_METRICS = {
+    "battery_soc", "battery_voltage", "grid_voltage", "grid_frequency"
+}
+
+# Any other metric (temperature, ...) stays per-inverter and is not aggregated
+
+# Entity mapping keys may carry an inverter suffix: solar_power_inv2, load_power_inv3...
+# Keys without suffix belong to inverter 1
+INVERTER_SUFFIX_PATTERN = re.compile(r"^(?P<metric>.+?)_inv(?P<index>\d+)$")
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker protecting the Home Assistant API
+    
+    - closed: requests go through, consecutive failures are counted
+    - open: requests are refused immediately until the backoff delay expires
+    - half_open: a single probe request is allowed; success closes the
+      breaker, failure re-opens it with a doubled backoff delay
+    """
+    
+    def __init__(self, failure_threshold: int = 3, base_backoff: float = 5.0, max_backoff: float = 300.0):
+        """
+        Initialize circuit breaker
+        
+        Args:
+            failure_threshold: Consecutive failures before opening
+            base_backoff: First backoff delay in seconds
+            max_backoff: Maximum backoff delay in seconds
+        """
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.open_count = 0  # Consecutive openings, drives the exponential backoff
+        self.open_until = 0.0
+        self.probe_in_flight = False
+        self.transitions = deque(maxlen=20)
+        self.lock = Lock()
+    
+    def _transition(self, new_state: str, reason: str):
+        """Record a state transition (caller holds the lock)"""
+        if new_state == self.state:
+            return
+        self.transitions.append({
+            "from": self.state,
+            "to": new_state,
+            "reason": reason,
+            "at": datetime.now(timezone.utc).isoformat()
+        })
+        logger.warning(f"🔌 Home Assistant circuit breaker: {self.state} → {new_state} ({reason})")
+        self.state = new_state
+    
+    def allow_request(self) -> bool:
+        """Check whether a request may be sent to Home Assistant"""
+        with self.lock:
+            if self.state == "closed":
+                return True
+            
+            if self.state == "open":
+                if time.monotonic() < self.open_until:
+                    return False
+                self._transition("half_open", "backoff expired, probing")
+            
+            # half_open: only one probe at a time
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+            return True
+    
+    def record_success(self):
+        """Record a successful request"""
+        with self.lock:
+            self.consecutive_failures = 0
+            self.open_count = 0
+            self.probe_in_flight = False
+            self._transition("closed", "request succeeded")
+    
+    def record_failure(self, reason: str):
+        """Record a failed request"""
+        with self.lock:
+            self.consecutive_failures += 1
+            self.probe_in_flight = False
+            
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                self.open_count += 1
+                backoff = min(self.base_backoff * (2 ** (self.open_count - 1)), self.max_backoff)
+                self.open_until = time.monotonic() + backoff
+                self._transition("open", f"{reason} - retry in {backoff:.0f}s")
+    
+    def is_open(self) -> bool:
+        """True while requests are being refused"""
+        with self.lock:
+            return self.state == "open" and time.monotonic() < self.open_until
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get breaker state and recent transitions"""
+        with self.lock:
+            retry_in = max(0.0, self.open_until - time.monotonic()) if self.state == "open" else 0.0
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "retry_in_seconds": round(retry_in, 1),
+                "transitions": list(self.transitions)
+            }
+
+
+class AggregationPlan:
+    """
+    Entity mapping compiled into an aggregation plan
+    
+    Each entry tells which physical inverter an entity belongs to and how its
+    value contributes to the site total (sum, average or per-inverter only).
+    """
+    
+    def __init__(self, entity_mapping: Dict[str, str]):
+        """
+        Compile an entity mapping
+        
+        Args:
+            entity_mapping: Dictionary mapping data types to entity IDs
+        """
+        self.entries: List[Tuple[str, str, int, str]] = []  # (entity_id, metric, inverter, mode)
+        inverter_indexes = set()
+        
+        for data_type, entity_id in entity_mapping.items():
+            if not entity_id:
+                continue
+            
+            match = INVERTER_SUFFIX_PATTERN.match(data_type)
+            if match:
+                metric = match.group("metric")
+                inverter_index = int(match.group("index"))
+            else:
+                metric = data_type
+                inverter_index = 1
+            
+            if metric in SUM_METRICS:
+                mode = "sum"
+            elif metric in AVERAGE_METRICS:
+                mode = "average"
+            else:
+                mode = "inverter"
+            
+            self.entries.append((entity_id, metric, inverter_index, mode))
+            inverter_indexes.add(inverter_index)
+        
+        self.inverter_indexes = sorted(inverter_indexes)
+        # Unique entities, so that an entity mapped twice is fetched only once
+        self.entity_ids = list(dict.fromkeys(entry[0] for entry in self.entries))
+    
+    def aggregate(self, values: Dict[str, Optional[float]]) -> Dict[str, Any]:
+        """
+        Build per-inverter readings and the site total in a single pass
+        
+        Args:
+            values: Entity ID -> numeric state (None when unknown/unavailable)
+            
+        Returns:
+            {"site": {...}, "inverters": {1: {...}, 2: {...}}}
+        """
+        site: Dict[str, float] = {}
+        inverters: Dict[int, Dict[str, float]] = {index: {} for index in self.inverter_indexes}
+        average_counts: Dict[str, int] = {}
+        
+        for entity_id, metric, inverter_index, mode in self.entries:
+            value = values.get(entity_id)
+            inverters[inverter_index][metric] = value if value is not None else 0.0
+            
+            if mode == "sum":
+                site[metric] = site.get(metric, 0.0) + (value or 0.0)
+            elif mode == "average" and value is not None:
+                # Unavailable entities must not drag the average down
+                site[metric] = site.get(metric, 0.0) + value
+                average_counts[metric] = average_counts.get(metric, 0) + 1
+        
+        for metric, count in average_counts.items():
+            site[metric] /= count
+        
+        # Averaged metrics with no available value at all fall back to 0.0
+        for _, metric, _, mode in self.entries:
+            if mode == "average" and metric not in site:
+                site[metric] = 0.0
+        
+        return {"site": site, "inverters": inverters}
+
 
 class HomeAssistantReader:
     """Reader for Home Assistant API"""
@@ -28,6 +227,13 @@ class HomeAssistantReader:
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/json"
         }
+        
+        # Protects collection cycles from stalling when Home Assistant is down
+        self.breaker = CircuitBreaker()
+        
+        # Compiled aggregation plan, rebuilt only when the entity mapping changes
+        self._plan: Optional[AggregationPlan] = None
+        self._plan_key: Optional[Tuple] = None
     
     def test_connection(self) -> Dict[str, Any]:
         """
@@ -161,82 +367,125 @@ class HomeAssistantReader:
         Returns:
             Entity state data or None
         """
+        if not self.breaker.allow_request():
+            return None
+        
         try:
             response = requests.get(
                 f"{self.url}/api/states/{entity_id}",
                 headers=self.headers,
                 timeout=5
             )
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return None
-                
         except Exception as e:
             logger.error(f"Error getting entity {entity_id}: {e}")
+            self.breaker.record_failure(type(e).__name__)
+            return None
+        
+        if response.status_code >= 500:
+            self.breaker.record_failure(f"HTTP {response.status_code}")
+            return None
+        
+        # Home Assistant answered: a missing entity is not an outage
+        self.breaker.record_success()
+        
+        if response.status_code == 200:
+            return response.json()
+        else:
             return None
     
-    def read_solar_data(self, entity_mapping: Dict[str, str]) -> Dict[str, Any]:
+    def get_aggregation_plan(self, entity_mapping: Dict[str, str]) -> AggregationPlan:
         """
-        Read solar data from configured entities
-        Supports multiple inverters by summing values with _inv1 and _inv2 suffixes
+        Get the compiled aggregation plan for an entity mapping (cached)
+        
+        Args:
+            entity_mapping: Dictionary mapping data types to entity IDs
+            
+        Returns:
+            AggregationPlan for this mapping
+        """
+        plan_key = tuple(sorted(entity_mapping.items()))
+        if self._plan is None or self._plan_key != plan_key:
+            self._plan = AggregationPlan(entity_mapping)
+            self._plan_key = plan_key
+            logger.info(
+                f"📐 Aggregation plan compiled: {len(self._plan.entity_ids)} entities, "
+                f"{len(self._plan.inverter_indexes)} inverter(s)"
+            )
+        return self._plan
+    
+    def get_entity_value(self, entity_id: str) -> Optional[float]:
+        """
+        Get the numeric state of an entity
+        
+        Args:
+            entity_id: Entity ID
+            
+        Returns:
+            Float value, or None if unknown/unavailable/not numeric
+        """
+        entity_state = self.get_entity_state(entity_id)
+        if not entity_state:
+            return None
+        
+        state_value = entity_state.get("state")
+        if state_value in ["unknown", "unavailable", None]:
+            return None
+        
+        try:
+            return float(state_value)
+        except (ValueError, TypeError):
+            return None
+    
+    def read_site_data(self, entity_mapping: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Read solar data for every physical inverter and the site total
+        
+        Entity mapping keys without suffix belong to inverter 1, keys suffixed
+        with _inv2, _inv3, ... belong to the matching inverter.
         
         Args:
             entity_mapping: Dictionary mapping data types to entity IDs
                 Example:
                 {
                     "solar_power": "sensor.solar_assistant_pv_power",
-                    "solar_power_inv2": "sensor.inverter_2_pv_power",  # Optional second inverter
+                    "solar_power_inv2": "sensor.inverter_2_pv_power",
+                    "solar_power_inv3": "sensor.inverter_3_pv_power",
                     "battery_soc": "sensor.solar_assistant_battery_soc",
                     ...
                 }
         
         Returns:
-            Dictionary with solar data (aggregated for multiple inverters)
+            {"site": {...}, "inverters": {1: {...}, 2: {...}, ...}},
+            or None when Home Assistant is unavailable (circuit breaker open)
         """
-        data = {}
+        plan = self.get_aggregation_plan(entity_mapping)
         
-        # First pass: collect all values
-        raw_data = {}
-        for data_type, entity_id in entity_mapping.items():
-            if entity_id:
-                entity_state = self.get_entity_state(entity_id)
-                if entity_state:
-                    try:
-                        state_value = entity_state.get("state")
-                        
-                        # Convert to float, handle 'unknown' or 'unavailable'
-                        if state_value in ["unknown", "unavailable", None]:
-                            raw_data[data_type] = 0.0
-                        else:
-                            raw_data[data_type] = float(state_value)
-                    except (ValueError, TypeError):
-                        raw_data[data_type] = 0.0
-                else:
-                    raw_data[data_type] = 0.0
-        
-        # Second pass: aggregate multiple inverters
-        # For metrics with _inv2 suffix, add them to the base metric
-        aggregated_keys = set()
-        
-        for key, value in raw_data.items():
-            if key.endswith('_inv2'):
-                # This is inverter 2, add to base metric
-                base_key = key[:-5]  # Remove '_inv2'
-                if base_key in raw_data:
-                    data[base_key] = raw_data[base_key] + value
-                    aggregated_keys.add(base_key)
-                    aggregated_keys.add(key)
-                else:
-                    # No inv1, use inv2 value as base
-                    data[base_key] = value
-                    aggregated_keys.add(key)
-            elif key not in aggregated_keys:
-                # Regular metric or already aggregated
-                data[key] = value
-        
-        return data
+        values = {}
+        for entity_id in plan.entity_ids:
+            if self.breaker.is_open():
+                # Stop the cycle instead of waiting for every timeout
+                return None
+            values[entity_id] = self.get_entity_value(entity_id)
+        
+        if self.breaker.is_open():
+            return None
+        
+        return plan.aggregate(values)
+    
+    def read_solar_data(self, entity_mapping: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Read solar data from configured entities
+        Supports multiple inverters (_inv2, _inv3, ... suffixes), see read_site_data
+        
+        Args:
+            entity_mapping: Dictionary mapping data types to entity IDs
+        
+        Returns:
+            Dictionary with solar data (aggregated for multiple inverters),
+            empty when Home Assistant is unavailable
+        """
+        site_data = self.read_site_data(entity_mapping)
+        return site_data["site"] if site_data else {}
     
     def map_to_inverter_reading(self, solar_data: Dict[str, Any], battery_capacity_kwh: float = 27.2) -> Dict[str, Any]:
         """
@@ -289,6 +538,25 @@ class HomeAssistantReader:
         }
         
         return reading
+    
+    def map_inverter_breakdown(self, inverters: Dict[int, Dict[str, float]]) -> List[Dict[str, Any]]:
+        """
+        Map per-inverter data to the breakdown stored alongside the site reading
+        
+        Args:
+            inverters: Per-inverter data from read_site_data
+            
+        Returns:
+            List of per-inverter dictionaries using InverterReading field names
+        """
+        breakdown = []
+        for index, values in sorted(inverters.items()):
+            entry = {"index": index}
+            for metric, value in values.items():
+                # solar_power is stored as ac_power, like in the site reading
+                entry["ac_power" if metric == "solar_power" else metric] = value
+            breakdown.append(entry)
+        return breakdown
 
 
 # Global instance (will be initialized when configured)
@@ -1,13 +1,18 @@
 """
 Service de détection automatique des onduleurs GROWATT et MPPSOLAR
+
+Ports already opened by the reader are not probed with a second
+connection (two sessions on one port interleave their frames): an
+MPPSOLAR port is queried through the reader's session, whose lock
+serializes the scan with the polls, and a GROWATT bus is skipped.
 """
 import serial
 import serial.tools.list_ports
 from pymodbus.client import ModbusSerialClient
 import logging
-import time
-import crcmod
-import struct
+from inverter_reader import reader
+from mppsolar_protocol import COMMAND_FRAMES
+from mppsolar_session import MPPSolarSession
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +34,18 @@ class InverterScanner:
         for port in ports:
             logger.info(f"  Testing port: {port.device}")
             
+            # Port déjà ouvert par le lecteur: pas de seconde connexion
+            session = reader.mppsolar_connections.get(port.device)
+            if session is not None:
+                mppsolar_result = self.test_mppsolar(port.device, session)
+                if mppsolar_result:
+                    self.discovered_inverters.append(mppsolar_result)
+                    logger.info(f"  ✅ MPPSOLAR détecté sur {port.device} (session du lecteur)")
+                continue
+            if port.device in reader.growatt_driver.buses:
+                logger.info(f"  ⏭️  {port.device} déjà utilisé par un onduleur GROWATT, ignoré")
+                continue
+            
             # Test GROWATT (Modbus RTU)
             growatt_result = self.test_growatt(port.device)
             if growatt_result:
@@ -134,118 +151,75 @@ class InverterScanner:
         
         return info
     
-    def test_mppsolar(self, port):
+    def test_mppsolar(self, port, session=None):
         """
         Test de communication série avec onduleur MPPSOLAR
         Utilise la commande QID pour identifier l'onduleur
+        
+        Args:
+            port: Serial port
+            session: Open session of the reader on this port (borrowed, left open)
         """
+        borrowed = session is not None
+        if not borrowed:
+            # Configuration série pour MPPSOLAR (réponses lues trame par trame, CRC vérifié)
+            session = MPPSolarSession(port, baudrate=2400, timeout=2)
+        
         try:
-            # Configuration série pour MPPSOLAR
-            ser = serial.Serial(
-                port=port,
-                baudrate=2400,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                bytesize=serial.EIGHTBITS,
-                timeout=2
-            )
-            
-            time.sleep(0.5)  # Attendre stabilisation
-            
-            # Commande QID: Query serial number
-            command = b'QID'
-            crc = self._calculate_crc(command)
-            full_command = command + crc + b'\r'
-            
-            ser.write(full_command)
-            time.sleep(0.5)
-            
-            response = ser.read(100)
-            ser.close()
-            
-            if response and len(response) > 5:
-                # Réponse valide de MPPSOLAR
-                # Format: (XXXXXXXXXX<CRC>\r
-                response_str = response.decode('ascii', errors='ignore').strip()
+            # Commande QID: Query serial number (trame précalculée)
+            # Format: (XXXXXXXXXX<CRC>\r
+            response = session.query(COMMAND_FRAMES['QID'])
+            serial_number = response[1:].decode('ascii', errors='ignore').strip()
+            
+            if serial_number and serial_number != 'NAK':
+                # Lire plus d'infos avec QPIGS
+                model_info = self._read_mppsolar_info(session)
                 
-                if response_str.startswith('(') and len(response_str) > 5:
-                    # Extraire le numéro de série
-                    serial_number = response_str[1:].split('\r')[0].strip()
-                    
-                    # Lire plus d'infos avec QPIGS
-                    model_info = self._read_mppsolar_info(port)
-                    
-                    return {
-                        'brand': 'MPPSOLAR',
-                        'port': port,
-                        'connection_type': 'USB',
-                        'baudrate': 2400,
-                        'slave_id': None,
-                        'name': f"MPPSOLAR {model_info.get('model', 'PIP')} (Auto-détecté)",
-                        'battery_capacity': model_info.get('battery_capacity', 0),
-                        'model': model_info.get('model', 'PIP'),
-                        'serial': serial_number
-                    }
+                return {
+                    'brand': 'MPPSOLAR',
+                    'port': port,
+                    'connection_type': 'USB',
+                    'baudrate': 2400,
+                    'slave_id': None,
+                    'name': f"MPPSOLAR {model_info.get('model', 'PIP')} (Auto-détecté)",
+                    'battery_capacity': model_info.get('battery_capacity', 0),
+                    'model': model_info.get('model', 'PIP'),
+                    'serial': serial_number
+                }
             
         except Exception as e:
             logger.debug(f"Error testing MPPSOLAR on {port}: {e}")
+        finally:
+            if not borrowed:
+                session.close()
         
         return None
     
-    def _read_mppsolar_info(self, port):
+    def _read_mppsolar_info(self, session):
         """Lire les informations détaillées de l'onduleur MPPSOLAR"""
         info = {'model': 'PIP'}
         
         try:
-            ser = serial.Serial(
-                port=port,
-                baudrate=2400,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                bytesize=serial.EIGHTBITS,
-                timeout=2
-            )
-            
-            time.sleep(0.5)
-            
-            # Commande QPIGS: Query status
-            command = b'QPIGS'
-            crc = self._calculate_crc(command)
-            full_command = command + crc + b'\r'
-            
-            ser.write(full_command)
-            time.sleep(0.5)
-            
-            response = ser.read(200)
-            ser.close()
-            
-            if response and len(response) > 10:
-                # Parser la réponse QPIGS pour extraire des infos
-                # Format complexe avec beaucoup de valeurs séparées par espaces
-                response_str = response.decode('ascii', errors='ignore').strip()
-                
-                if response_str.startswith('('):
-                    parts = response_str[1:].split()
-                    if len(parts) > 20:
-                        # Batterie voltage est souvent à l'index 12-13
-                        try:
-                            battery_voltage = float(parts[12])
-                            # Estimation capacité basée sur voltage (48V system ~ 10kWh typical)
-                            if battery_voltage > 40:
-                                info['battery_capacity'] = 10.0  # Estimation
-                        except:
-                            pass
+            # Commande QPIGS: Query status (trame précalculée)
+            response = session.query(COMMAND_FRAMES['QPIGS'])
+            
+            # Parser la réponse QPIGS pour extraire des infos
+            # Format complexe avec beaucoup de valeurs séparées par espaces
+            parts = response[1:].decode('ascii', errors='ignore').split()
+            if len(parts) > 20:
+                # Batterie voltage est souvent à l'index 12-13
+                try:
+                    battery_voltage = float(parts[12])
+                    # Estimation capacité basée sur voltage (48V system ~ 10kWh typical)
+                    if battery_voltage > 40:
+                        info['battery_capacity'] = 10.0  # Estimation
+                except:
+                    pass
             
         except Exception as e:
             logger.debug(f"Error reading MPPSOLAR info: {e}")
         
         return info
-    
-    def _calculate_crc(self, data):
-        """Calcule le CRC16 pour commandes MPPSOLAR"""
-        crc16 = crcmod.predefined.mkCrcFun('xmodem')
-        crc = crc16(data)
-        return struct.pack('>H', crc)
 
 
 # Instance globale du scanner
@@ -0,0 +1,316 @@
+"""
+Commandes MPPSOLAR (protocole PI30) et pipeline de lecture
+
+Each poll sends the due commands of MPPSOLAR_COMMANDS one after the other
+on the open session, then parses every answer in one pass into a
+ReadingRecord. Commands have a polling rate (every N polls): answers of
+commands not due this poll are taken from the previous ones, so counters
+polled once a minute are still in every reading.
+
+A command answered with NAK is not supported by the model and is never
+sent again to that inverter. Only QPIGS is required; the other commands
+only add data when the inverter has them. An optional command that gets
+no valid answer (timeout, CRC) has its previous answer left out of the
+readings and is retried with a backoff (its rate, doubled after each
+failure up to MAX_RETRY_POLLS), so an inverter that ignores a command
+instead of answering NAK does not cost a timeout every poll. Its failures
+do not count towards the session reopen threshold.
+
+Rates can be overridden per inverter with the "command_rates" setting,
+e.g. {"QED": 60, "QPIGS2": 0} (0 disables a command).
+"""
+
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+from mppsolar_protocol import COMMAND_FRAMES, NAK, command_frame
+from reading_record import ReadingRecord
+
+logger = logging.getLogger(__name__)
+
+# Command whose answer every reading needs
+REQUIRED_COMMAND = "QPIGS"
+
+# Longest wait (polls) before retrying an optional command that failed
+MAX_RETRY_POLLS = 720
+
+# QMOD answer -> mode
+DEVICE_MODES = {
+    'P': 'power_on',
+    'S': 'standby',
+    'L': 'line',
+    'B': 'battery',
+    'F': 'fault',
+    'H': 'power_saving',
+    'D': 'shutdown',
+}
+
+# QPIWS bits (index in the answer) -> warning; bit 1 makes the others faults
+WARNING_BITS = {
+    1: 'inverter_fault',
+    2: 'bus_over',
+    3: 'bus_under',
+    4: 'bus_soft_fail',
+    5: 'line_fail',
+    6: 'opv_short',
+    7: 'inverter_voltage_too_low',
+    8: 'inverter_voltage_too_high',
+    9: 'over_temperature',
+    10: 'fan_locked',
+    11: 'battery_voltage_high',
+    12: 'battery_low_alarm',
+    14: 'battery_under_shutdown',
+    16: 'overload',
+    17: 'eeprom_fault',
+    18: 'inverter_over_current',
+    19: 'inverter_soft_fail',
+    20: 'self_test_fail',
+    21: 'op_dc_voltage_over',
+    22: 'battery_open',
+    23: 'current_sensor_fail',
+    24: 'battery_short',
+    25: 'power_limit',
+    26: 'pv_voltage_high',
+    27: 'mppt_overload_fault',
+    28: 'mppt_overload_warning',
+    29: 'battery_too_low_to_charge',
+}
+
+
+def _values(body: bytes) -> List[str]:
+    """Fields of an answer body (without the leading '(')"""
+    return body[1:].decode('ascii', errors='ignore').split()
+
+
+def parse_qpigs(body: bytes, record: ReadingRecord):
+    """
+    QPIGS: general status
+
+    Index: 0=Grid V, 1=Grid Freq, 2=AC Out V, 3=AC Out Freq, 4=AC Out VA,
+           5=AC Out W, 6=Load %, 7=Bus V, 8=Bat V, 9=Bat Charge A,
+           10=Bat Capacity %, 11=Temp, 12=PV A, 13=PV V, 14=Bat SCC V,
+           15=Bat Discharge A, 16=Device Status
+    """
+    values = _values(body)
+    if len(values) < 20:
+        raise ValueError(f"Pas assez de valeurs dans la réponse QPIGS: {len(values)}")
+
+    # Grid (réseau)
+    record['grid_voltage'] = float(values[0])  # V
+    record['grid_frequency'] = float(values[1])  # Hz
+
+    # AC Output (sortie onduleur vers maison)
+    ac_voltage = float(values[2])
+    load_power = float(values[5])  # W (puissance active)
+    record['ac_voltage'] = ac_voltage  # V
+    record['ac_current'] = load_power / ac_voltage if ac_voltage > 0 else 0.0  # A
+    record['ac_power'] = load_power
+    record['frequency'] = float(values[3])  # Hz
+
+    # PV1 (panneaux solaires)
+    pv_voltage, pv_current = float(values[13]), float(values[12])
+    record['dc_voltage'] = pv_voltage  # V
+    record['dc_current'] = pv_current  # A
+    record['dc_power'] = pv_voltage * pv_current  # W
+
+    # Battery (batterie)
+    battery_voltage = float(values[8])
+    battery_current = float(values[9]) - float(values[15])  # A (charge - décharge)
+    record['battery_voltage'] = battery_voltage  # V
+    record['battery_current'] = battery_current
+    record['battery_soc'] = float(values[10])  # %
+    record['battery_power'] = battery_voltage * battery_current  # W
+    record['battery_temperature'] = float(values[11])  # °C
+
+    # Température onduleur
+    record['temperature'] = float(values[11])  # °C
+
+
+def parse_qpigs2(body: bytes, record: ReadingRecord):
+    """
+    QPIGS2: second MPPT (0=PV2 A, 1=PV2 V, 2=PV2 charging W)
+
+    Stored in the pv2_* fields; dc_voltage and dc_current stay PV1's and
+    dc_power becomes the total PV input.
+    """
+    values = _values(body)
+    pv2_current, pv2_voltage = float(values[0]), float(values[1])
+    pv2_power = float(values[2]) if len(values) > 2 else pv2_voltage * pv2_current
+    record['pv2_voltage'] = pv2_voltage  # V
+    record['pv2_current'] = pv2_current  # A
+    record['pv2_power'] = pv2_power  # W
+    record['dc_power'] = record.get('dc_power', 0.0) + pv2_power
+
+
+def parse_qmod(body: bytes, record: ReadingRecord):
+    """QMOD: device mode (single letter)"""
+    code = body[1:2].decode('ascii', errors='ignore')
+    record.mode = DEVICE_MODES.get(code, code or None)
+
+
+def parse_qpiws(body: bytes, record: ReadingRecord):
+    """QPIWS: warning/fault bits"""
+    bits = body[1:].decode('ascii', errors='ignore').strip()
+    record.warnings = [name for index, name in WARNING_BITS.items() if index < len(bits) and bits[index] == '1']
+
+
+def parse_qet(body: bytes, record: ReadingRecord):
+    """QET: total PV energy (kWh)"""
+    record['energy_total'] = float(_values(body)[0])
+
+
+def parse_qed(body: bytes, record: ReadingRecord):
+    """QEDyyyymmdd: PV energy of the day (Wh)"""
+    record['energy_today'] = float(_values(body)[0]) / 1000  # kWh
+
+
+class MPPSolarCommand(NamedTuple):
+    """One command of the polling pipeline"""
+    name: str
+    parser: Callable[[bytes, ReadingRecord], None]
+    every: int = 1                     # Sent every N polls
+    dated: bool = False                # Command takes today's date (yyyymmdd)
+
+
+# Parse order matters: QPIGS2 adds to QPIGS dc_power
+MPPSOLAR_COMMANDS = (
+    MPPSolarCommand("QPIGS", parse_qpigs),
+    MPPSolarCommand("QPIGS2", parse_qpigs2),
+    MPPSolarCommand("QMOD", parse_qmod),
+    MPPSolarCommand("QPIWS", parse_qpiws, every=6),
+    MPPSolarCommand("QET", parse_qet, every=12),
+    MPPSolarCommand("QED", parse_qed, every=12, dated=True),
+)
+
+
+class MPPSolarDeviceState:
+    """Polling state of one MPPSOLAR inverter (port)"""
+
+    def __init__(self):
+        self.cycle = 0
+        # Commands answered with NAK
+        self.unsupported: Set[str] = set()
+        # Last answer body per command
+        self.answers: Dict[str, bytes] = {}
+        # Consecutive failures of optional commands: their answer is left out
+        # of the readings, and the poll at which they are sent again
+        self.failures: Dict[str, int] = {}
+        self.retry_cycle: Dict[str, int] = {}
+        # Frames of the dated commands for the current day
+        self.dated_frames: Dict[str, bytes] = {}
+
+    def frame(self, command: MPPSolarCommand) -> bytes:
+        """Command frame (dated commands for the current local day)"""
+        if not command.dated:
+            return COMMAND_FRAMES[command.name]
+        day = datetime.now().strftime('%Y%m%d')
+        key = f"{command.name}{day}"
+        frame = self.dated_frames.get(key)
+        if frame is None:
+            frame = command_frame(key)
+            self.dated_frames = {key: frame}
+            # A new day: yesterday's energy must not be reported
+            self.answers.pop(command.name, None)
+        return frame
+
+    def due_commands(self, rates: Optional[Dict[str, int]] = None) -> List[MPPSolarCommand]:
+        """Commands to send this poll"""
+        due = []
+        for command in MPPSOLAR_COMMANDS:
+            every = (rates or {}).get(command.name, command.every)
+            if command.name == REQUIRED_COMMAND:
+                every = 1
+            if not every or command.name in self.unsupported:
+                continue
+            retry_cycle = self.retry_cycle.get(command.name)
+            if retry_cycle is not None:
+                if self.cycle >= retry_cycle:
+                    due.append(command)
+            elif self.cycle % every == 0 or command.name not in self.answers:
+                due.append(command)
+        return due
+
+    def command_failed(self, command: MPPSolarCommand, rates: Optional[Dict[str, int]] = None) -> int:
+        """
+        Leave an optional command's answer out and schedule its retry
+
+        Returns:
+            Polls until the command is sent again
+        """
+        failures = self.failures.get(command.name, 0) + 1
+        self.failures[command.name] = failures
+        every = (rates or {}).get(command.name, command.every) or 1
+        delay = min(every * 2 ** min(failures, 10), MAX_RETRY_POLLS)
+        self.retry_cycle[command.name] = self.cycle + delay
+        return delay
+
+    def command_answered(self, command: MPPSolarCommand, body: bytes):
+        """Store a valid answer (clears the command's failures)"""
+        self.answers[command.name] = body
+        if command.name in self.failures:
+            del self.failures[command.name]
+            del self.retry_cycle[command.name]
+
+
+def poll_mppsolar(session, state: MPPSolarDeviceState, rates: Optional[Dict[str, int]] = None) -> ReadingRecord:
+    """
+    Send the due commands on an open session and build the reading
+
+    Args:
+        session: MPPSolarSession of the inverter's port
+        state: Polling state of the inverter
+        rates: Per-command rate overrides (polls between two sends, 0 = disabled)
+
+    Returns:
+        Reading with every supported command's data
+
+    Raises:
+        FrameError, serial.SerialException, OSError, ValueError: QPIGS failed
+    """
+    for command in state.due_commands(rates):
+        required = command.name == REQUIRED_COMMAND
+        try:
+            body = session.query(state.frame(command), count_errors=required)
+        except Exception as e:
+            if required:
+                raise
+            delay = state.command_failed(command, rates)
+            logger.debug(f"Pas de réponse {command.name} sur {session.port}: {e!r} (nouvel essai dans {delay} cycles)")
+            continue
+        if body.startswith(NAK):
+            if command.name == REQUIRED_COMMAND:
+                raise ValueError(f"{REQUIRED_COMMAND} refusée (NAK) sur {session.port}")
+            state.unsupported.add(command.name)
+            state.answers.pop(command.name, None)
+            state.failures.pop(command.name, None)
+            state.retry_cycle.pop(command.name, None)
+            logger.info(f"ℹ️ MPPSOLAR {session.port}: commande {command.name} non supportée, ignorée désormais")
+            continue
+        state.command_answered(command, body)
+    state.cycle += 1
+
+    # Parse every valid answer (fresh or from a previous poll) in one pass
+    record = ReadingRecord()
+    answers = state.answers
+    failures = state.failures
+    for command in MPPSOLAR_COMMANDS:
+        body = answers.get(command.name)
+        if body is None or command.name in failures:
+            continue
+        try:
+            command.parser(body, record)
+        except (ValueError, IndexError) as e:
+            if command.name == REQUIRED_COMMAND:
+                raise
+            logger.debug(f"Réponse {command.name} illisible: {body[:40]!r} ({e})")
+
+    # Grid power = Load - (PV + Battery)
+    # Positif = import, Négatif = export
+    record['grid_power'] = record['ac_power'] - (record.get('dc_power', 0.0) + record.get('battery_power', 0.0))
+
+    if record.mode == 'fault' or (record.warnings and 'inverter_fault' in record.warnings):
+        record.status = 'error'
+    elif record.warnings:
+        record.status = 'warning'
+    return record
@@ -0,0 +1,66 @@
+"""
+Protocole série MPPSOLAR (PI30): CRC et trames de commande
+
+Shared by the reader (mppsolar_session, mppsolar_commands) and the scanner.
+The CRC is computed by the standard library in C and the fixed command
+frames are precomputed immutable bytes, so a poll only writes ready frames
+and checks answers without a Python loop per byte.
+"""
+
+import binascii
+import struct
+from types import MappingProxyType
+from typing import Optional, Union
+
+
+def crc16(data: bytes) -> int:
+    """
+    CRC-16/XMODEM of data
+
+    binascii.crc_hqx is the CCITT polynomial, implemented in C; with an
+    initial value of 0 it is XMODEM.
+    """
+    return binascii.crc_hqx(data, 0)
+
+# The devices add one to CRC bytes equal to '(', '\r' or '\n' so these
+# never appear inside a frame: one translate instead of a loop per byte
+_CRC_ESCAPE = bytes.maketrans(b'\x28\x0d\x0a', b'\x29\x0e\x0b')
+_CRC_STRUCT = struct.Struct('>H')
+
+# Answer of a command the inverter does not know
+NAK = b'(NAK'
+
+# Commands sent without parameters
+FIXED_COMMANDS = ('QPIGS', 'QPIGS2', 'QMOD', 'QPIWS', 'QET', 'QID', 'QPI')
+
+
+def frame_crc(body: bytes) -> bytes:
+    """CRC bytes of a frame body, as sent on the wire"""
+    return _CRC_STRUCT.pack(binascii.crc_hqx(body, 0)).translate(_CRC_ESCAPE)
+
+
+def command_frame(command: Union[str, bytes]) -> bytes:
+    """Full command frame: command + CRC + \\r"""
+    if isinstance(command, str):
+        command = command.encode('ascii')
+    return command + frame_crc(command) + b'\r'
+
+
+def check_frame(frame: bytes) -> Optional[bytes]:
+    """
+    Verify an answer frame
+
+    Args:
+        frame: '(' ... CRC, without the \\r terminator
+
+    Returns:
+        Body without CRC (e.g., b'(230.0 50.0 ...'), None if the CRC is wrong
+    """
+    if len(frame) <= 3:
+        return None
+    body = frame[:-2]
+    return body if frame_crc(body) == frame[-2:] else None
+
+
+# Prebuilt frames of the fixed commands (read-only)
+COMMAND_FRAMES = MappingProxyType({name: command_frame(name) for name in FIXED_COMMANDS})
@@ -0,0 +1,251 @@
+"""
+Sessions série persistantes pour onduleurs MPPSOLAR
+
+The port stays open between polls: a poll costs only the protocol round
+trip instead of open + settle + close. Each query checks the port first
+(closed or unplugged device) and the session is reopened after an error.
+
+Answers are read by FrameReader: it returns as soon as the \r terminator
+arrives, checks the CRC16/XMODEM and resynchronises on the next '(' after
+garbage or a corrupt frame. CRCs and command frames come from
+mppsolar_protocol.
+"""
+
+import logging
+import threading
+import time
+from typing import Optional
+
+import serial
+
+from mppsolar_protocol import NAK, check_frame
+from transport_stats import CRC_ERROR, ERROR, EXCEPTION, TIMEOUT, TransportStats
+
+logger = logging.getLogger(__name__)
+
+# Longest expected answer (QPIGS is ~110 bytes)
+MAX_RESPONSE_SIZE = 256
+
+# Consecutive failed queries before the port is reopened
+MAX_CONSECUTIVE_ERRORS = 3
+
+# Serial read timeout while waiting for a frame: short, so the frame
+# deadline is checked while bytes trickle in
+FRAME_POLL_INTERVAL = 0.05
+
+# After a corrupt frame, how long to wait for a valid one (the answer may
+# follow line noise) before giving up
+CRC_RETRY_WINDOW = 0.3
+
+
+class FrameError(Exception):
+    """No valid answer frame"""
+
+
+class FrameTimeoutError(FrameError):
+    """No complete frame before the deadline"""
+
+
+class FrameCRCError(FrameError):
+    """Only frames with a wrong CRC were received"""
+
+
+class FrameReader:
+    """Reads '(' ... CRC '\\r' frames from a serial port"""
+
+    def __init__(self, port: serial.Serial):
+        self.serial = port
+        self.buffer = bytearray()
+        self.crc_errors = 0
+        self.garbage_bytes = 0
+        self.bytes_received = 0
+
+    def reset(self):
+        """Drop buffered bytes (before sending a new command)"""
+        self.buffer.clear()
+        self.serial.reset_input_buffer()
+
+    def _extract(self) -> Optional[bytes]:
+        """Take the next complete frame out of the buffer, if any"""
+        buffer = self.buffer
+        while True:
+            start = buffer.find(b'(')
+            if start < 0:
+                self.garbage_bytes += len(buffer)
+                buffer.clear()
+                return None
+            if start > 0:
+                # Resync: bytes before the frame start are noise
+                self.garbage_bytes += start
+                del buffer[:start]
+
+            end = buffer.find(b'\r')
+            if end < 0:
+                if len(buffer) > MAX_RESPONSE_SIZE:
+                    # Start marker without terminator: drop it and resync
+                    self.garbage_bytes += 1
+                    del buffer[:1]
+                    continue
+                return None  # Partial frame, wait for more bytes
+
+            frame = bytes(buffer[:end])
+            del buffer[:end + 1]
+            body = check_frame(frame)
+            if body is not None:
+                return body
+            self.crc_errors += 1
+            logger.debug(f"Trame MPPSOLAR rejetée (CRC): {frame[:40]!r}")
+
+    def read_frame(self, timeout: float) -> bytes:
+        """
+        Wait for the next valid frame
+
+        Args:
+            timeout: Deadline in seconds
+
+        Returns:
+            Frame body without CRC and terminator (e.g., b'(230.0 50.0 ...')
+
+        Raises:
+            FrameTimeoutError: Nothing valid before the deadline
+            FrameCRCError: Only corrupt frames before the deadline
+        """
+        deadline = time.monotonic() + timeout
+        crc_errors = self.crc_errors
+        while True:
+            frame = self._extract()
+            if frame is not None:
+                return frame
+            now = time.monotonic()
+            if self.crc_errors > crc_errors:
+                deadline = min(deadline, now + CRC_RETRY_WINDOW)
+            if now >= deadline:
+                if self.crc_errors > crc_errors:
+                    raise FrameCRCError(f"Trame corrompue sur {self.serial.port}")
+                raise FrameTimeoutError(f"Pas de réponse sur {self.serial.port} en {timeout:.1f}s")
+            chunk = self.serial.read(self.serial.in_waiting or 1)
+            if chunk:
+                self.buffer += chunk
+                self.bytes_received += len(chunk)
+
+
+class MPPSolarSession:
+    """Long-lived serial session on one MPPSOLAR port"""
+
+    def __init__(self, port: str, baudrate: int = 2400, timeout: float = 3.0):
+        """
+        Initialize session (the port is opened by the first query)
+
+        Args:
+            port: Serial port (e.g., /dev/ttyUSB0, /dev/hidraw0)
+            baudrate: Serial speed
+            timeout: Answer timeout in seconds
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.serial: Optional[serial.Serial] = None
+        self.reader: Optional[FrameReader] = None
+        self.lock = threading.Lock()
+        self.consecutive_errors = 0
+        self.opened_at: Optional[float] = None
+        self.stats = TransportStats()
+        self.connects = 0
+
+    def open(self):
+        """Open (or reopen) the port"""
+        self.close()
+        self.serial = serial.Serial(
+            port=self.port,
+            baudrate=self.baudrate,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE,
+            bytesize=serial.EIGHTBITS,
+            timeout=FRAME_POLL_INTERVAL
+        )
+        self.reader = FrameReader(self.serial)
+        self.opened_at = time.time()
+        self.connects += 1
+        self.consecutive_errors = 0
+        logger.info(f"🔌 Session MPPSOLAR ouverte sur {self.port}")
+
+    def close(self):
+        """Close the port"""
+        if self.serial is not None:
+            try:
+                self.serial.close()
+            except Exception as e:
+                logger.debug(f"Erreur fermeture {self.port}: {e}")
+            self.serial = None
+            self.reader = None
+
+    def is_healthy(self) -> bool:
+        """Port open, device still present and no error streak"""
+        if self.serial is None or not self.serial.is_open:
+            return False
+        if self.consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
+            return False
+        try:
+            self.serial.in_waiting  # Raises once the USB device is gone
+        except (OSError, serial.SerialException):
+            return False
+        return True
+
+    def query(self, frame: bytes, count_errors: bool = True) -> bytes:
+        """
+        Send a command frame and wait for its answer frame
+
+        Args:
+            frame: Full command frame (command + CRC + \\r)
+            count_errors: A timeout or corrupt answer counts towards the
+                reopen threshold (False for optional commands, which some
+                devices never answer)
+
+        Returns:
+            Answer body, CRC checked (e.g., b'(230.0 50.0 ...')
+
+        Raises:
+            FrameError: Timeout or corrupt answer
+            serial.SerialException, OSError: Port error (the session is reopened next time)
+        """
+        stats = self.stats
+        with self.lock:
+            if not self.is_healthy():
+                try:
+                    self.open()
+                except (OSError, serial.SerialException) as e:
+                    stats.failure(ERROR, 0.0, error=e)
+                    raise
+
+            reader = self.reader
+            crc_errors, bytes_received = reader.crc_errors, reader.bytes_received
+            start = time.perf_counter()
+            try:
+                # Drop leftovers of a previous timed out answer
+                reader.reset()
+                self.serial.write(frame)
+                response = reader.read_frame(self.timeout)
+            except FrameError as e:
+                if count_errors:
+                    self.consecutive_errors += 1
+                stats.corrupt(reader.crc_errors - crc_errors)
+                stats.failure(CRC_ERROR if isinstance(e, FrameCRCError) else TIMEOUT,
+                              time.perf_counter() - start, len(frame), reader.bytes_received - bytes_received, error=e)
+                raise
+            except (OSError, serial.SerialException) as e:
+                self.consecutive_errors += 1
+                stats.failure(ERROR, time.perf_counter() - start, len(frame), error=e)
+                self.close()
+                raise
+
+            self.consecutive_errors = 0
+            latency = time.perf_counter() - start
+            received = reader.bytes_received - bytes_received
+            if reader.crc_errors > crc_errors:
+                # Valid answer after corrupt frame(s)
+                stats.corrupt(reader.crc_errors - crc_errors, retried=True)
+            if response.startswith(NAK):
+                stats.failure(EXCEPTION, latency, len(frame), received, error=f"NAK {frame[:-3]!r}")
+            else:
+                stats.success(latency, len(frame), received)
+            return response
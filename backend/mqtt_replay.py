@@ -0,0 +1,216 @@
+"""
+Solar Assistant MQTT Record / Replay
+Enregistre le trafic MQTT de Solar Assistant et le rejoue sans matériel
+
+Recordings are gzip-compressed JSON lines, one message per line:
+{"t": seconds since the first message, "topic": ..., "payload": ...}
+
+Usage:
+    python mqtt_replay.py record <host> <file.jsonl.gz> [seconds] [port]
+    python mqtt_replay.py replay <file.jsonl.gz> [speed] [host] [port]
+
+A replay without host feeds SolarAssistantMQTT._on_message directly; with a
+host it publishes to that broker (e.g. a local mosquitto standing in for
+Solar Assistant). Speed 1 replays in real time, N replays N times faster
+and 0 replays as fast as possible.
+"""
+
+import gzip
+import json
+import logging
+import sys
+import time
+from typing import Callable, Iterable, List, Optional
+
+import paho.mqtt.client as mqtt
+
+logger = logging.getLogger(__name__)
+
+
+class Message:
+    """Recorded message, also a minimal stand-in for paho's MQTTMessage"""
+
+    __slots__ = ('topic', 'payload', 'timestamp')
+
+    def __init__(self, topic: str, payload: bytes, timestamp: float = 0.0):
+        self.topic = topic
+        self.payload = payload
+        self.timestamp = timestamp
+
+
+def open_recording(path: str, mode: str):
+    """Open a recording, gzip-compressed if the name ends with .gz"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def load_recording(path: str) -> List[Message]:
+    """
+    Load a recording
+
+    Lines without "t" (older recordings) are spaced 0 s apart.
+    """
+    messages = []
+    with open_recording(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            messages.append(Message(item["topic"], item["payload"].encode(), float(item.get("t", 0.0))))
+    return messages
+
+
+class MQTTRecorder:
+    """Records the solar_assistant/# traffic of a broker to a file"""
+
+    def __init__(self, path: str, broker_host: str, broker_port: int = 1883,
+                 username: str = None, password: str = None):
+        """
+        Initialize recorder
+
+        Args:
+            path: Output file (.jsonl or .jsonl.gz)
+            broker_host: Solar Assistant IP address
+            broker_port: MQTT port
+            username: MQTT username (optional)
+            password: MQTT password (optional)
+        """
+        self.path = path
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.file = None
+        self.first_time: Optional[float] = None
+        self.count = 0
+
+        self.client = mqtt.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        if username and password:
+            self.client.username_pw_set(username, password)
+
+    def _on_connect(self, client, userdata, flags, rc):
+        """Subscribe once connected"""
+        if rc == 0:
+            client.subscribe("solar_assistant/#")
+            logger.info(f"📡 Recording solar_assistant/# from {self.broker_host} to {self.path}")
+        else:
+            logger.error(f"❌ Failed to connect (rc={rc})")
+
+    def _on_message(self, client, userdata, msg):
+        """Append one message to the recording"""
+        now = time.time()
+        if self.first_time is None:
+            self.first_time = now
+        self.file.write(json.dumps({
+            "t": round(now - self.first_time, 4),
+            "topic": msg.topic,
+            "payload": msg.payload.decode('utf-8', errors='replace')
+        }, separators=(',', ':')) + '\n')
+        self.count += 1
+
+    def record(self, seconds: float) -> int:
+        """
+        Record for a given duration
+
+        Returns:
+            Number of messages recorded
+        """
+        with open_recording(self.path, 'w') as self.file:
+            self.client.connect(self.broker_host, self.broker_port, keepalive=60)
+            self.client.loop_start()
+            try:
+                time.sleep(seconds)
+            finally:
+                self.client.disconnect()
+                self.client.loop_stop()
+        return self.count
+
+
+def replay(messages: Iterable[Message], deliver: Callable[[Message], None], speed: float = 1.0) -> float:
+    """
+    Replay messages with their recorded spacing
+
+    Args:
+        messages: Recorded messages, in time order
+        deliver: Called with each message when it is due
+        speed: 1 = real time, N = N times faster, 0 = as fast as possible
+
+    Returns:
+        Elapsed wall time in seconds
+    """
+    start = time.perf_counter()
+    first = None
+    for msg in messages:
+        if speed > 0:
+            if first is None:
+                first = msg.timestamp
+            delay = (msg.timestamp - first) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        deliver(msg)
+    return time.perf_counter() - start
+
+
+def direct_delivery(client) -> Callable[[Message], None]:
+    """Deliver replayed messages straight into a SolarAssistantMQTT client"""
+    on_message = client._on_message
+    return lambda msg: on_message(None, None, msg)
+
+
+class BrokerPublisher:
+    """Publishes replayed messages to a broker standing in for Solar Assistant"""
+
+    def __init__(self, broker_host: str = "localhost", broker_port: int = 1883, qos: int = 0):
+        self.qos = qos
+        self.client = mqtt.Client()
+        self.client.connect(broker_host, broker_port, keepalive=60)
+        self.client.loop_start()
+
+    def __call__(self, msg: Message):
+        self.client.publish(msg.topic, msg.payload, qos=self.qos)
+
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    # Required arguments per command: record <host> <file>, replay <file>
+    required = {"record": 2, "replay": 1}
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command not in required or len(sys.argv) < 2 + required[command]:
+        print(__doc__)
+        sys.exit(1)
+
+    if command == "record":
+        host, path = sys.argv[2], sys.argv[3]
+        seconds = float(sys.argv[4]) if len(sys.argv) > 4 else 60
+        port = int(sys.argv[5]) if len(sys.argv) > 5 else 1883
+        print(f"🔴 Recording {host}:{port} for {seconds:.0f}s...")
+        count = MQTTRecorder(path, host, port).record(seconds)
+        print(f"✅ {count} messages written to {path}")
+    else:
+        path = sys.argv[2]
+        speed = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+        messages = load_recording(path)
+
+        if len(sys.argv) > 4:
+            host = sys.argv[4]
+            port = int(sys.argv[5]) if len(sys.argv) > 5 else 1883
+            publisher = BrokerPublisher(host, port)
+            print(f"▶️ Replaying {len(messages)} messages to {host}:{port} at {speed}x...")
+            try:
+                elapsed = replay(messages, publisher, speed)
+            finally:
+                publisher.close()
+        else:
+            from solar_assistant_mqtt import SolarAssistantMQTT
+            client = SolarAssistantMQTT("localhost")
+            print(f"▶️ Replaying {len(messages)} messages into the decoder at {speed}x...")
+            elapsed = replay(messages, direct_delivery(client), speed)
+            print(json.dumps(client.get_aggregated_data(), indent=2))
+
+        print(f"✅ Replayed in {elapsed:.2f}s")
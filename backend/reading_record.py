@@ -0,0 +1,121 @@
+"""
+Relevés compacts des onduleurs lus en direct (GROWATT, MPPSOLAR)
+
+The polling path does not build dicts nor validate an InverterReading
+Pydantic model per poll: register blocks are decoded straight into the
+value array of a ReadingRecord, which is converted once into the stored
+document. The document has the fields of InverterReading.model_dump()
+(timestamp as ISO string), so stored readings are unchanged.
+"""
+
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+# Metrics of InverterReading (server.py), in model order
+READING_FIELDS = (
+    'ac_power', 'dc_power', 'ac_voltage', 'dc_voltage', 'ac_current', 'dc_current', 'frequency',
+    'pv2_voltage', 'pv2_current', 'pv2_power',
+    'energy_today', 'energy_total',
+    'battery_voltage', 'battery_current', 'battery_soc', 'battery_temperature', 'battery_power',
+    'grid_power', 'grid_voltage', 'grid_frequency',
+    'load_power',
+    'temperature',
+)
+
+# Raw values decoded with the metrics but not stored
+INTERNAL_FIELDS = ('status_code',)
+
+RECORD_FIELDS = READING_FIELDS + INTERNAL_FIELDS
+FIELD_INDEX = {name: index for index, name in enumerate(RECORD_FIELDS)}
+
+# Stored value of a metric the device did not report
+_MISSING_VALUES = {
+    'frequency': 50.0, 'grid_frequency': 50.0, 'load_power': None,
+    'pv2_voltage': None, 'pv2_current': None, 'pv2_power': None,
+}
+_DEFAULTS = tuple(_MISSING_VALUES.get(name, 0.0) for name in READING_FIELDS)
+
+
+class ReadingRecord:
+    """
+    One poll of one inverter: a flat value array indexed by FIELD_INDEX
+
+    Unreported values are None. Supports record['ac_power'] style access
+    for code that is not on the decoding path.
+    """
+
+    __slots__ = ('values', 'status', 'timestamp', 'mode', 'warnings')
+
+    def __init__(self, timestamp: Optional[datetime] = None):
+        self.values = [None] * len(RECORD_FIELDS)
+        self.status = 'ok'
+        self.timestamp = timestamp or datetime.now(timezone.utc)
+        self.mode: Optional[str] = None  # Device mode (MPPSOLAR QMOD)
+        self.warnings: Optional[List[str]] = None  # Active warnings (MPPSOLAR QPIWS)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ReadingRecord':
+        """Record from a dict of metrics (unknown keys are ignored)"""
+        record = cls()
+        values = record.values
+        for name, value in data.items():
+            index = FIELD_INDEX.get(name)
+            if index is not None and value is not None:
+                values[index] = float(value)
+        record.status = data.get('status', 'ok')
+        record.mode = data.get('mode')
+        record.warnings = data.get('warnings')
+        return record
+
+    def __getitem__(self, name: str) -> Optional[float]:
+        return self.values[FIELD_INDEX[name]]
+
+    def __setitem__(self, name: str, value: Optional[float]):
+        self.values[FIELD_INDEX[name]] = value
+
+    def __contains__(self, name: str) -> bool:
+        index = FIELD_INDEX.get(name)
+        return index is not None and self.values[index] is not None
+
+    def get(self, name: str, default: Any = None) -> Any:
+        index = FIELD_INDEX.get(name)
+        value = self.values[index] if index is not None else None
+        return default if value is None else value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Reported metrics, status and timestamp"""
+        data = {name: value for name, value in zip(READING_FIELDS, self.values) if value is not None}
+        data['status'] = self.status
+        if self.mode is not None:
+            data['mode'] = self.mode
+        if self.warnings is not None:
+            data['warnings'] = self.warnings
+        data['timestamp'] = self.timestamp.isoformat()
+        return data
+
+    def to_document(self, inverter_id: str) -> Dict[str, Any]:
+        """
+        Readings collection document, as stored for an InverterReading
+
+        Unreported metrics get the values the REAL mode has always stored
+        (0.0, 50.0 Hz for frequencies, None for load power and the second
+        PV input).
+        """
+        document = {
+            'id': str(uuid.uuid4()),
+            'inverter_id': inverter_id,
+            'timestamp': self.timestamp.isoformat(),
+        }
+        for name, value, default in zip(READING_FIELDS, self.values, _DEFAULTS):
+            document[name] = default if value is None else value
+        document['status'] = self.status
+        document['mode'] = self.mode
+        document['warnings'] = self.warnings
+        document['interval_seconds'] = None  # Set by the collector
+        document['inverters'] = None
+        document['window'] = None
+        return document
+
+    def __repr__(self):
+        return f"ReadingRecord({self.to_dict()})"
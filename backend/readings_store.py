@@ -0,0 +1,85 @@
+"""
+Readings Store
+Écriture en masse et idempotente des relevés dans MongoDB
+"""
+
+import logging
+from typing import Dict, Any, List
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# MongoDB error code for duplicate keys
+DUPLICATE_KEY_ERROR = 11000
+
+
+async def ensure_readings_index(db) -> bool:
+    """
+    Create the unique (inverter_id, timestamp) index on readings
+    
+    Args:
+        db: Motor database
+        
+    Returns:
+        True if the unique index exists, False if it could not be created
+        (existing duplicates); a plain index is created instead
+    """
+    try:
+        await db.readings.create_index(
+            [("inverter_id", 1), ("timestamp", 1)],
+            unique=True,
+            name="inverter_timestamp_unique"
+        )
+        return True
+    except OperationFailure as e:
+        logger.warning(f"⚠️ Unique readings index unavailable (existing duplicates?): {e}")
+        await db.readings.create_index(
+            [("inverter_id", 1), ("timestamp", 1)],
+            name="inverter_timestamp"
+        )
+        return False
+
+
+async def insert_readings(db, readings: List[Dict[str, Any]], unique_index: bool = True) -> Dict[str, int]:
+    """
+    Insert readings in bulk, ignoring those already stored
+    
+    With the unique index, an unordered insert_many is used and duplicate-key
+    errors are ignored. Without it, readings are written as bulk upserts
+    keyed on (inverter_id, timestamp).
+    
+    Args:
+        db: Motor database
+        readings: Reading documents (with inverter_id and timestamp)
+        unique_index: Whether the unique (inverter_id, timestamp) index exists
+        
+    Returns:
+        {"inserted": n, "duplicates": n}
+    """
+    if not readings:
+        return {"inserted": 0, "duplicates": 0}
+    
+    if not unique_index:
+        operations = [
+            UpdateOne(
+                {"inverter_id": reading["inverter_id"], "timestamp": reading["timestamp"]},
+                {"$setOnInsert": reading},
+                upsert=True
+            )
+            for reading in readings
+        ]
+        result = await db.readings.bulk_write(operations, ordered=False)
+        return {
+            "inserted": result.upserted_count,
+            "duplicates": len(readings) - result.upserted_count
+        }
+    
+    try:
+        result = await db.readings.insert_many(readings, ordered=False)
+        return {"inserted": len(result.inserted_ids), "duplicates": 0}
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+            raise
+        return {"inserted": e.details.get("nInserted", 0), "duplicates": len(errors)}
@@ -0,0 +1,26 @@
+"""
+Check results of the standalone test scripts (test_ha_sync.py, ...)
+
+Each check prints a line; exit_with_summary() prints the summary and exits
+with status 1 if a check failed.
+"""
+
+import sys
+from typing import List
+
+failures: List[str] = []
+
+
+def check(condition: bool, message: str):
+    """Print a check result and remember failures"""
+    print(f"   {'✅' if condition else '❌'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+def exit_with_summary():
+    """Print the summary, exit with status 1 if a check failed"""
+    if failures:
+        print(f"\n❌ {len(failures)} check(s) failed")
+        sys.exit(1)
+    print("\n✅ All checks passed")
@@ -1,4 +1,5 @@
 from fastapi import FastAPI, APIRouter, HTTPException, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -10,16 +11,23 @@ from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone, timedelta
 import asyncio
+import json
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import random
 from inverter_scanner import auto_discover_inverters
 from network_info import get_network_info
-from inverter_reader import read_inverter_data, close_all_connections
+from inverter_reader import read_inverter_data, close_all_connections, get_transport_stats
 from home_assistant_reader import (
     initialize_ha_reader, 
     get_ha_reader, 
     HomeAssistantReader
 )
+from readings_store import ensure_readings_index
+from ha_sync import initialize_ha_sync, get_ha_sync
+from solar_assistant_mqtt import (
+    initialize_mqtt_client,
+    get_mqtt_client
+)
 from weather_service import (
     initialize_weather_service,
     get_weather_service
@@ -57,6 +65,19 @@ logger.info(f"🔋 Capacité batterie: {BATTERY_CAPACITY_KWH} kWh")
 HA_URL = os.environ.get('HOME_ASSISTANT_URL', '')
 HA_TOKEN = os.environ.get('HOME_ASSISTANT_TOKEN', '')
 
+# Solar Assistant MQTT configuration (SOLAR_ASSISTANT_MQTT mode)
+SA_MQTT_HOST = os.environ.get('SOLAR_ASSISTANT_MQTT_HOST', '')
+SA_MQTT_PORT = int(os.environ.get('SOLAR_ASSISTANT_MQTT_PORT', '1883'))
+SA_MQTT_USERNAME = os.environ.get('SOLAR_ASSISTANT_MQTT_USERNAME') or None
+SA_MQTT_PASSWORD = os.environ.get('SOLAR_ASSISTANT_MQTT_PASSWORD') or None
+# Set a stable client ID to get a persistent broker session across restarts
+SA_MQTT_CLIENT_ID = os.environ.get('SOLAR_ASSISTANT_MQTT_CLIENT_ID') or None
+SA_MQTT_QOS = int(os.environ.get('SOLAR_ASSISTANT_MQTT_QOS', '1'))
+
+# Home Assistant history sync (fills collector gaps from HA history)
+HA_SYNC_INTERVAL_MINUTES = int(os.environ.get('HA_SYNC_INTERVAL_MINUTES', '15'))
+HA_SYNC_INITIAL_DAYS = int(os.environ.get('HA_SYNC_INITIAL_DAYS', '1'))
+
 # ===================== MODELS =====================
 
 class InverterCreate(BaseModel):
@@ -67,6 +88,8 @@ class InverterCreate(BaseModel):
     baudrate: int = 9600
     slave_id: Optional[int] = 1
     battery_capacity: Optional[float] = 0  # kWh
+    model: Optional[str] = None  # Selects the GROWATT register map (e.g., "SPH 6000")
+    command_rates: Optional[Dict[str, int]] = None  # MPPSOLAR polls between commands, e.g. {"QED": 60, "QPIGS2": 0}
 
 class Inverter(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -79,7 +102,9 @@ class Inverter(BaseModel):
     baudrate: int
     slave_id: Optional[int]
     battery_capacity: Optional[float] = 0  # kWh
-    status: str = "disconnected"  # "connected", "disconnected", "error"
+    model: Optional[str] = None
+    command_rates: Optional[Dict[str, int]] = None
+    status: str = "disconnected"  # "connected", "disconnected", "error", "unavailable"
     last_reading: Optional[datetime] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -99,6 +124,11 @@ class InverterReading(BaseModel):
     dc_current: Optional[float] = None  # Amps
     frequency: Optional[float] = None  # Hz
     
+    # Second PV input (MPPSOLAR QPIGS2), dc_power includes pv2_power
+    pv2_voltage: Optional[float] = None  # Volts
+    pv2_current: Optional[float] = None  # Amps
+    pv2_power: Optional[float] = None  # Watts
+    
     # Energy metrics
     energy_today: Optional[float] = None  # kWh
     energy_total: Optional[float] = None  # kWh
@@ -121,6 +151,19 @@ class InverterReading(BaseModel):
     # System
     temperature: Optional[float] = None  # Inverter temperature
     status: str = "ok"  # "ok", "warning", "error"
+    mode: Optional[str] = None  # Device mode, e.g. "line", "battery" (MPPSOLAR)
+    warnings: Optional[List[str]] = None  # Active warning flags (MPPSOLAR)
+    
+    # Time the reading stands for (collection interval, HA sync step, MQTT
+    # emit window); None on older readings, counted as READING_INTERVAL_SECONDS
+    interval_seconds: Optional[float] = None
+    
+    # Per physical inverter breakdown (Home Assistant sites with several inverters)
+    inverters: Optional[List[Dict[str, Any]]] = None
+    
+    # High-rate window statistics per inverter and metric (Solar Assistant MQTT):
+    # mean, min, max, samples and energy_wh since the previous reading
+    window: Optional[Dict[str, Dict[str, Dict[str, float]]]] = None
 
 class EnergyManagementMode(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -190,7 +233,21 @@ class HomeAssistantConfigCreate(BaseModel):
     url: str
     token: str
 
+# ===== SOLAR ASSISTANT MQTT MODELS =====
+
+class SolarAssistantConfigCreate(BaseModel):
+    host: str  # e.g., 192.168.1.162
+    port: int = 1883
+    username: Optional[str] = None
+    password: Optional[str] = None
+    client_id: Optional[str] = None  # Stable ID -> persistent session
+    clean_session: Optional[bool] = None
+    qos: int = Field(default=1, ge=0, le=2)
+
 class HomeAssistantEntityMapping(BaseModel):
+    # Extra keys carry other inverters: solar_power_inv2, load_power_inv3...
+    model_config = ConfigDict(extra="allow")
+    
     solar_power: Optional[str] = None
     battery_soc: Optional[str] = None
     battery_power: Optional[str] = None
@@ -308,9 +365,133 @@ async def determine_active_source(readings: List[dict], config: EnergyManagement
 
 scheduler = AsyncIOScheduler()
 
+# Event loop of the application, used by the MQTT thread to hand readings over
+main_loop: Optional[asyncio.AbstractEventLoop] = None
+
+async def get_or_create_virtual_inverter(name: str, brand: str, connection_type: str) -> dict:
+    """Get the virtual inverter of a data source (Home Assistant, Solar Assistant), creating it if needed"""
+    virtual_inv = await db.inverters.find_one({"name": name})
+    if not virtual_inv:
+        virtual_inv = Inverter(
+            name=name,
+            brand=brand,
+            connection_type=connection_type,
+            port="N/A",
+            baudrate=0,
+            slave_id=None,
+            battery_capacity=BATTERY_CAPACITY_KWH,
+            status="connected"
+        )
+        doc = virtual_inv.model_dump()
+        doc['created_at'] = doc['created_at'].isoformat()
+        if doc['last_reading']:
+            doc['last_reading'] = doc['last_reading'].isoformat()
+        await db.inverters.insert_one(doc)
+        virtual_inv = doc
+    return virtual_inv
+
+async def store_solar_assistant_reading():
+    """Store a reading built from the values pushed by Solar Assistant over MQTT"""
+    try:
+        mqtt_client = get_mqtt_client()
+        if INVERTER_MODE != 'SOLAR_ASSISTANT_MQTT' or not mqtt_client:
+            return
+        
+        reading_data = mqtt_client.emit_reading(BATTERY_CAPACITY_KWH)
+        if not reading_data:
+            return
+        
+        virtual_inv = await get_or_create_virtual_inverter("Solar Assistant", "SOLAR_ASSISTANT", "MQTT")
+        
+        reading = InverterReading(inverter_id=virtual_inv['id'], **reading_data)
+        reading_dict = reading.model_dump()
+        reading_dict['timestamp'] = reading_dict['timestamp'].isoformat()
+        await db.readings.insert_one(reading_dict)
+        
+        await db.inverters.update_one(
+            {"id": virtual_inv['id']},
+            {"$set": {
+                "last_reading": reading_dict['timestamp'],
+                "status": "connected"
+            }}
+        )
+    except Exception as e:
+        logger.error(f"Error storing Solar Assistant reading: {e}")
+
+def on_solar_assistant_update():
+    """Called from the MQTT thread when a new reading is due"""
+    if main_loop is not None:
+        asyncio.run_coroutine_threadsafe(store_solar_assistant_reading(), main_loop)
+
+def start_solar_assistant_mqtt(host: str, port: int, username: Optional[str], password: Optional[str],
+                               client_id: Optional[str] = None, clean_session: Optional[bool] = None,
+                               qos: int = 1) -> bool:
+    """Start the Solar Assistant MQTT session with event-driven ingestion (non-blocking)"""
+    logger.info(f"☀️ Initializing Solar Assistant MQTT ({host}:{port})...")
+    return initialize_mqtt_client(host, port, username, password, on_update=on_solar_assistant_update,
+                                  client_id=client_id, clean_session=clean_session, qos=qos)
+
+def start_solar_assistant_from_config(sa_config: Dict[str, Any]) -> bool:
+    """Start the Solar Assistant MQTT session from a saved configuration document"""
+    return start_solar_assistant_mqtt(
+        sa_config['host'], sa_config.get('port', 1883),
+        sa_config.get('username'), sa_config.get('password'),
+        sa_config.get('client_id'), sa_config.get('clean_session'), sa_config.get('qos', 1)
+    )
+
+async def collect_inverter_reading(inv: Dict[str, Any]):
+    """Read (or simulate) one inverter and store the reading"""
+    try:
+        # Choisir entre simulation ou lecture réelle selon la configuration
+        if INVERTER_MODE == 'REAL':
+            # Mode RÉEL: Lire les vraies données de l'onduleur
+            record = await read_inverter_data(inv)
+            
+            if record is None:
+                # Erreur de lecture
+                logger.error(f"Impossible de lire l'onduleur {inv['id']} ({inv['brand']})")
+                await db.inverters.update_one(
+                    {"id": inv['id']},
+                    {"$set": {"status": "error"}}
+                )
+                return
+            
+            # Document stocké directement depuis le relevé (pas de validation
+            # Pydantic sur ce chemin, mêmes champs qu'un InverterReading)
+            reading_dict = record.to_document(inv['id'])
+        else:
+            # Mode SIMULATION: Générer des données aléatoires
+            reading = await simulate_reading(inv['id'], inv['brand'])
+            reading_dict = reading.model_dump()
+            reading_dict['timestamp'] = reading_dict['timestamp'].isoformat()
+        reading_dict['interval_seconds'] = READING_INTERVAL_SECONDS
+        
+        # Store reading
+        await db.readings.insert_one(reading_dict)
+        
+        # Update inverter last_reading
+        await db.inverters.update_one(
+            {"id": inv['id']},
+            {"$set": {
+                "last_reading": datetime.now(timezone.utc).isoformat(),
+                "status": "connected"
+            }}
+        )
+        
+    except Exception as e:
+        logger.error(f"Error reading from inverter {inv['id']}: {e}")
+        await db.inverters.update_one(
+            {"id": inv['id']},
+            {"$set": {"status": "error"}}
+        )
+
 async def collect_readings():
     """Background task to collect readings from all inverters"""
     try:
+        # Mode SOLAR_ASSISTANT_MQTT: readings are pushed by the MQTT client, nothing to poll
+        if INVERTER_MODE == 'SOLAR_ASSISTANT_MQTT':
+            return
+        
         # Mode HOME_ASSISTANT: Read from Home Assistant instead of physical inverters
         if INVERTER_MODE == 'HOME_ASSISTANT':
             ha_reader = get_ha_reader()
@@ -319,32 +500,30 @@ async def collect_readings():
                 ha_config = await db.home_assistant_config.find_one({}, {"_id": 0})
                 if ha_config and ha_config.get('enabled') and ha_config.get('entity_mapping'):
                     entity_mapping = ha_config['entity_mapping']
-                    solar_data = ha_reader.read_solar_data(entity_mapping)
-                    reading_data = ha_reader.map_to_inverter_reading(solar_data, BATTERY_CAPACITY_KWH)
+                    site_data = ha_reader.read_site_data(entity_mapping)
                     
-                    # Create virtual inverter if not exists
-                    virtual_inv = await db.inverters.find_one({"name": "Home Assistant"})
-                    if not virtual_inv:
-                        virtual_inv = Inverter(
-                            name="Home Assistant",
-                            brand="HOME_ASSISTANT",
-                            connection_type="API",
-                            port="N/A",
-                            baudrate=0,
-                            slave_id=None,
-                            battery_capacity=BATTERY_CAPACITY_KWH,
-                            status="connected"
+                    if site_data is None:
+                        # Circuit breaker open: record the outage without stalling the cycle
+                        await db.inverters.update_one(
+                            {"name": "Home Assistant"},
+                            {"$set": {"status": "unavailable"}}
                         )
-                        doc = virtual_inv.model_dump()
-                        doc['created_at'] = doc['created_at'].isoformat()
-                        if doc['last_reading']:
-                            doc['last_reading'] = doc['last_reading'].isoformat()
-                        await db.inverters.insert_one(doc)
-                        virtual_inv = doc
+                        logger.warning("⚠️ Home Assistant unavailable - reading skipped")
+                        return
+                    
+                    reading_data = ha_reader.map_to_inverter_reading(site_data['site'], BATTERY_CAPACITY_KWH)
+                    
+                    # Keep the per-inverter breakdown when several inverters are mapped
+                    if len(site_data['inverters']) > 1:
+                        reading_data['inverters'] = ha_reader.map_inverter_breakdown(site_data['inverters'])
+                    
+                    # Create virtual inverter if not exists
+                    virtual_inv = await get_or_create_virtual_inverter("Home Assistant", "HOME_ASSISTANT", "API")
                     
                     # Create reading
                     reading = InverterReading(
                         inverter_id=virtual_inv['id'],
+                        interval_seconds=READING_INTERVAL_SECONDS,
                         **reading_data
                     )
                     
@@ -371,72 +550,27 @@ async def collect_readings():
         # Original modes: REAL and SIMULATION
         inverters = await db.inverters.find({"status": "connected"}).to_list(100)
         
-        for inv in inverters:
-            try:
-                # Choisir entre simulation ou lecture réelle selon la configuration
-                if INVERTER_MODE == 'REAL':
-                    # Mode RÉEL: Lire les vraies données de l'onduleur
-                    data = read_inverter_data(inv)
-                    
-                    if data is None:
-                        # Erreur de lecture
-                        logger.error(f"Impossible de lire l'onduleur {inv['id']} ({inv['brand']})")
-                        await db.inverters.update_one(
-                            {"id": inv['id']},
-                            {"$set": {"status": "error"}}
-                        )
-                        continue
-                    
-                    # Créer l'objet InverterReading à partir des données lues
-                    reading = InverterReading(
-                        inverter_id=inv['id'],
-                        ac_power=data.get('ac_power', 0.0),
-                        dc_power=data.get('dc_power', 0.0),
-                        ac_voltage=data.get('ac_voltage', 0.0),
-                        dc_voltage=data.get('dc_voltage', 0.0),
-                        ac_current=data.get('ac_current', 0.0),
-                        dc_current=data.get('dc_current', 0.0),
-                        frequency=data.get('frequency', 50.0),
-                        energy_today=data.get('energy_today', 0.0),
-                        energy_total=data.get('energy_total', 0.0),
-                        temperature=data.get('temperature', 0.0),
-                        battery_voltage=data.get('battery_voltage', 0.0),
-                        battery_current=data.get('battery_current', 0.0),
-                        battery_soc=data.get('battery_soc', 0.0),
-                        battery_temperature=data.get('battery_temperature', 0.0),
-                        battery_power=data.get('battery_power', 0.0),
-                        grid_power=data.get('grid_power', 0.0),
-                        grid_voltage=data.get('grid_voltage', 0.0),
-                        grid_frequency=data.get('grid_frequency', 50.0),
-                        status=data.get('status', 'ok')
-                    )
-                else:
-                    # Mode SIMULATION: Générer des données aléatoires
-                    reading = await simulate_reading(inv['id'], inv['brand'])
-                
-                # Store reading
-                reading_dict = reading.model_dump()
-                reading_dict['timestamp'] = reading_dict['timestamp'].isoformat()
-                await db.readings.insert_one(reading_dict)
-                
-                # Update inverter last_reading
-                await db.inverters.update_one(
-                    {"id": inv['id']},
-                    {"$set": {
-                        "last_reading": datetime.now(timezone.utc).isoformat(),
-                        "status": "connected"
-                    }}
-                )
-                
-            except Exception as e:
-                logger.error(f"Error reading from inverter {inv['id']}: {e}")
-                await db.inverters.update_one(
-                    {"id": inv['id']},
-                    {"$set": {"status": "error"}}
-                )
+        # Inverters are polled concurrently: Modbus transactions of different
+        # ports overlap, the driver serializes those sharing a bus
+        await asyncio.gather(*(collect_inverter_reading(inv) for inv in inverters))
     except Exception as e:
         logger.error(f"Error in collect_readings: {e}")
 
+async def sync_home_assistant_history():
+    """Background task filling collector gaps from Home Assistant history"""
+    if INVERTER_MODE != 'HOME_ASSISTANT':
+        return
+    
+    ha_sync = get_ha_sync()
+    ha_reader = get_ha_reader()
+    if not ha_sync or (ha_reader and ha_reader.breaker.is_open()):
+        return
+    
+    try:
+        await ha_sync.run(days=HA_SYNC_INITIAL_DAYS)
+    except Exception as e:
+        logger.error(f"Error in Home Assistant sync: {e}")
+
 # ===================== API ROUTES =====================
 
 @api_router.get("/")
@@ -473,6 +607,7 @@ async def save_home_assistant_config(config: HomeAssistantConfigCreate):
         success = initialize_ha_reader(config.url, config.token)
         if not success:
             raise HTTPException(status_code=500, detail="Failed to initialize Home Assistant reader")
+        initialize_ha_sync(db, config.url, config.token)
         
         # Save to database
         ha_config = HomeAssistantConfig(
@@ -541,6 +676,152 @@ async def get_home_assistant_config():
     config["configured"] = True
     return config
 
+# ===== SOLAR ASSISTANT MQTT =====
+
+@api_router.get("/solar-assistant/config")
+async def get_solar_assistant_config():
+    """Get Solar Assistant MQTT broker configuration (without password)"""
+    config = await db.solar_assistant_config.find_one({}, {"_id": 0, "password": 0})
+    mqtt_client = get_mqtt_client()
+    
+    if not config:
+        return {"configured": False, "connected": False}
+    
+    config["configured"] = True
+    config["connected"] = bool(mqtt_client and mqtt_client.is_connected())
+    return config
+
+@api_router.put("/solar-assistant/config")
+async def save_solar_assistant_config(config: SolarAssistantConfigCreate):
+    """Save Solar Assistant MQTT broker configuration and reconnect"""
+    doc = config.model_dump()
+    started = start_solar_assistant_from_config(doc)
+    mqtt_client = get_mqtt_client()
+    connected = started and mqtt_client is not None and await mqtt_client.wait_connected(5.0)
+    
+    doc['updated_at'] = datetime.now(timezone.utc).isoformat()
+    await db.solar_assistant_config.delete_many({})
+    await db.solar_assistant_config.insert_one(doc)
+    
+    if not connected:
+        # The session keeps retrying in the background with backoff
+        raise HTTPException(status_code=400, detail=f"Could not connect to MQTT broker {config.host}:{config.port}")
+    
+    return {"message": "Solar Assistant MQTT configuration saved", "connected": True}
+
+@api_router.get("/solar-assistant/data")
+async def get_solar_assistant_data():
+    """Get the latest values pushed by Solar Assistant, per inverter and aggregated"""
+    mqtt_client = get_mqtt_client()
+    if not mqtt_client:
+        raise HTTPException(status_code=400, detail="Solar Assistant MQTT not configured")
+    
+    return {
+        "connected": mqtt_client.is_connected(),
+        "inverters": mqtt_client.get_all_data(),
+        "aggregated": mqtt_client.get_aggregated_data()
+    }
+
+@api_router.get("/solar-assistant/status")
+async def get_solar_assistant_status():
+    """Get the MQTT session state and connection metrics (reconnects, failures, retry delay)"""
+    mqtt_client = get_mqtt_client()
+    if not mqtt_client:
+        return {"configured": False, "state": "disconnected"}
+    
+    return {"configured": True, **mqtt_client.get_connection_status()}
+
+@api_router.get("/home-assistant/status")
+async def get_home_assistant_status():
+    """Get Home Assistant source availability (circuit breaker state)"""
+    ha_reader = get_ha_reader()
+    if not ha_reader:
+        return {"configured": False}
+    
+    status = ha_reader.breaker.get_status()
+    status["configured"] = True
+    return status
+
+@api_router.get("/home-assistant/sync")
+async def get_home_assistant_sync_status():
+    """Get Home Assistant history sync state and last run reports"""
+    ha_sync = get_ha_sync()
+    if not ha_sync:
+        return {"configured": False}
+    
+    status = ha_sync.get_status()
+    status["configured"] = True
+    return status
+
+@api_router.post("/home-assistant/sync")
+async def run_home_assistant_sync(days: int = HA_SYNC_INITIAL_DAYS):
+    """Fill the collector gaps of the last days from Home Assistant history now"""
+    ha_sync = get_ha_sync()
+    if not ha_sync:
+        raise HTTPException(status_code=400, detail="Home Assistant not configured")
+    
+    # Whole requested range: the periodic sync's high-water mark is near now
+    return await ha_sync.run(days=days, backfill=True)
+
+@api_router.post("/home-assistant/import")
+async def start_home_assistant_import(days: int = 30, statistics: bool = False):
+    """
+    Start a Home Assistant history import as a background job
+    
+    With statistics=true, the hourly long-term statistics are imported into
+    the rollups (readings_hourly) instead, which reaches further back than
+    the recorder history.
+    """
+    ha_sync = get_ha_sync()
+    if not ha_sync:
+        raise HTTPException(status_code=400, detail="Home Assistant not configured")
+    if days < 1:
+        raise HTTPException(status_code=400, detail="days must be at least 1")
+    
+    job = ha_sync.start_import_job(days, statistics=statistics)
+    kind = "statistics" if statistics else "history"
+    logger.info(f"📥 Home Assistant {kind} import job {job.id} started ({days} days)")
+    return job.get_progress()
+
+@api_router.get("/home-assistant/import/{job_id}")
+async def get_home_assistant_import(job_id: str):
+    """Get progress of a Home Assistant history import job"""
+    ha_sync = get_ha_sync()
+    job = ha_sync.get_job(job_id) if ha_sync else None
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    
+    return job.get_progress()
+
+@api_router.get("/home-assistant/import/{job_id}/stream")
+async def stream_home_assistant_import(job_id: str):
+    """Stream progress of a Home Assistant import job (Server-Sent Events)"""
+    ha_sync = get_ha_sync()
+    job = ha_sync.get_job(job_id) if ha_sync else None
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    
+    async def events():
+        while True:
+            progress = job.get_progress()
+            yield f"data: {json.dumps(progress)}\n\n"
+            if progress['status'] not in ('queued', 'running'):
+                break
+            await asyncio.sleep(1)
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@api_router.post("/home-assistant/import/{job_id}/cancel")
+async def cancel_home_assistant_import(job_id: str):
+    """Cancel a Home Assistant history import job"""
+    ha_sync = get_ha_sync()
+    job = ha_sync.get_job(job_id) if ha_sync else None
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    
+    job.cancel()
+    return {"message": "Cancellation requested", "job_id": job.id}
+
 @api_router.get("/home-assistant/entities")
 async def get_home_assistant_entities():
     """Get all entities from Home Assistant"""
@@ -684,6 +965,36 @@ async def update_inverter_status(inverter_id: str, status: str):
     
     return {"message": f"Inverter status updated to {status}"}
 
+@api_router.get("/inverters/{inverter_id}/transport")
+async def get_inverter_transport(inverter_id: str):
+    """Get the transport statistics of an inverter and the totals of its port (REAL mode)"""
+    inverter = await db.inverters.find_one({"id": inverter_id}, {"_id": 0})
+    if not inverter:
+        raise HTTPException(status_code=404, detail="Inverter not found")
+    
+    port = (inverter.get('port') or '').strip()
+    # MPPSOLAR ports have a single device
+    slave_id = inverter.get('slave_id', 1) if inverter.get('brand', '').upper() == 'GROWATT' else None
+    for summary in get_transport_stats():
+        if summary['port'].strip() == port:
+            device = next((d for d in summary['devices'] if d['slave_id'] == slave_id), None)
+            return {
+                "active": True,
+                "port": port,
+                "transport": summary['transport'],
+                "connects": summary['connects'],
+                "devices_on_port": len(summary['devices']),
+                "device": device,
+                "port_totals": summary['totals']
+            }
+    
+    return {"active": False, "port": port, "mode": INVERTER_MODE}
+
+@api_router.get("/transport/stats")
+async def get_all_transport_stats():
+    """Get the transport statistics of every open port (latency, timeouts, CRC errors, bytes, retries)"""
+    return {"mode": INVERTER_MODE, "ports": get_transport_stats()}
+
 # ===== READINGS =====
 
 @api_router.get("/inverters/{inverter_id}/realtime", response_model=Optional[InverterReading])
@@ -763,6 +1074,112 @@ async def get_dashboard_stats():
         management_mode=config.mode
     )
 
+# Periods longer than this use hourly rows: the rollups (readings_hourly)
+# when available, then raw readings averaged per hour
+ROLLUP_MIN_PERIOD = timedelta(days=7)
+
+# Collection interval (collect_readings), also the time covered by raw
+# readings stored without interval_seconds, and time covered by one hourly row
+READING_INTERVAL_SECONDS = 5
+HOUR_SECONDS = 3600
+
+# Reading fields averaged into the hourly rows of raw readings
+HOURLY_FIELDS = ('ac_power', 'dc_power', 'grid_power', 'battery_power', 'load_power', 'battery_soc')
+
+async def load_hourly_readings(start_time: datetime, end_time: datetime, raw_starts: Dict[str, datetime]) -> List[dict]:
+    """
+    Raw readings averaged per inverter and per hour (MongoDB aggregation)
+    
+    Args:
+        start_time: Period start
+        end_time: Period end
+        raw_starts: Inverter ID -> start of its raw readings (after its last
+            rollup hour); the other inverters start at start_time
+    """
+    ranges = [
+        {"inverter_id": inverter_id, "timestamp": {"$gte": raw_start.isoformat()}}
+        for inverter_id, raw_start in raw_starts.items()
+    ]
+    ranges.append({"inverter_id": {"$nin": list(raw_starts)}, "timestamp": {"$gte": start_time.isoformat()}})
+    match = {"$match": {"$or": ranges, "timestamp": {"$lt": end_time.isoformat()}}}
+    hour = {"$substrBytes": ["$timestamp", 0, 13]}  # YYYY-MM-DDTHH (UTC ISO timestamps)
+    
+    group = {
+        "_id": {"inverter_id": "$inverter_id", "hour": hour},
+        "seconds": {"$sum": {"$ifNull": ["$interval_seconds", READING_INTERVAL_SECONDS]}},
+        "peak_ac_power": {"$max": "$ac_power"},
+        "energy_today": {"$max": "$energy_today"},
+    }
+    for field in HOURLY_FIELDS:
+        group[field] = {"$avg": f"${field}"}
+    rows = await db.readings.aggregate([match, {"$group": group}]).to_list(None)
+    
+    # Physical inverters behind Home Assistant site readings
+    units = await db.readings.aggregate([
+        match,
+        {"$unwind": "$inverters"},
+        {"$group": {
+            "_id": {"inverter_id": "$inverter_id", "hour": hour, "index": "$inverters.index"},
+            "ac_power": {"$avg": "$inverters.ac_power"},
+            "peak_ac_power": {"$max": "$inverters.ac_power"},
+            "energy_today": {"$max": "$inverters.energy_today"},
+        }}
+    ]).to_list(None)
+    units_by_hour = {}
+    for unit in units:
+        key = (unit['_id']['inverter_id'], unit['_id']['hour'])
+        units_by_hour.setdefault(key, []).append({
+            'index': unit['_id']['index'],
+            'ac_power': unit['ac_power'],
+            'peak_ac_power': unit['peak_ac_power'],
+            'energy_today': unit['energy_today'],
+        })
+    
+    readings = []
+    for row in rows:
+        key = row.pop('_id')
+        row['inverter_id'] = key['inverter_id']
+        row['timestamp'] = f"{key['hour']}:00:00+00:00"
+        row['seconds'] = min(row['seconds'], HOUR_SECONDS)
+        row['inverters'] = sorted(
+            units_by_hour.get((key['inverter_id'], key['hour']), []), key=lambda unit: unit['index']
+        ) or None
+        readings.append(row)
+    return readings
+
+async def load_period_readings(start_time: datetime, end_time: datetime) -> List[dict]:
+    """
+    Load the readings of a period, sorted by timestamp
+    
+    Each row has 'seconds', the time it stands for (interval_seconds of raw
+    readings, summed per hour for hourly rows). Periods up to
+    ROLLUP_MIN_PERIOD use the raw readings. Longer periods use hourly rows:
+    the rollups (Home Assistant long-term statistics), then for each inverter
+    its raw readings after its last rollup hour, averaged per hour.
+    """
+    if end_time - start_time <= ROLLUP_MIN_PERIOD:
+        readings = await db.readings.find(
+            {"timestamp": {"$gte": start_time.isoformat(), "$lt": end_time.isoformat()}},
+            {"_id": 0}
+        ).sort("timestamp", 1).to_list(None)
+        for reading in readings:
+            reading['seconds'] = reading.get('interval_seconds') or READING_INTERVAL_SECONDS
+        return readings
+    
+    rollups = await db.readings_hourly.find(
+        {"hour": {"$gte": start_time.isoformat(), "$lt": end_time.isoformat()}},
+        {"_id": 0}
+    ).sort("hour", 1).to_list(None)
+    
+    raw_starts = {}
+    for rollup in rollups:
+        rollup['timestamp'] = rollup.pop('hour')
+        rollup['seconds'] = HOUR_SECONDS
+        raw_starts[rollup['inverter_id']] = datetime.fromisoformat(rollup['timestamp']) + timedelta(hours=1)
+    
+    hourly_readings = await load_hourly_readings(start_time, end_time, raw_starts)
+    return sorted(rollups + hourly_readings, key=lambda reading: reading['timestamp'])
+
 @api_router.get("/statistics/period")
 async def get_period_statistics(period: str = "today", start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get comprehensive statistics for a given period or custom date range"""
@@ -804,23 +1221,11 @@ async def get_period_statistics(period: str = "today", start_date: Optional[str]
     
     inverters = await db.inverters.find({}, {"_id": 0}).to_list(1000)
     
-    # Get readings (increased limit to handle Home Assistant's frequent data points)
-    # Home Assistant with Solar Assistant can generate 1 reading every 10-20 seconds
-    # which is ~4000-8000 readings per day
-    current_readings = await db.readings.find(
-        {"timestamp": {"$gte": start_time.isoformat()}},
-        {"_id": 0}
-    ).sort("timestamp", 1).to_list(20000)
-    
-    prev_readings = await db.readings.find(
-        {
-            "timestamp": {
-                "$gte": prev_start.isoformat(),
-                "$lt": prev_end.isoformat()
-            }
-        },
-        {"_id": 0}
-    ).sort("timestamp", 1).to_list(20000)
+    # Raw readings for short periods, hourly rows (rollups, raw readings
+    # averaged per hour) for long ones; each row has the seconds it covers
+    period_end = end_time if start_date and end_date else now
+    current_readings = await load_period_readings(start_time, period_end)
+    prev_readings = await load_period_readings(prev_start, prev_end)
     
     # Calculate statistics
     total_production = 0
@@ -833,37 +1238,50 @@ async def get_period_statistics(period: str = "today", start_date: Optional[str]
     peak_power = 0
     total_dc_power = 0
     total_ac_power = 0
-    count = len(current_readings)
+    total_seconds = 0
     
     inverter_stats = {}
     
     # Use trapezoidal integration for energy calculation (more accurate)
     total_consumption = 0
     
-    for i, reading in enumerate(current_readings):
+    # Previous row of each inverter: rows of several inverters are interleaved
+    previous_readings = {}
+    
+    for reading in current_readings:
         energy = reading.get('energy_today', 0) or 0
         ac_power = reading.get('ac_power', 0) or 0
         dc_power = reading.get('dc_power', 0) or 0
         grid_power = reading.get('grid_power', 0) or 0
         battery_power = reading.get('battery_power', 0) or 0
         load_power = reading.get('load_power', 0) or 0
+        peak = reading.get('peak_ac_power') or ac_power
+        
+        # Averages are weighted by the time each row covers (5 s raw reading, 1 h hourly row)
+        seconds = reading.get('seconds', READING_INTERVAL_SECONDS)
+        total_seconds += seconds
+        total_power += ac_power * seconds
+        # Efficiency only where DC power is known (not in HA statistics rollups)
+        has_dc = reading.get('dc_power') is not None
+        if has_dc:
+            total_dc_power += dc_power * seconds
+            total_ac_power += ac_power * seconds
         
-        total_power += ac_power
-        total_dc_power += dc_power
-        total_ac_power += ac_power
+        inv_id = reading.get('inverter_id')
         
-        # Use trapezoidal rule: average of current and next reading × time interval
-        if i < len(current_readings) - 1:
-            next_reading = current_readings[i + 1]
+        # Use trapezoidal rule: average of previous and current row of the inverter × time interval
+        previous = previous_readings.get(inv_id)
+        previous_readings[inv_id] = reading
+        if previous is not None:
+            previous_time = datetime.fromisoformat(previous['timestamp'])
             current_time = datetime.fromisoformat(reading['timestamp'])
-            next_time = datetime.fromisoformat(next_reading['timestamp'])
-            delta_hours = (next_time - current_time).total_seconds() / 3600
+            delta_hours = (current_time - previous_time).total_seconds() / 3600
             
             # Average power over interval
-            avg_solar = (ac_power + (next_reading.get('ac_power', 0) or 0)) / 2
-            avg_load = (load_power + (next_reading.get('load_power', 0) or 0)) / 2
-            avg_grid = (grid_power + (next_reading.get('grid_power', 0) or 0)) / 2
-            avg_battery = (battery_power + (next_reading.get('battery_power', 0) or 0)) / 2
+            avg_solar = ((previous.get('ac_power', 0) or 0) + ac_power) / 2
+            avg_load = ((previous.get('load_power', 0) or 0) + load_power) / 2
+            avg_grid = ((previous.get('grid_power', 0) or 0) + grid_power) / 2
+            avg_battery = ((previous.get('battery_power', 0) or 0) + battery_power) / 2
             
             # Accumulate energy
             total_solar_energy += avg_solar * delta_hours / 1000  # W → kWh
@@ -879,28 +1297,44 @@ async def get_period_statistics(period: str = "today", start_date: Optional[str]
             else:
                 total_battery_discharge += abs(avg_battery) * delta_hours / 1000
         
-        if ac_power > peak_power:
-            peak_power = ac_power
+        if peak > peak_power:
+            peak_power = peak
         
-        inv_id = reading.get('inverter_id')
         if inv_id not in inverter_stats:
             inverter_stats[inv_id] = {
-                'readings': [],
                 'total_energy': 0,
                 'max_power': 0,
                 'total_power': 0,
                 'total_dc': 0,
                 'total_ac': 0,
-                'count': 0
+                'seconds': 0
             }
         
-        inverter_stats[inv_id]['readings'].append(reading)
         inverter_stats[inv_id]['total_energy'] = max(inverter_stats[inv_id]['total_energy'], energy)
-        inverter_stats[inv_id]['max_power'] = max(inverter_stats[inv_id]['max_power'], ac_power)
-        inverter_stats[inv_id]['total_power'] += ac_power
-        inverter_stats[inv_id]['total_dc'] += dc_power
-        inverter_stats[inv_id]['total_ac'] += ac_power
-        inverter_stats[inv_id]['count'] += 1
+        inverter_stats[inv_id]['max_power'] = max(inverter_stats[inv_id]['max_power'], peak)
+        inverter_stats[inv_id]['total_power'] += ac_power * seconds
+        if has_dc:
+            inverter_stats[inv_id]['total_dc'] += dc_power * seconds
+            inverter_stats[inv_id]['total_ac'] += ac_power * seconds
+        inverter_stats[inv_id]['seconds'] += seconds
+        
+        # Physical inverters behind a Home Assistant site reading
+        for unit in reading.get('inverters') or []:
+            unit_key = (inv_id, unit.get('index'))
+            if unit_key not in inverter_stats:
+                inverter_stats[unit_key] = {
+                    'total_energy': 0,
+                    'max_power': 0,
+                    'total_power': 0,
+                    'total_dc': 0,
+                    'total_ac': 0,
+                    'seconds': 0
+                }
+            unit_power = unit.get('ac_power', 0) or 0
+            inverter_stats[unit_key]['total_energy'] = max(inverter_stats[unit_key]['total_energy'], unit.get('energy_today', 0) or 0)
+            inverter_stats[unit_key]['max_power'] = max(inverter_stats[unit_key]['max_power'], unit.get('peak_ac_power') or unit_power)
+            inverter_stats[unit_key]['total_power'] += unit_power * seconds
+            inverter_stats[unit_key]['seconds'] += seconds
         # Note: total_production will be set to total_solar_energy below
     
     # Use calculated solar energy from trapezoidal integration instead of energy_today
@@ -909,21 +1343,23 @@ async def get_period_statistics(period: str = "today", start_date: Optional[str]
     
     # Calculate previous period's production for comparison
     prev_solar_energy = 0
-    for i, reading in enumerate(prev_readings):
-        if i < len(prev_readings) - 1:
-            next_reading = prev_readings[i + 1]
+    previous_readings = {}
+    for reading in prev_readings:
+        previous = previous_readings.get(reading.get('inverter_id'))
+        previous_readings[reading.get('inverter_id')] = reading
+        if previous is not None:
+            previous_time = datetime.fromisoformat(previous['timestamp'])
             current_time = datetime.fromisoformat(reading['timestamp'])
-            next_time = datetime.fromisoformat(next_reading['timestamp'])
-            delta_hours = (next_time - current_time).total_seconds() / 3600
+            delta_hours = (current_time - previous_time).total_seconds() / 3600
             
-            avg_solar = ((reading.get('ac_power', 0) or 0) + (next_reading.get('ac_power', 0) or 0)) / 2
+            avg_solar = ((previous.get('ac_power', 0) or 0) + (reading.get('ac_power', 0) or 0)) / 2
             prev_solar_energy += avg_solar * delta_hours / 1000
     
     production_change = ((total_production - prev_solar_energy) / prev_solar_energy * 100) if prev_solar_energy > 0 else 0
     
-    avg_power = total_power / count if count > 0 else 0
+    avg_power = total_power / total_seconds if total_seconds > 0 else 0
     avg_efficiency = (total_ac_power / total_dc_power * 100) if total_dc_power > 0 else 0
-    runtime_hours = (count * 5) / 3600 if count > 0 else 0
+    runtime_hours = total_seconds / 3600
     
     inverter_comparison = []
     for inv in inverters:
@@ -934,10 +1370,24 @@ async def get_period_statistics(period: str = "today", start_date: Optional[str]
                 'name': inv['name'],
                 'brand': inv['brand'],
                 'total_energy': stats['total_energy'],
-                'avg_power': stats['total_power'] / stats['count'] if stats['count'] > 0 else 0,
+                'avg_power': stats['total_power'] / stats['seconds'] if stats['seconds'] > 0 else 0,
                 'max_power': stats['max_power'],
                 'efficiency': (stats['total_ac'] / stats['total_dc'] * 100) if stats['total_dc'] > 0 else 0,
-                'runtime_hours': (stats['count'] * 5) / 3600
+                'runtime_hours': stats['seconds'] / 3600
+            })
+        
+        # One entry per physical inverter for Home Assistant sites
+        unit_keys = sorted(key for key in inverter_stats if isinstance(key, tuple) and key[0] == inv_id)
+        for unit_key in unit_keys:
+            stats = inverter_stats[unit_key]
+            inverter_comparison.append({
+                'name': f"{inv['name']} - Onduleur {unit_key[1]}",
+                'brand': inv['brand'],
+                'total_energy': stats['total_energy'],
+                'avg_power': stats['total_power'] / stats['seconds'] if stats['seconds'] > 0 else 0,
+                'max_power': stats['max_power'],
+                'efficiency': 0,  # No DC data from Home Assistant
+                'runtime_hours': stats['seconds'] / 3600
             })
     
     # Prepare chart data with intelligent sampling
@@ -1088,7 +1538,7 @@ async def get_inverter_mode():
     """Get current inverter reading mode (SIMULATION or REAL)"""
     return {
         "mode": INVERTER_MODE,
-        "description": "SIMULATION: Données aléatoires pour tests | REAL: Lecture réelle des onduleurs connectés"
+        "description": "SIMULATION: Données aléatoires pour tests | REAL: Lecture réelle des onduleurs connectés | HOME_ASSISTANT: Lecture via Home Assistant | SOLAR_ASSISTANT_MQTT: Données poussées par Solar Assistant (MQTT)"
     }
 
 @api_router.put("/system/inverter-mode")
@@ -1100,12 +1550,18 @@ async def set_inverter_mode(mode: str):
     global INVERTER_MODE
     
     mode = mode.upper()
-    if mode not in ['SIMULATION', 'REAL']:
-        raise HTTPException(status_code=400, detail="Mode must be 'SIMULATION' or 'REAL'")
+    if mode not in ['SIMULATION', 'REAL', 'SOLAR_ASSISTANT_MQTT']:
+        raise HTTPException(status_code=400, detail="Mode must be 'SIMULATION', 'REAL' or 'SOLAR_ASSISTANT_MQTT'")
     
     INVERTER_MODE = mode
     logger.info(f"🔧 Mode onduleurs changé: {INVERTER_MODE}")
     
+    # Connect the broker saved through the API if the client is not running yet
+    if mode == 'SOLAR_ASSISTANT_MQTT' and not get_mqtt_client():
+        sa_config = await db.solar_assistant_config.find_one({}, {"_id": 0})
+        if sa_config:
+            start_solar_assistant_from_config(sa_config)
+    
     return {
         "message": f"Mode changé en {INVERTER_MODE}",
         "note": "Pour rendre permanent, mettez à jour INVERTER_MODE dans /app/backend/.env"
@@ -1124,7 +1580,15 @@ app.add_middleware(
 
 @app.on_event("startup")
 async def startup_event():
+    global main_loop
     logger.info("Starting Solar Monitoring API with Home Assistant & Weather...")
+    main_loop = asyncio.get_running_loop()
+    
+    # Unique (inverter_id, timestamp) index: fast latest-reading lookups, idempotent imports
+    try:
+        await ensure_readings_index(db)
+    except Exception as e:
+        logger.error(f"Error creating readings index: {e}")
     
     # Initialize Weather Service
     weather_api_key = os.environ.get('WEATHER_API_KEY', '')
@@ -1136,6 +1600,7 @@ async def startup_event():
     if HA_URL and HA_TOKEN:
         logger.info("🏠 Initializing Home Assistant connection...")
         success = initialize_ha_reader(HA_URL, HA_TOKEN)
+        initialize_ha_sync(db, HA_URL, HA_TOKEN)
         if success:
             logger.info("✅ Home Assistant initialized successfully")
         else:
@@ -1143,8 +1608,19 @@ async def startup_event():
     else:
         logger.info("ℹ️ Home Assistant not configured (will use SIMULATION mode)")
     
-    # Auto-discover physical inverters only if not in HOME_ASSISTANT mode
-    if INVERTER_MODE != 'HOME_ASSISTANT':
+    # Initialize Solar Assistant MQTT (broker settings saved through the API take precedence)
+    if INVERTER_MODE == 'SOLAR_ASSISTANT_MQTT':
+        sa_config = await db.solar_assistant_config.find_one({}, {"_id": 0})
+        if sa_config:
+            start_solar_assistant_from_config(sa_config)
+        elif SA_MQTT_HOST:
+            start_solar_assistant_mqtt(SA_MQTT_HOST, SA_MQTT_PORT, SA_MQTT_USERNAME, SA_MQTT_PASSWORD,
+                                       client_id=SA_MQTT_CLIENT_ID, qos=SA_MQTT_QOS)
+        else:
+            logger.warning("⚠️ SOLAR_ASSISTANT_MQTT mode enabled but no broker configured")
+    
+    # Auto-discover physical inverters only in SIMULATION/REAL modes
+    if INVERTER_MODE not in ('HOME_ASSISTANT', 'SOLAR_ASSISTANT_MQTT'):
         logger.info("🔍 Starting automatic inverter discovery...")
         try:
             discovered = auto_discover_inverters()
@@ -1171,10 +1647,18 @@ async def startup_event():
         except Exception as e:
             logger.error(f"Error during auto-discovery: {e}")
     else:
-        logger.info("ℹ️ Skipping physical inverter discovery (HOME_ASSISTANT mode)")
+        logger.info(f"ℹ️ Skipping physical inverter discovery ({INVERTER_MODE} mode)")
     
     # Start background scheduler for reading collection
-    scheduler.add_job(collect_readings, 'interval', seconds=5)
+    scheduler.add_job(collect_readings, 'interval', seconds=READING_INTERVAL_SECONDS)
+    
+    # Home Assistant history sync: at startup (gap since last run) then periodically
+    if INVERTER_MODE == 'HOME_ASSISTANT':
+        scheduler.add_job(
+            sync_home_assistant_history, 'interval',
+            minutes=HA_SYNC_INTERVAL_MINUTES,
+            next_run_time=datetime.now()
+        )
     scheduler.start()
     
     logger.info("✅ Scheduler started - collecting readings every 5 seconds")
@@ -1183,5 +1667,8 @@ async def startup_event():
 async def shutdown_db_client():
     scheduler.shutdown()
     close_all_connections()  # Fermer connexions onduleurs
+    mqtt_client = get_mqtt_client()
+    if mqtt_client:
+        mqtt_client.disconnect()
     client.close()
     logger.info("Application shutdown complete")
\ No newline at end of file
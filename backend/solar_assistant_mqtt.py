@@ -4,19 +4,63 @@ Connexion directe à Solar Assistant via MQTT (sans Home Assistant)
 """
 
 import paho.mqtt.client as mqtt
-import json
+import asyncio
 import logging
-from typing import Dict, Any, Optional, Callable
+import random
+import socket
+import sys
+import threading
+import uuid
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Callable, Tuple
 import time
-from threading import Lock
 
 logger = logging.getLogger(__name__)
 
+# Metrics published by Solar Assistant, in slot order. Other metrics get a
+# slot the first time they are seen.
+KNOWN_METRICS = (
+    'pv_power', 'battery_power', 'battery_voltage', 'battery_current',
+    'battery_state_of_charge', 'grid_power', 'grid_voltage', 'grid_frequency',
+    'load_power', 'load_apparent_power', 'temperature', 'total_energy'
+)
+
+# Site aggregate: summed metrics and metrics averaged over the inverters
+# reporting them (all part of KNOWN_METRICS)
+AGGREGATE_SUM_METRICS = (
+    'pv_power', 'battery_power', 'grid_power', 'load_power',
+    'load_apparent_power', 'total_energy'
+)
+AGGREGATE_AVERAGE_METRICS = (
+    'battery_voltage', 'battery_current', 'battery_state_of_charge',
+    'grid_voltage', 'grid_frequency', 'temperature'
+)
+
+# Inverters silent for longer than this are excluded from the site aggregate
+STALE_AFTER_SECONDS = 60.0
+
+# Metrics whose high-rate samples are kept in a ring buffer and collapsed into
+# mean/min/max (+ energy integral for power metrics) at each emitted reading
+POWER_METRICS = ('pv_power', 'battery_power', 'grid_power', 'load_power')
+WINDOW_METRICS = POWER_METRICS + ('battery_current',)
+
+# Samples kept per inverter and metric between two emitted readings
+RING_BUFFER_SIZE = 1024
+
+# Reconnection backoff: the cap doubles from base to max delay, and the actual
+# wait is drawn in [cap / 2, cap] so several clients do not retry in lockstep
+RECONNECT_BASE_DELAY = 1.0
+RECONNECT_MAX_DELAY = 120.0
+
+# Marker for topics not resolved yet in the topic cache
+_UNRESOLVED = object()
+
 
 class SolarAssistantMQTT:
     """Client MQTT pour Solar Assistant"""
     
-    def __init__(self, broker_host: str, broker_port: int = 1883, username: str = None, password: str = None):
+    def __init__(self, broker_host: str, broker_port: int = 1883, username: str = None, password: str = None,
+                 client_id: Optional[str] = None, clean_session: Optional[bool] = None, qos: int = 1):
         """
         Initialize Solar Assistant MQTT client
         
@@ -25,21 +69,81 @@ class SolarAssistantMQTT:
             broker_port: MQTT port (default: 1883)
             username: MQTT username (optional)
             password: MQTT password (optional)
+            client_id: Stable client ID (default: unique per instance)
+            clean_session: Discard the broker session on connect (default:
+                persistent session only with an explicit, stable client_id)
+            qos: Subscription QoS (1 lets the broker redeliver during blips)
         """
         self.broker_host = broker_host
         self.broker_port = broker_port
         self.username = username
         self.password = password
         
-        self.client = mqtt.Client(client_id="solar_monitor_app")
+        # A fixed ID made two app instances kick each other off the broker
+        self.client_id = client_id or f"solar_monitor_{socket.gethostname()}_{uuid.uuid4().hex[:8]}"
+        self.clean_session = clean_session if clean_session is not None else client_id is None
+        self.qos = qos
+        
+        self.client = mqtt.Client(client_id=self.client_id, clean_session=self.clean_session)
         self.connected = False
-        self.data_lock = Lock()
-        self.latest_data: Dict[str, Any] = {}
+        self.connected_event = threading.Event()
+        
+        # Connection state and metrics (written by the MQTT network thread)
+        self.state = "disconnected"
+        self.connect_count = 0
+        self.disconnect_count = 0
+        self.connect_failures = 0
+        self.reconnect_attempt = 0
+        self.next_retry_at: Optional[float] = None
+        self.connected_since: Optional[float] = None
+        self.last_disconnect_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.session_present = False
+        self.messages_received = 0
+        
+        # Decoding fast path. All the structures below are written only by
+        # the MQTT network thread, holding data_lock; the reading side
+        # (emit_reading on the scheduler thread) takes it too, so it never
+        # sees a half-applied delta or rebuild.
+        self.data_lock = threading.RLock()
+        # - metric name (interned) -> slot index
+        self.metric_slots: Dict[str, int] = {sys.intern(name): index for index, name in enumerate(KNOWN_METRICS)}
+        self.metric_names: List[str] = list(self.metric_slots)
+        # - inverter ID -> preallocated slot array (one value per metric)
+        self.inverter_slots: Dict[str, List[Any]] = {}
+        self.last_update: Dict[str, float] = {}
+        # - topic -> (inverter ID, slot array, slot index, ring buffer, aggregated), None for ignored topics
+        self.topic_cache: Dict[str, Optional[Tuple[str, List[Any], int, Optional[deque], bool]]] = {}
+        # Site aggregate, maintained incrementally: per metric slot, the sum
+        # of the values of active inverters and how many contribute to it.
+        # Active inverters are kept in publication order (oldest first) so
+        # stale ones are found at the front.
+        self.aggregate_slots = frozenset(
+            self.metric_slots[metric] for metric in AGGREGATE_SUM_METRICS + AGGREGATE_AVERAGE_METRICS
+        )
+        self.metric_totals: List[float] = [0.0] * len(KNOWN_METRICS)
+        self.metric_counts: List[int] = [0] * len(KNOWN_METRICS)
+        self.active_inverters: "OrderedDict[str, float]" = OrderedDict()
+        self.last_message_time = 0.0
+        self.stale_after = STALE_AFTER_SECONDS
+        # - (inverter ID, metric) -> ring buffer of (time, value) samples; the
+        #   reading side pops from the left, the MQTT thread appends
+        self.ring_buffers: Dict[Tuple[str, str], deque] = {}
+        # Last value before the current window, owned by the reading side
+        self.window_carry: Dict[Tuple[str, str], float] = {}
+        self.window_start = time.time()
+        
+        # Event-driven ingestion: called (from the MQTT thread) when a new
+        # reading should be emitted, at most once per emit_interval seconds
+        self.on_update: Optional[Callable[[], None]] = None
+        self.emit_interval = 5.0
+        self.last_emit = 0.0
         
         # Setup callbacks
         self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
         self.client.on_disconnect = self._on_disconnect
+        self.client.on_connect_fail = self._on_connect_fail
         
         if username and password:
             self.client.username_pw_set(username, password)
@@ -48,12 +152,21 @@ class SolarAssistantMQTT:
         """Callback when connected to MQTT broker"""
         if rc == 0:
             self.connected = True
-            logger.info(f"✅ Connected to Solar Assistant MQTT broker at {self.broker_host}")
+            self.state = "connected"
+            self.connect_count += 1
+            self.reconnect_attempt = 0
+            self.next_retry_at = None
+            self.connected_since = time.time()
+            self.session_present = bool(flags.get('session present'))
+            self.connected_event.set()
+            logger.info(f"✅ Connected to Solar Assistant MQTT broker at {self.broker_host} "
+                        f"(client_id={self.client_id}, session_present={self.session_present})")
             
-            # Subscribe to all Solar Assistant topics
+            # Subscribe to all Solar Assistant topics (again after a reconnect,
+            # the broker may not have kept the session)
             # Pattern: solar_assistant/#
-            self.client.subscribe("solar_assistant/#")
-            logger.info("📡 Subscribed to solar_assistant/# topics")
+            self.client.subscribe("solar_assistant/#", qos=self.qos)
+            logger.info(f"📡 Subscribed to solar_assistant/# topics (QoS {self.qos})")
         else:
             self.connected = False
             error_messages = {
@@ -63,85 +176,262 @@ class SolarAssistantMQTT:
                 4: "Connection refused - bad username or password",
                 5: "Connection refused - not authorized"
             }
-            logger.error(f"❌ Failed to connect: {error_messages.get(rc, f'Unknown error {rc}')}")
+            self.last_error = error_messages.get(rc, f'Unknown error {rc}')
+            logger.error(f"❌ Failed to connect: {self.last_error}")
+    
+    def _resolve_topic(self, topic: str) -> Optional[Tuple[str, List[Any], int, Optional[deque], bool]]:
+        """
+        Resolve a topic to its inverter slot array and metric slot (slow path)
+        
+        Example: solar_assistant/inverter_1/pv_power/state -> inverter_1, pv_power
+        """
+        parts = topic.split('/')
+        if len(parts) < 3 or parts[0] != 'solar_assistant':
+            return None
+        
+        inverter_id = sys.intern(parts[1])  # e.g., inverter_1
+        metric = sys.intern(parts[2])       # e.g., pv_power
+        
+        index = self.metric_slots.get(metric)
+        if index is None:
+            index = len(self.metric_names)
+            self.metric_names.append(metric)
+            self.metric_slots[metric] = index
+        
+        slots = self.inverter_slots.get(inverter_id)
+        if slots is None:
+            slots = [None] * len(self.metric_names)
+            self.inverter_slots[inverter_id] = slots
+        
+        ring = None
+        if metric in WINDOW_METRICS:
+            ring = deque(maxlen=RING_BUFFER_SIZE)
+            self.ring_buffers[(inverter_id, metric)] = ring
+        
+        return inverter_id, slots, index, ring, index in self.aggregate_slots
     
     def _on_message(self, client, userdata, msg):
         """Callback when message received"""
         try:
-            topic = msg.topic
-            payload = msg.payload.decode('utf-8')
+            # float() parses the payload bytes directly, text is decoded only if needed
+            payload = msg.payload
+            try:
+                value = float(payload)
+            except ValueError:
+                value = payload.decode('utf-8', errors='replace')
             
-            # Parse topic
-            # Example: solar_assistant/inverter_1/pv_power
-            parts = topic.split('/')
-            
-            if len(parts) >= 3 and parts[0] == 'solar_assistant':
-                inverter_id = parts[1]  # e.g., inverter_1
-                metric = parts[2]        # e.g., pv_power
+            topic = msg.topic
+            with self.data_lock:
+                target = self.topic_cache.get(topic, _UNRESOLVED)
+                if target is _UNRESOLVED:
+                    target = self._resolve_topic(topic)
+                    self.topic_cache[topic] = target
+                if target is None:
+                    return
                 
-                # Try to convert to float
-                try:
-                    value = float(payload)
-                except ValueError:
-                    value = payload
+                inverter_id, slots, index, ring, aggregated = target
                 
-                # Store data
-                with self.data_lock:
-                    if inverter_id not in self.latest_data:
-                        self.latest_data[inverter_id] = {}
-                    
-                    self.latest_data[inverter_id][metric] = value
-                    self.latest_data[inverter_id]['last_update'] = time.time()
+                if index >= len(slots):
+                    # Metric registered after this inverter's array was allocated
+                    slots.extend([None] * (index + 1 - len(slots)))
+                now = time.time()
+                self.messages_received += 1
+                previous = slots[index]
+                slots[index] = value
+                self.last_update[inverter_id] = now
+                self.last_message_time = now
+                if ring is not None and value.__class__ is float:
+                    ring.append((now, value))
                 
-                logger.debug(f"📊 {topic} = {value}")
+                active = self.active_inverters
+                if inverter_id in active:
+                    active[inverter_id] = now
+                    active.move_to_end(inverter_id)
+                    if aggregated:
+                        self._apply_delta(index, previous, value)
+                else:
+                    active[inverter_id] = now
+                    self._rebuild_aggregate()
+                self._expire_stale_inverters(now)
+            
+            self._notify_update()
         
         except Exception as e:
             logger.error(f"Error processing message from {msg.topic}: {e}")
     
+    def _apply_delta(self, index: int, previous: Any, value: Any):
+        """Replace an inverter's contribution to a metric total (O(1))"""
+        totals = self.metric_totals
+        counts = self.metric_counts
+        if previous.__class__ is float:
+            totals[index] -= previous
+            counts[index] -= 1
+        if value.__class__ is float:
+            totals[index] += value
+            counts[index] += 1
+        if counts[index] == 0:
+            # Drop accumulated rounding error when nobody reports the metric
+            totals[index] = 0.0
+    
+    def _rebuild_aggregate(self):
+        """
+        Recompute the totals from the active inverters
+        
+        Only needed when an inverter joins or leaves the aggregate, which
+        also discards the rounding error accumulated by the deltas.
+        """
+        totals = [0.0] * len(KNOWN_METRICS)
+        counts = [0] * len(KNOWN_METRICS)
+        for inverter_id in self.active_inverters:
+            slots = self.inverter_slots.get(inverter_id, ())
+            for index in self.aggregate_slots:
+                value = slots[index] if index < len(slots) else None
+                if value.__class__ is float:
+                    totals[index] += value
+                    counts[index] += 1
+        self.metric_totals = totals
+        self.metric_counts = counts
+    
+    def _expire_stale_inverters(self, now: float):
+        """Remove inverters that stopped publishing from the aggregate"""
+        active = self.active_inverters
+        expired = False
+        while active:
+            inverter_id = next(iter(active))
+            if now - active[inverter_id] < self.stale_after:
+                break
+            del active[inverter_id]
+            expired = True
+            logger.warning(f"⚠️ {inverter_id} silent for {self.stale_after:.0f}s, excluded from aggregate")
+        if expired:
+            self._rebuild_aggregate()
+    
+    def _notify_update(self):
+        """Trigger on_update if the emit interval has elapsed"""
+        if self.on_update is None:
+            return
+        
+        now = time.time()
+        if now - self.last_emit < self.emit_interval:
+            return
+        self.last_emit = now
+        
+        try:
+            self.on_update()
+        except Exception as e:
+            logger.error(f"Error in MQTT update callback: {e}")
+    
     def _on_disconnect(self, client, userdata, rc):
         """Callback when disconnected"""
+        was_connected = self.connected
         self.connected = False
+        self.connected_event.clear()
+        if was_connected:
+            self.disconnect_count += 1
+            self.last_disconnect_at = time.time()
+            self.connected_since = None
         if rc != 0:
             logger.warning(f"⚠️ Unexpected disconnection from MQTT broker (rc={rc})")
+            if was_connected:
+                self.last_error = f"Connection lost (rc={rc})"
+            self._schedule_reconnect()
         else:
+            self.state = "disconnected"
             logger.info("Disconnected from MQTT broker")
     
+    def _on_connect_fail(self, client, userdata):
+        """Callback when the TCP connection to the broker could not be opened"""
+        self.connect_failures += 1
+        self.last_error = f"Broker {self.broker_host}:{self.broker_port} unreachable"
+        self._schedule_reconnect()
+    
+    def _schedule_reconnect(self):
+        """
+        Set the delay before the next reconnection attempt
+        
+        paho waits for its reconnect delay right after the disconnect/connect
+        failure callbacks, so pinning min and max delay to the jittered value
+        makes it use our schedule instead of its plain doubling.
+        """
+        self.reconnect_attempt += 1
+        cap = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** (self.reconnect_attempt - 1))
+        delay = random.uniform(cap / 2, cap)
+        self.client.reconnect_delay_set(min_delay=delay, max_delay=delay)
+        self.next_retry_at = time.time() + delay
+        self.state = "reconnecting"
+        logger.info(f"🔁 Reconnecting to {self.broker_host} in {delay:.1f}s (attempt {self.reconnect_attempt})")
+    
     def connect(self) -> bool:
         """
-        Connect to Solar Assistant MQTT broker
+        Start the MQTT session (non-blocking)
+        
+        The connection is opened by the network thread, which keeps
+        reconnecting with backoff until disconnect() is called. Use
+        wait_connected() to wait for the first connection.
         
         Returns:
-            True if connection successful, False otherwise
+            True if the session was started, False on invalid settings
         """
         try:
             logger.info(f"🔌 Connecting to Solar Assistant at {self.broker_host}:{self.broker_port}...")
-            self.client.connect(self.broker_host, self.broker_port, keepalive=60)
+            self.state = "connecting"
+            self.client.connect_async(self.broker_host, self.broker_port, keepalive=60)
             self.client.loop_start()
-            
-            # Wait for connection (max 5 seconds)
-            for _ in range(50):
-                if self.connected:
-                    return True
-                time.sleep(0.1)
-            
-            logger.error("Connection timeout")
-            return False
+            return True
             
         except Exception as e:
+            self.state = "disconnected"
+            self.last_error = str(e)
             logger.error(f"❌ Error connecting to Solar Assistant: {e}")
             return False
     
+    async def wait_connected(self, timeout: float = 5.0) -> bool:
+        """
+        Wait for the session to be connected without blocking the event loop
+        
+        Args:
+            timeout: Maximum wait in seconds
+            
+        Returns:
+            True if connected within the timeout
+        """
+        return await asyncio.to_thread(self.connected_event.wait, timeout)
+    
     def disconnect(self):
         """Disconnect from MQTT broker"""
-        self.client.loop_stop()
         self.client.disconnect()
+        self.client.loop_stop()
         self.connected = False
+        self.connected_event.clear()
+        self.state = "disconnected"
+        self.next_retry_at = None
         logger.info("Disconnected from Solar Assistant")
     
     def is_connected(self) -> bool:
         """Check if connected to MQTT broker"""
         return self.connected
     
+    def get_connection_status(self) -> Dict[str, Any]:
+        """Get session state and connection metrics"""
+        now = time.time()
+        return {
+            "state": self.state,
+            "broker": f"{self.broker_host}:{self.broker_port}",
+            "client_id": self.client_id,
+            "clean_session": self.clean_session,
+            "qos": self.qos,
+            "session_present": self.session_present,
+            "connects": self.connect_count,
+            "disconnects": self.disconnect_count,
+            "connect_failures": self.connect_failures,
+            "reconnect_attempt": self.reconnect_attempt,
+            "retry_in_seconds": round(max(0.0, self.next_retry_at - now), 1) if self.next_retry_at else None,
+            "connected_for_seconds": round(now - self.connected_since, 1) if self.connected_since else None,
+            "last_disconnect_at": self.last_disconnect_at,
+            "last_error": self.last_error,
+            "messages_received": self.messages_received
+        }
+    
     def get_latest_data(self, inverter_id: str = "inverter_1") -> Dict[str, Any]:
         """
         Get latest data for a specific inverter
@@ -153,88 +443,170 @@ class SolarAssistantMQTT:
             Dictionary with latest metrics
         """
         with self.data_lock:
-            return self.latest_data.get(inverter_id, {}).copy()
+            slots = self.inverter_slots.get(inverter_id)
+            if slots is None:
+                return {}
+            
+            names = self.metric_names
+            data = {names[index]: value for index, value in enumerate(slots) if value is not None}
+            data['last_update'] = self.last_update.get(inverter_id)
+        return data
     
     def get_all_data(self) -> Dict[str, Dict[str, Any]]:
         """Get data for all inverters"""
-        with self.data_lock:
-            return self.latest_data.copy()
+        return {inverter_id: self.get_latest_data(inverter_id) for inverter_id in list(self.inverter_slots)}
     
     def get_aggregated_data(self) -> Dict[str, Any]:
         """
         Get aggregated data from all inverters
         
+        Sums and averages are maintained as messages arrive, so this is
+        O(1) in the number of inverters and messages. Inverters silent for
+        more than stale_after seconds are excluded.
+        
         Returns:
             Dictionary with total/average values
         """
         with self.data_lock:
-            all_data = self.latest_data.copy()
-        
-        if not all_data:
-            return {}
-        
-        # Aggregate common metrics
-        aggregated = {
-            'pv_power': 0.0,
-            'battery_power': 0.0,
-            'battery_voltage': 0.0,
-            'battery_current': 0.0,
-            'battery_state_of_charge': 0.0,
-            'grid_power': 0.0,
-            'grid_voltage': 0.0,
-            'grid_frequency': 0.0,
-            'load_power': 0.0,
-            'load_apparent_power': 0.0,
-            'temperature': 0.0,
-            'total_energy': 0.0,
-            'inverter_count': 0
-        }
+            inverter_count = len(self.active_inverters)
+            if inverter_count == 0 or time.time() - self.last_message_time >= self.stale_after:
+                # Stale inverters are expired on the next message; when every
+                # inverter went silent there is no next message
+                return {}
+            
+            totals = list(self.metric_totals)
+            counts = list(self.metric_counts)
+        slots = self.metric_slots
         
-        for inverter_id, data in all_data.items():
-            if not data:
-                continue
+        aggregated: Dict[str, Any] = {'inverter_count': inverter_count}
+        for metric in AGGREGATE_SUM_METRICS:
+            aggregated[metric] = totals[slots[metric]]
+        for metric in AGGREGATE_AVERAGE_METRICS:
+            index = slots[metric]
+            aggregated[metric] = totals[index] / counts[index] if counts[index] else 0.0
+        
+        return aggregated
+    
+    def collapse_windows(self, now: Optional[float] = None) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """
+        Collapse the samples received since the last call into window statistics
+        
+        Values are time-weighted: each sample holds until the next one, and the
+        last value of the previous window holds until the first new sample.
+        Inverters excluded from the site aggregate (stale) are skipped and
+        their samples and carried value dropped, so the window means add up
+        to the same site as get_aggregated_data().
+        
+        Args:
+            now: End of the window (default: current time)
+            
+        Returns:
+            {inverter_id: {metric: {"mean", "min", "max", "samples"[, "energy_wh"]}}}
+        """
+        with self.data_lock:
+            end = now if now is not None else time.time()
+            start = self.window_start
+            self.window_start = end
+            duration = end - start
+            
+            windows: Dict[str, Dict[str, Dict[str, float]]] = {}
+            if duration <= 0:
+                return windows
+            
+            for (inverter_id, metric), ring in list(self.ring_buffers.items()):
+                key = (inverter_id, metric)
+                if inverter_id not in self.active_inverters or end - self.last_update.get(inverter_id, 0.0) >= self.stale_after:
+                    # A returning inverter starts a fresh window
+                    self.window_carry.pop(key, None)
+                    while ring and ring[0][0] < end:
+                        ring.popleft()
+                    continue
+                
+                current = self.window_carry.get(key)
+                current_time = start
+                integral = 0.0
+                covered = 0.0
+                samples = 0
+                low = high = current
                 
-            aggregated['inverter_count'] += 1
+                while ring and ring[0][0] < end:
+                    sample_time, value = ring.popleft()
+                    sample_time = max(sample_time, start)
+                    if current is not None:
+                        integral += current * (sample_time - current_time)
+                        covered += sample_time - current_time
+                    current = value
+                    current_time = sample_time
+                    samples += 1
+                    low = value if low is None else min(low, value)
+                    high = value if high is None else max(high, value)
+                
+                if current is None:
+                    continue
+                integral += current * (end - current_time)
+                covered += end - current_time
+                self.window_carry[key] = current
+                
+                stats = {
+                    "mean": integral / covered if covered > 0 else current,
+                    "min": low,
+                    "max": high,
+                    "samples": samples
+                }
+                if metric in POWER_METRICS:
+                    stats["energy_wh"] = integral / 3600.0
+                windows.setdefault(inverter_id, {})[metric] = stats
+            
+            return windows
+    
+    def emit_reading(self, battery_capacity_kwh: float = 27.2) -> Optional[Dict[str, Any]]:
+        """
+        Build the reading of the current emit interval
+        
+        Power values are the time-weighted means of the interval (site total),
+        interval_seconds is its length, and the per-inverter mean/min/max/energy
+        statistics are attached under "window", so short spikes between two
+        readings are not lost.
+        
+        Args:
+            battery_capacity_kwh: Battery capacity in kWh
             
-            # Sum power values
-            aggregated['pv_power'] += data.get('pv_power', 0.0)
-            aggregated['battery_power'] += data.get('battery_power', 0.0)
-            aggregated['grid_power'] += data.get('grid_power', 0.0)
-            aggregated['load_power'] += data.get('load_power', 0.0)
-            aggregated['load_apparent_power'] += data.get('load_apparent_power', 0.0)
-            aggregated['total_energy'] += data.get('total_energy', 0.0)
+        Returns:
+            Dictionary compatible with InverterReading model, or None
+        """
+        with self.data_lock:
+            # Aggregate and windows of the same messages
+            data = self.get_aggregated_data()
+            if not data:
+                return None
             
-            # Average for voltage/frequency/temperature
-            aggregated['battery_voltage'] += data.get('battery_voltage', 0.0)
-            aggregated['battery_current'] += data.get('battery_current', 0.0)
-            aggregated['battery_state_of_charge'] += data.get('battery_state_of_charge', 0.0)
-            aggregated['grid_voltage'] += data.get('grid_voltage', 0.0)
-            aggregated['grid_frequency'] += data.get('grid_frequency', 0.0)
-            aggregated['temperature'] += data.get('temperature', 0.0)
-        
-        # Calculate averages
-        if aggregated['inverter_count'] > 0:
-            count = aggregated['inverter_count']
-            aggregated['battery_voltage'] /= count
-            aggregated['battery_current'] /= count
-            aggregated['battery_state_of_charge'] /= count
-            aggregated['grid_voltage'] /= count
-            aggregated['grid_frequency'] /= count
-            aggregated['temperature'] /= count
+            window_start = self.window_start
+            windows = self.collapse_windows()
         
-        return aggregated
+        for metric in POWER_METRICS:
+            means = [stats[metric]["mean"] for stats in windows.values() if metric in stats]
+            if means:
+                data[metric] = sum(means)
+        
+        reading = self.map_to_inverter_reading(battery_capacity_kwh, data)
+        reading["interval_seconds"] = self.window_start - window_start
+        if windows:
+            reading["window"] = windows
+        return reading
     
-    def map_to_inverter_reading(self, battery_capacity_kwh: float = 27.2) -> Dict[str, Any]:
+    def map_to_inverter_reading(self, battery_capacity_kwh: float = 27.2, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Map Solar Assistant data to InverterReading format
         
         Args:
             battery_capacity_kwh: Battery capacity in kWh
+            data: Aggregated data (default: latest values from get_aggregated_data)
             
         Returns:
             Dictionary compatible with InverterReading model
         """
-        data = self.get_aggregated_data()
+        if data is None:
+            data = self.get_aggregated_data()
         
         if not data:
             return None
@@ -258,6 +630,7 @@ class SolarAssistantMQTT:
             "grid_power": data.get('grid_power', 0.0),
             "grid_voltage": data.get('grid_voltage', 230.0),
             "grid_frequency": data.get('grid_frequency', 50.0),
+            "load_power": data.get('load_power', 0.0),
             "temperature": data.get('temperature', 45.0),
             "status": "ok"
         }
@@ -269,30 +642,49 @@ class SolarAssistantMQTT:
 mqtt_client: Optional[SolarAssistantMQTT] = None
 
 
-def initialize_mqtt_client(host: str, port: int = 1883, username: str = None, password: str = None) -> bool:
+def initialize_mqtt_client(host: str, port: int = 1883, username: str = None, password: str = None,
+                           on_update: Optional[Callable[[], None]] = None, client_id: Optional[str] = None,
+                           clean_session: Optional[bool] = None, qos: int = 1) -> bool:
     """
     Initialize global MQTT client for Solar Assistant
     
+    The session is started without waiting for the broker; it keeps
+    reconnecting in the background (see SolarAssistantMQTT.wait_connected).
+    
     Args:
         host: Solar Assistant IP address
         port: MQTT port
         username: MQTT username (optional)
         password: MQTT password (optional)
+        on_update: Callback triggered when a new reading should be emitted
+        client_id: Stable client ID (optional)
+        clean_session: Discard the broker session on connect (optional)
+        qos: Subscription QoS
         
     Returns:
-        True if connected successfully
+        True if the session was started
     """
     global mqtt_client
     
+    # Replace any previous client (broker settings changed)
+    if mqtt_client:
+        try:
+            mqtt_client.disconnect()
+        except Exception as e:
+            logger.debug(f"Error disconnecting previous MQTT client: {e}")
+        mqtt_client = None
+    
     try:
-        mqtt_client = SolarAssistantMQTT(host, port, username, password)
+        mqtt_client = SolarAssistantMQTT(host, port, username, password, client_id, clean_session, qos)
+        mqtt_client.on_update = on_update
         success = mqtt_client.connect()
         
         if success:
             logger.info(f"✅ Solar Assistant MQTT client initialized successfully")
             return True
         else:
-            logger.error(f"❌ Failed to connect to Solar Assistant MQTT")
+            logger.error(f"❌ Failed to start Solar Assistant MQTT session")
+            mqtt_client.disconnect()
             mqtt_client = None
             return False
             
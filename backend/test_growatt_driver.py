@@ -0,0 +1,91 @@
+"""
+Tests of the GROWATT driver polling tiers
+
+Usage: python -m pytest test_growatt_driver.py
+
+A fake bus serves a register table, so read plans, tiers and the identity
+block are exercised without a serial port.
+"""
+
+import asyncio
+import struct
+
+from growatt_driver import SLOW_TIER_EVERY, GrowattAsyncDriver
+
+CONFIG = {'port': '/dev/fake', 'slave_id': 1}
+
+
+def ascii_registers(address, text):
+    """Registers holding an ASCII string (two characters each)"""
+    data = text.encode('ascii')
+    return {address + index: (data[2 * index] << 8) | data[2 * index + 1] for index in range(len(data) // 2)}
+
+
+REGISTERS = {
+    0: 1, 1: 1200, 2: 800, 3: 3500, 4: 57, 12: 19000, 13: 2301, 14: 82, 15: 5000,
+    53: 412, 60: 123, 62: 5,
+    **ascii_registers(23, 'AB12345678'),
+    28: 0, 29: 6000,
+}
+
+
+class FakeBus:
+    """Serial bus stand-in: holding registers of REGISTERS, optional blocks missing"""
+
+    pipelined = False
+    port = CONFIG['port']
+
+    def __init__(self):
+        self.reads = []
+        self.failing = set()  # First addresses of blocks that time out
+
+    async def read_block(self, slave_id, address, count, table="holding", timeout=None):
+        self.reads.append((address, count))
+        if address in self.failing:
+            raise asyncio.TimeoutError()
+        if address >= 1000:
+            raise asyncio.TimeoutError()  # No battery or grid registers
+        return struct.pack(f'>{count}H', *(REGISTERS.get(address + index, 0) for index in range(count)))
+
+
+def poll(driver, bus):
+    bus.reads.clear()
+    return asyncio.run(driver.read(CONFIG))
+
+
+def new_driver():
+    driver = GrowattAsyncDriver()
+    bus = FakeBus()
+    driver.buses[CONFIG['port']] = bus
+    return driver, bus
+
+
+def test_identity_from_holding_registers():
+    driver, bus = new_driver()
+    record = poll(driver, bus)
+
+    assert record['ac_power'] == 1900.0
+    assert record['energy_total'] == 0.5
+    info = driver.get_device_info(CONFIG)
+    assert info['serial'] == 'AB12345678'
+    assert info['module_code'] == 6000
+
+    # Identity is read once, the fast tier alone every other poll
+    poll(driver, bus)
+    assert bus.reads == [(0, 16), (1000, 3), (2000, 3)]
+
+
+def test_identity_retried_after_failure():
+    driver, bus = new_driver()
+    bus.failing = {23}
+    poll(driver, bus)
+    assert 'serial' not in driver.get_device_info(CONFIG)
+
+    # Not retried on fast polls, retried with the slow tier
+    bus.failing = set()
+    for _ in range(SLOW_TIER_EVERY - 1):
+        poll(driver, bus)
+        assert all(address != 23 for address, _ in bus.reads)
+    poll(driver, bus)
+    assert (23, 7) in bus.reads
+    assert driver.get_device_info(CONFIG)['serial'] == 'AB12345678'
@@ -0,0 +1,67 @@
+"""
+Tests of the GROWATT register maps and read planning
+
+Usage: python -m pytest test_growatt_registers.py
+"""
+
+import pytest
+
+from growatt_registers import (
+    GROWATT_DEFAULT_MAP, IDENTITY_GROUP, REGISTER_MAPS, ReadBlock, RegisterField, get_register_map, plan_reads,
+)
+
+
+def spans(blocks):
+    return [(block.group, block.table, block.address, block.count) for block in blocks]
+
+
+def test_default_map_coalesced():
+    assert spans(plan_reads(GROWATT_DEFAULT_MAP)) == [
+        ('main', 'holding', 0, 63),
+        (IDENTITY_GROUP, 'holding', 23, 7),
+        ('battery', 'holding', 1000, 4),
+        ('grid', 'holding', 2000, 3),
+    ]
+
+
+def test_blocks_split_at_max_count():
+    fields = [RegisterField('ac_power', 0), RegisterField('dc_power', 100), RegisterField('temperature', 130, width=2)]
+
+    assert spans(plan_reads(fields, max_count=125)) == [('main', 'holding', 0, 101), ('main', 'holding', 130, 2)]
+    assert spans(plan_reads(fields, max_count=132)) == [('main', 'holding', 0, 132)]
+
+
+def test_groups_and_tables_read_separately():
+    fields = [
+        RegisterField('battery_soc', 5, group='battery'),
+        RegisterField('ac_power', 3, table='input'),
+        RegisterField('dc_power', 4),
+        RegisterField('battery_voltage', 6, group='battery'),
+    ]
+
+    # Required group first; neighbouring registers of other groups or tables are not merged
+    assert spans(plan_reads(fields)) == [
+        ('main', 'input', 3, 1),
+        ('main', 'holding', 4, 1),
+        ('battery', 'holding', 5, 2),
+    ]
+
+
+def test_overlapping_fields_rejected():
+    with pytest.raises(ValueError):
+        ReadBlock('main', 'holding', [RegisterField('ac_power', 10, width=2), RegisterField('ac_voltage', 11)])
+
+
+def test_unknown_field_rejected():
+    with pytest.raises(ValueError):
+        ReadBlock('main', 'holding', [RegisterField('not_a_metric', 10)])
+
+
+def test_register_map_by_model_prefix(monkeypatch):
+    monkeypatch.setitem(REGISTER_MAPS, 'SPH', GROWATT_DEFAULT_MAP[:1])
+    monkeypatch.setitem(REGISTER_MAPS, 'SPH 10', GROWATT_DEFAULT_MAP[:2])
+
+    assert get_register_map('sph 6000TL3')[0] == 'SPH'
+    assert get_register_map('SPH 10000TL3')[0] == 'SPH 10'
+    assert get_register_map('MIN 3000')[0] == 'default'
+    assert get_register_map(None)[0] == 'default'
@@ -0,0 +1,174 @@
+"""
+Test the Home Assistant long-term statistics import against a local stand-in
+
+Usage: python test_ha_statistics.py
+
+A stand-in Home Assistant WebSocket API answers recorder/statistics_during_period
+with constant hourly means. Rollups and readings are written to a
+throwaway database (MONGO_URL from .env, database <DB_NAME>_test_ha_statistics,
+dropped at the end).
+
+Checks:
+1. the import writes one rollup per hour, inverters combined with the plan,
+   with the peak power of the hour; it also runs as an import job
+2. /api/statistics/period?period=month weights rollups by the hour they
+   cover, and keeps the raw readings of other inverters in the rollup range
+3. raw readings are weighted by the time they stand for (5 s collector
+   readings, 10 s Home Assistant sync rows), on hourly and raw periods
+"""
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import websockets
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from ha_statistics_import import import_statistics
+from ha_sync import HomeAssistantSync
+from script_checks import check, exit_with_summary
+
+logging.basicConfig(level=logging.WARNING)
+load_dotenv(Path(__file__).parent / '.env')
+
+STANDIN_PORT = 8126
+
+# Two inverters and a site battery, constant hourly means
+ENTITY_MAPPING = {
+    "solar_power_inv1": "sensor.pv1_power",
+    "solar_power_inv2": "sensor.pv2_power",
+    "battery_soc": "sensor.battery_soc",
+}
+HOURLY_MEANS = {"sensor.pv1_power": 1000.0, "sensor.pv2_power": 2000.0, "sensor.battery_soc": 80.0}
+HOURLY_MAXIMA = {"sensor.pv1_power": 1500.0, "sensor.pv2_power": 2500.0, "sensor.battery_soc": 85.0}
+
+IMPORT_DAYS = 40
+
+
+async def statistics_standin(websocket, *args):
+    """Authentication, then hourly statistics of the requested entities"""
+    await websocket.send(json.dumps({"type": "auth_required"}))
+    auth = json.loads(await websocket.recv())
+    await websocket.send(json.dumps({"type": "auth_ok" if auth.get("access_token") else "auth_invalid"}))
+
+    async for message in websocket:
+        request = json.loads(message)
+        start = datetime.fromisoformat(request["start_time"])
+        end = datetime.fromisoformat(request["end_time"])
+        result = {}
+        for statistic_id in request["statistic_ids"]:
+            rows = []
+            hour = start
+            while hour < end:
+                rows.append({
+                    "start": hour.timestamp() * 1000,
+                    "mean": HOURLY_MEANS[statistic_id],
+                    "max": HOURLY_MAXIMA[statistic_id],
+                })
+                hour += timedelta(hours=1)
+            result[statistic_id] = rows
+        await websocket.send(json.dumps({"id": request["id"], "type": "result", "success": True, "result": result}))
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db_name = f"{os.environ['DB_NAME']}_test_ha_statistics"
+    await client.drop_database(db_name)
+    db = client[db_name]
+    await db.home_assistant_config.insert_one({"entity_mapping": ENTITY_MAPPING})
+    await db.inverters.insert_many([
+        {"id": "ha-test", "name": "Home Assistant", "brand": "HOME_ASSISTANT"},
+        {"id": "growatt-test", "name": "Garage", "brand": "GROWATT"},
+        {"id": "sync-test", "name": "Cabin", "brand": "HOME_ASSISTANT"},
+    ])
+
+    standin = await websockets.serve(statistics_standin, "127.0.0.1", STANDIN_PORT)
+    try:
+        print(f"📥 Statistics import ({IMPORT_DAYS} days)")
+        report = await import_statistics(db, f"http://127.0.0.1:{STANDIN_PORT}", "token", days=IMPORT_DAYS, chunk_days=15)
+        check(report["status"] == "ok", f"status {report['status']}")
+        check(report["chunks"] == 3, f"{report['chunks']} chunks of 15 days")
+        check(report["hours_written"] == IMPORT_DAYS * 24, f"{report['hours_written']} hours written")
+        rollup = await db.readings_hourly.find_one({"inverter_id": "ha-test"}, {"_id": 0})
+        check(await db.readings_hourly.count_documents({}) == IMPORT_DAYS * 24, "one rollup per hour")
+        check(rollup["ac_power"] == 3000.0 and rollup["battery_soc"] == 80.0,
+              f"inverters combined (ac_power {rollup['ac_power']}, battery_soc {rollup['battery_soc']})")
+        check(rollup.get("peak_ac_power") == 4000.0, f"peak power {rollup.get('peak_ac_power')} W")
+
+        print("📥 Statistics import job (2 days)")
+        ha_sync = HomeAssistantSync(db, f"http://127.0.0.1:{STANDIN_PORT}", "token")
+        job = ha_sync.start_import_job(2, statistics=True)
+        await job.task
+        progress = job.get_progress()
+        check(progress["status"] == "ok" and progress["percent"] == 100.0,
+              f"job {progress['status']}, {progress['percent']} %")
+        check(progress["rows_inserted"] == 2 * 24, f"{progress['rows_inserted']} hours written by the job")
+        check(all(entity["points"] == 2 * 24 for entity in progress["entities"].values()),
+              f"points per entity {[entity['points'] for entity in progress['entities'].values()]}")
+
+        # One hour of 5 s raw readings of another inverter, 10 days ago
+        hour_start = (datetime.now(timezone.utc) - timedelta(days=10)).replace(minute=0, second=0, microsecond=0)
+        await db.readings.insert_many([
+            {
+                "id": f"raw-{index}", "inverter_id": "growatt-test",
+                "timestamp": (hour_start + timedelta(seconds=5 * index)).isoformat(),
+                "ac_power": 500.0, "dc_power": 600.0, "energy_today": 1.0,
+            }
+            for index in range(720)
+        ])
+        # The same hour as 10 s Home Assistant sync rows of a third inverter
+        await db.readings.insert_many([
+            {
+                "id": f"sync-{index}", "inverter_id": "sync-test",
+                "timestamp": (hour_start + timedelta(seconds=10 * index)).isoformat(),
+                "ac_power": 300.0, "interval_seconds": 10,
+            }
+            for index in range(360)
+        ])
+
+        print("📊 Period statistics (month)")
+        import server
+        server.db = db
+        statistics = await server.get_period_statistics(period="month")
+        comparison = {entry["name"]: entry for entry in statistics["inverter_comparison"]}
+
+        site = comparison.get("Home Assistant", {})
+        check(29 * 24 <= site.get("runtime_hours", 0) <= 30 * 24 + 1,
+              f"Home Assistant runtime {site.get('runtime_hours', 0):.0f} h (rollups count one hour each)")
+        check(abs(site.get("avg_power", 0) - 3000.0) < 1e-6, f"Home Assistant average {site.get('avg_power', 0):.0f} W")
+
+        garage = comparison.get("Garage", {})
+        check(abs(garage.get("runtime_hours", 0) - 1.0) < 1e-6,
+              f"Garage runtime {garage.get('runtime_hours', 0):.2f} h (raw readings inside the rollup range)")
+        check(abs(garage.get("avg_power", 0) - 500.0) < 1e-6, f"Garage average {garage.get('avg_power', 0):.0f} W")
+        cabin = comparison.get("Cabin", {})
+        check(abs(cabin.get("runtime_hours", 0) - 1.0) < 1e-6,
+              f"Cabin runtime {cabin.get('runtime_hours', 0):.2f} h (10 s rows)")
+        check(abs(statistics["avg_efficiency"] - 500.0 / 600.0 * 100) < 1e-6,
+              f"efficiency {statistics['avg_efficiency']:.1f} % (rollups have no DC power)")
+        check(abs(statistics["total_solar_energy"] - 30 * 24 * 3.0) < 3 * 3.0,
+              f"solar energy {statistics['total_solar_energy']:.0f} kWh")
+
+        print("📊 Period statistics (raw readings of one hour)")
+        statistics = await server.get_period_statistics(
+            start_date=hour_start.isoformat(), end_date=(hour_start + timedelta(hours=1)).isoformat()
+        )
+        comparison = {entry["name"]: entry for entry in statistics["inverter_comparison"]}
+        for name in ("Garage", "Cabin"):
+            runtime = comparison.get(name, {}).get("runtime_hours", 0)
+            check(abs(runtime - 1.0) < 1e-6, f"{name} runtime {runtime:.2f} h")
+    finally:
+        standin.close()
+        await standin.wait_closed()
+        await client.drop_database(db_name)
+        client.close()
+
+    exit_with_summary()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+"""
+Test the Home Assistant sync engine against a local stand-in
+
+Usage: python test_ha_sync.py
+
+A stand-in Home Assistant serves synthetic histories (one state every
+30 minutes per entity) and records the requested windows. Readings are
+written to a throwaway database (MONGO_URL from .env, database
+<DB_NAME>_test_ha_sync, dropped at the end).
+
+Checks:
+1. a 1-day periodic sync, then a 30-day import: the older windows are
+   fetched and imported
+2. re-running the import resumes from its checkpoint
+3. the periodic sync still resumes from its own high-water mark
+4. a background import job over a longer range fetches the older days
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlparse
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from ha_sync import HomeAssistantSync
+from script_checks import check, exit_with_summary
+
+logging.basicConfig(level=logging.WARNING)
+load_dotenv(Path(__file__).parent / '.env')
+
+STANDIN_PORT = 8125
+
+# Synthetic history: one state every 30 minutes
+STATE_INTERVAL = timedelta(minutes=30)
+
+ENTITY_MAPPING = {"solar_power": "sensor.pv_power", "load_power": "sensor.load_power"}
+
+
+class HistoryStandIn(BaseHTTPRequestHandler):
+    """GET /api/history/period/<start>?filter_entity_id=...&end_time=..."""
+
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        start = datetime.fromisoformat(unquote(url.path.rsplit('/', 1)[1]))
+        end = datetime.fromisoformat(query['end_time'][0])
+        entity_id = query['filter_entity_id'][0]
+        HistoryStandIn.requests.append((entity_id, start, end))
+
+        # States on a fixed 30 minute grid, as a streamed [[...]] document
+        first = datetime.fromtimestamp(
+            -(-start.timestamp() // STATE_INTERVAL.total_seconds()) * STATE_INTERVAL.total_seconds(),
+            tz=timezone.utc
+        )
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        states = []
+        timestamp = first
+        while timestamp < end:
+            states.append({"state": str(1000 + timestamp.hour * 10), "last_updated": timestamp.isoformat()})
+            timestamp += STATE_INTERVAL
+        self.wfile.write(json.dumps([states]).encode())
+
+
+def requested_from(since: int) -> datetime:
+    """Earliest window start requested after the first `since` requests"""
+    return min(start for _, start, _ in HistoryStandIn.requests[since:])
+
+
+async def main():
+    server = ThreadingHTTPServer(("127.0.0.1", STANDIN_PORT), HistoryStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db_name = f"{os.environ['DB_NAME']}_test_ha_sync"
+    await client.drop_database(db_name)
+    db = client[db_name]
+    await db.home_assistant_config.insert_one({"entity_mapping": ENTITY_MAPPING})
+    await db.inverters.insert_one({"id": "ha-test", "name": "Home Assistant"})
+
+    sync = HomeAssistantSync(db, f"http://127.0.0.1:{STANDIN_PORT}", "token", step_seconds=3600, batch_size=100)
+    now = datetime.now(timezone.utc)
+    try:
+        print("🔄 Periodic sync (1 day)")
+        report = await sync.run(days=1)
+        check(report["status"] == "ok", f"status {report['status']}")
+        check(requested_from(0) >= now - timedelta(days=1), "only the last day requested")
+
+        print("📥 Import (30 days) after the sync")
+        since = len(HistoryStandIn.requests)
+        report = await sync.run(days=30, fill_gaps_only=False, backfill=True)
+        check(report["status"] == "ok", f"status {report['status']}")
+        check(report["windows"] >= 30, f"{report['windows']} windows fetched (30 expected)")
+        check(requested_from(since) <= now - timedelta(days=29), f"windows requested from {requested_from(since).date()}")
+        old_rows = await db.readings.count_documents(
+            {"timestamp": {"$lt": (now - timedelta(days=2)).isoformat()}}
+        )
+        check(old_rows >= 27 * 24, f"{old_rows} readings older than 2 days imported")
+
+        print("📥 Import (30 days) again")
+        since = len(HistoryStandIn.requests)
+        report = await sync.run(days=30, fill_gaps_only=False, backfill=True)
+        check(report["status"] == "ok", f"status {report['status']}")
+        check(report["windows"] <= 1, f"resumed from the checkpoint ({report['windows']} window)")
+        check(requested_from(since) >= now, "nothing before the previous import end requested")
+
+        print("🔄 Periodic sync again")
+        since = len(HistoryStandIn.requests)
+        report = await sync.run(days=1)
+        check(report["status"] == "ok", f"status {report['status']}")
+        check(report["windows"] <= 1, f"resumed from the high-water mark ({report['windows']} window)")
+
+        print("📥 Import job (45 days)")
+        since = len(HistoryStandIn.requests)
+        job = sync.start_import_job(45)
+        await asyncio.wait_for(job.task, 60)
+        progress = job.get_progress()
+        check(progress["status"] == "ok", f"status {progress['status']}")
+        check(progress["windows_total"] >= 45 and progress["windows_done"] == progress["windows_total"],
+              f"{progress['windows_done']}/{progress['windows_total']} windows")
+        check(requested_from(since) <= now - timedelta(days=44), f"windows requested from {requested_from(since).date()}")
+        check(progress["rows_inserted"] >= 14 * 24, f"{progress['rows_inserted']} readings imported")
+        check(all(entity["points"] > 0 for entity in progress["entities"].values()), "points counted per entity")
+    finally:
+        server.shutdown()
+        await client.drop_database(db_name)
+        client.close()
+
+    exit_with_summary()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""
+Tests of the alignment of Home Assistant histories on a fixed grid
+
+Usage: python -m pytest test_history_alignment.py
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from history_alignment import align_histories
+
+START = datetime(2024, 6, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+
+def at(seconds: float) -> str:
+    """Home Assistant timestamp, seconds after START"""
+    return (START + timedelta(seconds=seconds)).isoformat().replace('+00:00', 'Z')
+
+
+def rows(histories, seconds=60, step=10, start=START):
+    return [
+        ((timestamp - START).total_seconds(), values)
+        for timestamp, values in align_histories(histories, start, START + timedelta(seconds=seconds), step)
+    ]
+
+
+def test_forward_fill_between_state_changes():
+    histories = {
+        'pv': [(at(0), '1000'), (at(25), '1500')],
+        'load': [(at(13), '400')],
+    }
+
+    assert rows(histories, seconds=40) == [
+        (0, {'pv': 1000.0}),
+        (10, {'pv': 1000.0}),
+        (20, {'pv': 1000.0, 'load': 400.0}),
+        (30, {'pv': 1500.0, 'load': 400.0}),
+    ]
+
+
+def test_unavailable_state_clears_value():
+    histories = {'pv': [(at(0), '1000'), (at(15), 'unavailable'), (at(35), '800'), (at(45), 'bad')]}
+
+    assert rows(histories) == [(0, {'pv': 1000.0}), (10, {'pv': 1000.0}), (40, {'pv': 800.0})]
+
+
+def test_last_state_at_same_timestamp_wins():
+    histories = {'pv': [(at(5), '100'), (at(5), '200')]}
+
+    assert rows(histories, seconds=20) == [(10, {'pv': 200.0})]
+
+
+def test_grid_starts_on_step_multiple():
+    histories = {'pv': [(at(0), '1000')]}
+    start = START + timedelta(seconds=3)
+
+    assert rows(histories, seconds=30, start=start) == [(10, {'pv': 1000.0}), (20, {'pv': 1000.0})]
+
+
+def test_histories_consumed_lazily():
+    consumed = []
+
+    def stream():
+        for seconds in range(0, 1000, 10):
+            consumed.append(seconds)
+            yield at(seconds), str(seconds)
+
+    aligned = align_histories({'pv': stream()}, START, START + timedelta(seconds=1000), 10)
+    assert next(aligned) == (START, {'pv': 0.0})
+    assert len(consumed) <= 2
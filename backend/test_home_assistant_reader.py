@@ -0,0 +1,118 @@
+"""
+Tests of the Home Assistant entity mapping aggregation and circuit breaker
+
+Usage: python -m pytest test_home_assistant_reader.py
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import home_assistant_reader
+from home_assistant_reader import AggregationPlan, CircuitBreaker
+
+ENTITY_MAPPING = {
+    "solar_power": "sensor.pv1_power",
+    "solar_power_inv2": "sensor.pv2_power",
+    "battery_soc": "sensor.soc1",
+    "battery_soc_inv2": "sensor.soc2",
+    "temperature_inv2": "sensor.temp2",
+    "load_power": "sensor.load",
+    "grid_power": "",
+}
+
+
+def test_plan_compiles_inverter_suffixes():
+    plan = AggregationPlan({**ENTITY_MAPPING, "load_power_inv3": "sensor.load"})
+
+    assert plan.inverter_indexes == [1, 2, 3]
+    # Unmapped keys are skipped, an entity mapped twice is fetched once
+    assert plan.entity_ids == [
+        "sensor.pv1_power", "sensor.pv2_power", "sensor.soc1", "sensor.soc2", "sensor.temp2", "sensor.load"
+    ]
+
+
+def test_site_sums_and_averages():
+    plan = AggregationPlan(ENTITY_MAPPING)
+    result = plan.aggregate({
+        "sensor.pv1_power": 1000.0, "sensor.pv2_power": 2500.0,
+        "sensor.soc1": 80.0, "sensor.soc2": 90.0,
+        "sensor.temp2": 41.0, "sensor.load": 700.0,
+    })
+
+    assert result["site"] == {"solar_power": 3500.0, "battery_soc": 85.0, "load_power": 700.0}
+    assert result["inverters"][1] == {"solar_power": 1000.0, "battery_soc": 80.0, "load_power": 700.0}
+    assert result["inverters"][2] == {"solar_power": 2500.0, "battery_soc": 90.0, "temperature": 41.0}
+
+
+def test_unavailable_entities():
+    plan = AggregationPlan(ENTITY_MAPPING)
+    result = plan.aggregate({"sensor.pv1_power": 1000.0, "sensor.soc2": 90.0})
+
+    # Missing powers count as 0 W, averages use the available values only
+    assert result["site"]["solar_power"] == 1000.0
+    assert result["site"]["battery_soc"] == 90.0
+    assert result["inverters"][2]["solar_power"] == 0.0
+
+    # No value at all for an averaged metric falls back to 0.0
+    assert plan.aggregate({})["site"]["battery_soc"] == 0.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic clock of the breaker, advanced by the test"""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(home_assistant_reader, 'time', SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, base_backoff=5.0)
+    for _ in range(2):
+        breaker.record_failure("timeout")
+    assert breaker.state == "closed" and breaker.allow_request()
+
+    breaker.record_failure("timeout")
+    assert breaker.state == "open" and breaker.is_open()
+    assert not breaker.allow_request()
+    assert breaker.get_status()["retry_in_seconds"] == 5.0
+
+
+def test_breaker_single_probe_when_half_open(clock):
+    breaker = CircuitBreaker(failure_threshold=1, base_backoff=5.0)
+    breaker.record_failure("timeout")
+
+    clock.value += 5.0
+    assert breaker.allow_request()
+    assert breaker.state == "half_open"
+    # Other requests wait for the probe
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow_request()
+    assert [(t["from"], t["to"]) for t in breaker.get_status()["transitions"]] == [
+        ("closed", "open"), ("open", "half_open"), ("half_open", "closed")
+    ]
+
+
+def test_failed_probe_doubles_backoff(clock):
+    breaker = CircuitBreaker(failure_threshold=1, base_backoff=5.0, max_backoff=12.0)
+    breaker.record_failure("timeout")
+
+    clock.value += 5.0
+    assert breaker.allow_request()
+    breaker.record_failure("timeout")
+    assert breaker.state == "open"
+    assert breaker.get_status()["retry_in_seconds"] == 10.0
+
+    clock.value += 10.0
+    assert breaker.allow_request()
+    breaker.record_failure("timeout")
+    assert breaker.get_status()["retry_in_seconds"] == 12.0  # Capped at max_backoff
+
+    # A success resets the backoff
+    clock.value += 12.0
+    assert breaker.allow_request()
+    breaker.record_success()
+    breaker.record_failure("timeout")
+    assert breaker.get_status()["retry_in_seconds"] == 5.0
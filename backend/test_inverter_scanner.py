@@ -0,0 +1,66 @@
+"""
+Tests of the inverter scanner on ports already opened by the reader
+
+Usage: python -m pytest test_inverter_scanner.py
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import inverter_scanner
+from inverter_reader import reader
+from mppsolar_protocol import COMMAND_FRAMES
+
+QPIGS = b'(230.0 50.0 230.0 50.0 1000 900 20 400 52.0 10 080 035 05.0 300.0 52.0 00000 00010000 00 00 00000 010'
+
+
+class ReaderSession:
+    """The reader's open MPPSOLAR session on a port"""
+
+    def __init__(self):
+        self.queries = []
+        self.closed = False
+
+    def query(self, frame, count_errors=True):
+        self.queries.append(frame)
+        return b'(92932004102443' if frame == COMMAND_FRAMES['QID'] else QPIGS
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def ports(monkeypatch):
+    """Serial ports seen by the scan; no new connection may be opened"""
+    devices = []
+    monkeypatch.setattr(inverter_scanner.serial.tools.list_ports, 'comports',
+                        lambda: [SimpleNamespace(device=device) for device in devices])
+
+    def no_connection(*args, **kwargs):
+        raise AssertionError("second connection opened on a port held by the reader")
+
+    monkeypatch.setattr(inverter_scanner, 'MPPSolarSession', no_connection)
+    monkeypatch.setattr(inverter_scanner, 'ModbusSerialClient', no_connection)
+    yield devices
+    reader.mppsolar_connections.clear()
+    reader.growatt_driver.buses.clear()
+
+
+def test_mppsolar_port_queried_through_reader_session(ports):
+    session = ReaderSession()
+    reader.mppsolar_connections['/dev/ttyUSB0'] = session
+    ports.append('/dev/ttyUSB0')
+
+    discovered = inverter_scanner.InverterScanner().scan_all_ports()
+
+    assert [inverter['serial'] for inverter in discovered] == ['92932004102443']
+    assert session.queries == [COMMAND_FRAMES['QID'], COMMAND_FRAMES['QPIGS']]
+    assert not session.closed
+
+
+def test_growatt_port_skipped(ports):
+    reader.growatt_driver.buses['/dev/ttyUSB1'] = object()
+    ports.append('/dev/ttyUSB1')
+
+    assert inverter_scanner.InverterScanner().scan_all_ports() == []
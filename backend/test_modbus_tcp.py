@@ -0,0 +1,276 @@
+"""
+Test GROWATT polling through a Modbus TCP gateway
+
+Usage: python test_modbus_tcp.py [units] [rounds]
+       python test_modbus_tcp.py tcp://<gateway>:502 <unit> [<unit>...]
+
+Without a gateway URL, local stand-ins are used with several unit IDs
+(each unit has its own AC power, so a reading given to the wrong unit is
+caught):
+1. the pymodbus TCP server, which loses requests sent while one is in
+   flight: checks the decoded readings, the fallback to sequential
+   requests and the new pipelining attempt after the cool-down
+2. a gateway queueing pipelined requests in front of a simulated RS485
+   bus (pymodbus datastore, network and bus latency), sending answers out
+   of order: checks the readings are matched by transaction ID, pipelining
+   is kept, and compares sequential and pipelined polling times
+3. the same gateway with an unplugged unit: pipelining is kept for the
+   other units
+
+Exits with status 1 if a check fails.
+"""
+
+import asyncio
+import logging
+import struct
+import sys
+import time
+
+from pymodbus.datastore import ModbusDeviceContext, ModbusSequentialDataBlock, ModbusServerContext
+from pymodbus.server import ServerAsyncStop, StartAsyncTcpServer
+
+from growatt_driver import PIPELINING_RETRY_SECONDS, GrowattAsyncDriver, ModbusTcpGateway
+from script_checks import check, exit_with_summary
+
+logging.basicConfig(level=logging.INFO)
+logging.getLogger('pymodbus').setLevel(logging.WARNING)
+
+PYMODBUS_PORT = 5020
+SIMULATED_PORT = 5021
+
+# Simulated latencies (seconds): Ethernet/WiFi one way, one RS485 transaction
+NETWORK_DELAY = 0.01
+BUS_TIME = 0.015
+
+# Registres d'un onduleur simulé: status, PV, AC, température, énergie,
+# batterie et réseau
+SIMULATED_REGISTERS = {
+    0: 1, 1: 1200, 2: 800, 3: 3500, 4: 57, 12: 19000, 13: 2301, 14: 82, 15: 5000,
+    53: 412, 60: 123, 62: 5,
+    1000: 521, 1001: 65526, 1002: 87, 1003: 250,
+    2000: 2300, 2001: 5001, 2002: 65036,
+}
+
+# Decoded values of SIMULATED_REGISTERS (growatt_registers.GROWATT_DEFAULT_MAP)
+EXPECTED_READING = {
+    'dc_power': 200.0, 'dc_voltage': 350.0, 'dc_current': 5.7,
+    'ac_power': 1900.0, 'ac_voltage': 230.1, 'ac_current': 8.2, 'frequency': 50.0,
+    'temperature': 41.2, 'energy_today': 12.3, 'energy_total': 0.5,
+    'battery_voltage': 52.1, 'battery_current': -1.0, 'battery_soc': 87.0, 'battery_temperature': 25.0,
+    'battery_power': -52.1,
+    'grid_voltage': 230.0, 'grid_frequency': 50.01, 'grid_power': -50.0,
+}
+
+
+def unit_registers(unit):
+    """Registers of one unit: AC power 1900 W + 10 W per unit ID"""
+    return {**SIMULATED_REGISTERS, 12: SIMULATED_REGISTERS[12] + 100 * unit}
+
+
+def expected_reading(unit):
+    """Decoded reading of one unit"""
+    return {**EXPECTED_READING, 'ac_power': EXPECTED_READING['ac_power'] + 10 * unit}
+
+
+def check_readings(readings, units):
+    """Every unit got its own reading, decoded like the register map says"""
+    for unit, reading in zip(units, readings):
+        if reading is None:
+            check(False, f"unit {unit}: no reading")
+            continue
+        data = reading.to_dict()
+        wrong = {
+            name: data.get(name) for name, value in expected_reading(unit).items()
+            if data.get(name) is None or abs(data[name] - value) > 1e-6
+        }
+        check(not wrong and reading.status == 'ok', f"unit {unit}: {len(expected_reading(unit))} fields decoded"
+              + (f", wrong: {wrong}" if wrong else ""))
+
+
+def simulated_inverters(units):
+    """pymodbus datastore with one simulated inverter per unit ID"""
+    devices = {}
+    for unit in units:
+        block = ModbusSequentialDataBlock(0, [0] * 2100)
+        for address, value in unit_registers(unit).items():
+            block.setValues(address + 1, [value])  # Device context adds 1 to addresses
+        devices[unit] = ModbusDeviceContext(hr=block)
+    return ModbusServerContext(devices=devices, single=False)
+
+
+class SimulatedGateway:
+    """
+    Modbus TCP gateway: queues requests and serves them one by one on its RS485 bus
+
+    The way back takes 1 to 3 network delays depending on the transaction
+    ID, so answers overtake each other.
+    """
+
+    def __init__(self, context: ModbusServerContext):
+        self.context = context
+        self.bus = asyncio.Lock()
+        self.last_sent = 0
+        self.reordered = 0  # Answers sent before the answer of an earlier request
+        self.unplugged = set()  # Units that never answer (the bus waits, then gives up)
+
+    async def handle(self, reader, writer):
+        """Read requests without waiting for the answers of the previous ones"""
+        tasks = set()
+        try:
+            while True:
+                header = await reader.readexactly(7)
+                transaction_id, _, length, unit = struct.unpack('>HHHB', header)
+                pdu = await reader.readexactly(length - 1)
+                task = asyncio.create_task(self.answer(writer, transaction_id, unit, pdu))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    async def answer(self, writer, transaction_id, unit, pdu):
+        """One request: network, queued RS485 transaction, network"""
+        function, address, count = struct.unpack('>BHH', pdu[:5])
+        await asyncio.sleep(NETWORK_DELAY)
+        async with self.bus:
+            if unit in self.unplugged:
+                await asyncio.sleep(4 * BUS_TIME)
+                return
+            await asyncio.sleep(BUS_TIME)
+            values = self.context[unit].getValues(function, address, count)
+        await asyncio.sleep(NETWORK_DELAY * (1 + transaction_id % 3))
+        if transaction_id < self.last_sent:
+            self.reordered += 1
+        self.last_sent = transaction_id
+        body = struct.pack(f'>BB{count}H', function, 2 * count, *values)
+        writer.write(struct.pack('>HHHB', transaction_id, 0, len(body) + 1, unit) + body)
+
+
+async def poll(driver, configs, pipelined):
+    """Poll every unit once, returns (elapsed seconds, readings)"""
+    start = time.perf_counter()
+    if pipelined:
+        readings = await asyncio.gather(*(driver.read(config) for config in configs))
+    else:
+        readings = [await driver.read(config) for config in configs]
+    return time.perf_counter() - start, readings
+
+
+async def compare(url, units, rounds):
+    """
+    Sequential then pipelined polling of every unit
+
+    Returns:
+        (last sequential readings, last pipelined readings, whether the
+        gateway was still pipelined after the pipelined rounds)
+    """
+    configs = [{'port': url, 'slave_id': unit} for unit in units]
+    results = []
+    still_pipelined = False
+    for pipelined in (False, True):
+        driver = GrowattAsyncDriver()
+        if not pipelined:
+            driver.buses[url] = ModbusTcpGateway(url, driver.timeout, max_in_flight=1)
+        times = []
+        try:
+            for _ in range(rounds):
+                elapsed, readings = await poll(driver, configs, pipelined)
+                times.append(elapsed)
+            still_pipelined = driver.get_bus(configs[0]).pipelined
+        finally:
+            driver.close_all()
+
+        ok = sum(1 for reading in readings if reading)
+        label = "Pipelined " if pipelined else "Sequential"
+        check(ok == len(units), f"{label}: {ok}/{len(units)} units, "
+              f"best {min(times) * 1000:.1f} ms, mean {sum(times) / len(times) * 1000:.1f} ms per poll")
+        if pipelined and not still_pipelined:
+            print("   ↪ gateway does not queue requests, fell back to sequential")
+        results.append(readings)
+    return results[0], results[1], still_pipelined
+
+
+async def retry_pipelining(url, units):
+    """A gateway that fell back tries pipelining again after the cool-down"""
+    configs = [{'port': url, 'slave_id': unit} for unit in units]
+    driver = GrowattAsyncDriver(timeout=0.5)
+    try:
+        await poll(driver, configs, True)
+        bus = driver.get_bus(configs[0])
+        check(bus.fallbacks == 1 and not bus.pipelined, f"{bus.fallbacks} fallback, {bus.pipelining_info()}")
+        _, readings = await poll(driver, configs, True)
+        check(all(readings), "every unit read one request at a time")
+        bus.fallback_at -= PIPELINING_RETRY_SECONDS
+        await poll(driver, configs, True)
+        check(bus.fallbacks == 2, f"pipelining tried again after {PIPELINING_RETRY_SECONDS}s, "
+              f"{bus.fallbacks} fallbacks")
+    finally:
+        driver.close_all()
+
+
+async def poll_with_unplugged_unit(url, units, unplugged):
+    """Pipelined polls with one unit that never answers"""
+    configs = [{'port': url, 'slave_id': unit} for unit in units + [unplugged]]
+    driver = GrowattAsyncDriver(timeout=0.5)
+    try:
+        for _ in range(2):
+            _, readings = await poll(driver, configs, True)
+        bus = driver.get_bus(configs[0])
+        check(bus.pipelined and bus.fallbacks == 0, f"unit {unplugged} unplugged, requests kept pipelined")
+        check(readings[-1] is None, f"unit {unplugged}: no reading")
+        check_readings(readings[:-1], units)
+    finally:
+        driver.close_all()
+
+
+async def main():
+    if len(sys.argv) > 1 and sys.argv[1].startswith('tcp://'):
+        url = sys.argv[1]
+        units = [int(unit) for unit in sys.argv[2:]] or [1]
+        print(f"🔌 Testing GROWATT polling through {url}, units {units}\n")
+        _, readings, _ = await compare(url, units, 5)
+        print(f"\n📊 Unit {units[0]}: {readings[0]}")
+        exit_with_summary()
+        return
+
+    units = list(range(1, int(sys.argv[1]) + 1)) if len(sys.argv) > 1 else [1, 2, 3, 4]
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    context = simulated_inverters(units)
+
+    print(f"🔌 pymodbus TCP server, units {units}")
+    server = asyncio.create_task(StartAsyncTcpServer(context=context, address=("127.0.0.1", PYMODBUS_PORT)))
+    await asyncio.sleep(0.5)
+    try:
+        sequential, pipelined, still_pipelined = await compare(f"tcp://127.0.0.1:{PYMODBUS_PORT}", units, 2)
+        check_readings(sequential, units)
+        check_readings(pipelined, units)
+        check(not still_pipelined, "fell back to sequential requests")
+        await retry_pipelining(f"tcp://127.0.0.1:{PYMODBUS_PORT}", units)
+    finally:
+        await ServerAsyncStop()
+        server.cancel()
+    print()
+
+    print(f"🔌 Simulated gateway ({NETWORK_DELAY * 1000:.0f} ms network, "
+          f"{BUS_TIME * 1000:.0f} ms per RS485 transaction), units {units}")
+    simulated = SimulatedGateway(context)
+    gateway = await asyncio.start_server(simulated.handle, "127.0.0.1", SIMULATED_PORT)
+    try:
+        sequential, pipelined, still_pipelined = await compare(f"tcp://127.0.0.1:{SIMULATED_PORT}", units, rounds)
+        check_readings(sequential, units)
+        check_readings(pipelined, units)
+        check(still_pipelined, "requests kept pipelined")
+        check(simulated.reordered > 0, f"{simulated.reordered} answers out of order, matched by transaction ID")
+
+        unplugged = max(units) + 1
+        print(f"\n🔌 Simulated gateway, unit {unplugged} unplugged")
+        simulated.unplugged.add(unplugged)
+        await poll_with_unplugged_unit(f"tcp://127.0.0.1:{SIMULATED_PORT}", units, unplugged)
+        await asyncio.sleep(0.1)  # Let the gateway see the client disconnect
+    finally:
+        gateway.close()
+
+    exit_with_summary()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
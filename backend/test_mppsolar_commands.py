@@ -0,0 +1,126 @@
+"""
+Tests of the MPPSOLAR polling pipeline
+
+Usage: python -m pytest test_mppsolar_commands.py
+
+A fake serial port answers the PI30 commands with CRC-checked frames, so
+the real MPPSolarSession and FrameReader are exercised.
+"""
+
+import time
+
+import pytest
+
+from mppsolar_commands import MPPSolarDeviceState, poll_mppsolar
+from mppsolar_protocol import frame_crc
+from mppsolar_session import FrameReader, FrameTimeoutError, MPPSolarSession
+
+ANSWERS = {
+    b'QPIGS': b'(230.0 50.0 230.0 50.0 1000 900 20 400 52.0 10 080 035 05.0 300.0 52.0 00000 00010000 00 00 00000 010',
+    b'QPIGS2': b'(04.0 250.0 01000',
+    b'QMOD': b'(B',
+    b'QPIWS': b'(' + b'0' * 36,
+    b'QET': b'(01234',
+    b'QED': b'(00500',
+}
+
+
+class FakeSerial:
+    """Serial port stand-in: answers every command except the silent ones"""
+
+    def __init__(self, silent=()):
+        self.port = '/dev/fake'
+        self.is_open = True
+        self.silent = set(silent)
+        self.sent = []
+        self.pending = bytearray()
+
+    @property
+    def in_waiting(self):
+        return len(self.pending)
+
+    def reset_input_buffer(self):
+        self.pending.clear()
+
+    def write(self, frame):
+        command = frame[:-3]
+        name = b'QED' if command.startswith(b'QED') else command
+        self.sent.append(name.decode())
+        if name not in self.silent:
+            body = ANSWERS[name]
+            self.pending += body + frame_crc(body) + b'\r'
+
+    def read(self, size=1):
+        if not self.pending:
+            time.sleep(0.001)
+        chunk = bytes(self.pending[:size])
+        del self.pending[:size]
+        return chunk
+
+    def close(self):
+        self.is_open = False
+
+
+def open_session(port: FakeSerial) -> MPPSolarSession:
+    """Session already open on the fake port"""
+    session = MPPSolarSession(port.port, timeout=0.05)
+    session.serial = port
+    session.reader = FrameReader(port)
+    return session
+
+
+def test_all_commands_in_reading():
+    port = FakeSerial()
+    record = poll_mppsolar(open_session(port), MPPSolarDeviceState())
+
+    assert port.sent == ['QPIGS', 'QPIGS2', 'QMOD', 'QPIWS', 'QET', 'QED']
+    assert record['dc_current'] == 5.0
+    assert record['pv2_current'] == 4.0
+    assert record['dc_power'] == 5.0 * 300.0 + 1000.0
+    assert record['energy_total'] == 1234.0
+    assert record.mode == 'battery'
+
+
+def test_silent_optional_command_backs_off():
+    port = FakeSerial(silent={b'QPIGS2'})
+    session = open_session(port)
+    state = MPPSolarDeviceState()
+
+    for _ in range(10):
+        record = poll_mppsolar(session, state)
+        assert record['pv2_power'] is None
+        assert record['dc_power'] == 5.0 * 300.0
+
+    # Sent at polls 0, 2 and 6 (retry delay doubles), not every poll
+    assert port.sent.count('QPIGS2') == 3
+    assert port.sent.count('QPIGS') == 10
+    # Optional command timeouts do not make the session reopen the port
+    assert session.consecutive_errors == 0
+    assert session.is_healthy()
+    assert session.connects == 0
+
+
+def test_failed_answer_left_out_until_answered_again():
+    port = FakeSerial()
+    session = open_session(port)
+    state = MPPSolarDeviceState()
+    assert poll_mppsolar(session, state)['pv2_power'] == 1000.0
+
+    port.silent = {b'QPIGS2'}
+    assert poll_mppsolar(session, state)['pv2_power'] is None
+    # The previous answer is kept out, without sending QPIGS2 again
+    assert poll_mppsolar(session, state)['pv2_power'] is None
+    assert port.sent.count('QPIGS2') == 2
+
+    port.silent = set()
+    assert poll_mppsolar(session, state)['pv2_power'] == 1000.0
+    assert not state.failures
+
+
+def test_required_command_failure_counts():
+    port = FakeSerial(silent={b'QPIGS'})
+    session = open_session(port)
+
+    with pytest.raises(FrameTimeoutError):
+        poll_mppsolar(session, MPPSolarDeviceState())
+    assert session.consecutive_errors == 1
@@ -0,0 +1,30 @@
+"""
+Tests of the MPPSOLAR CRC and prebuilt command frames
+
+Usage: python -m pytest test_mppsolar_protocol.py
+"""
+
+import pytest
+
+from mppsolar_protocol import COMMAND_FRAMES, check_frame, command_frame, crc16, frame_crc
+
+
+def test_crc16_xmodem():
+    assert crc16(b'123456789') == 0x31C3  # CRC-16/XMODEM check value
+    assert crc16(b'') == 0
+
+
+def test_command_frames():
+    # Frames documented for PI30 inverters
+    assert COMMAND_FRAMES['QPIGS'] == b'QPIGS\xb7\xa9\r'
+    assert COMMAND_FRAMES['QMOD'] == b'QMOD\x49\xc1\r'
+    assert COMMAND_FRAMES['QPIGS'] == command_frame('QPIGS') == command_frame(b'QPIGS')
+    with pytest.raises(TypeError):
+        COMMAND_FRAMES['QPIGS'] = b''
+
+
+def test_check_frame():
+    body = b'(230.0 50.0 230.0 50.0'
+    assert check_frame(body + frame_crc(body)) == body
+    assert check_frame(body + b'\x00\x00') is None
+    assert check_frame(b'(B') is None  # Too short to carry a CRC
@@ -0,0 +1,93 @@
+"""
+Tests of the MPPSOLAR frame reader
+
+Usage: python -m pytest test_mppsolar_session.py
+
+A fake serial port hands out scripted chunks of bytes, so frame
+boundaries, resync and CRC checks are exercised without a device.
+"""
+
+import itertools
+import struct
+import time
+
+import pytest
+
+from mppsolar_protocol import crc16, frame_crc
+from mppsolar_session import FrameCRCError, FrameReader, FrameTimeoutError
+
+
+class ChunkedSerial:
+    """Serial port stand-in: returns the scripted chunks one read at a time"""
+
+    port = '/dev/fake'
+
+    def __init__(self, *chunks):
+        self.chunks = list(chunks)
+
+    @property
+    def in_waiting(self):
+        return len(self.chunks[0]) if self.chunks else 0
+
+    def read(self, size=1):
+        if not self.chunks:
+            time.sleep(0.001)
+            return b''
+        return self.chunks.pop(0)
+
+    def reset_input_buffer(self):
+        self.chunks.clear()
+
+
+def frame(body: bytes) -> bytes:
+    return body + frame_crc(body) + b'\r'
+
+
+def body_with_crc_byte(byte: int) -> bytes:
+    """An answer body whose raw CRC contains byte (escaped on the wire)"""
+    for number in itertools.count():
+        body = b'(%05d' % number
+        if byte in struct.pack('>H', crc16(body)):
+            return body
+
+
+@pytest.mark.parametrize('byte', [0x0d, 0x28, 0x0a])
+def test_escaped_crc_byte(byte):
+    body = body_with_crc_byte(byte)
+    wire = frame(body)
+    # The escaped CRC never looks like a terminator or a frame start
+    assert wire.index(b'\r') == len(wire) - 1
+    assert wire.rindex(b'(') == 0
+
+    reader = FrameReader(ChunkedSerial(wire[:3], wire[3:]))
+    assert reader.read_frame(1.0) == body
+    assert reader.crc_errors == 0
+
+
+def test_noise_before_frame_skipped():
+    reader = FrameReader(ChunkedSerial(b'\x00\xff', b'xx' + frame(b'(B')))
+
+    assert reader.read_frame(1.0) == b'(B'
+    assert reader.garbage_bytes == 4
+
+
+def test_corrupt_frame_then_valid_frame():
+    corrupt = bytearray(frame(b'(230.0 50.0'))
+    corrupt[3] ^= 0x01
+    reader = FrameReader(ChunkedSerial(bytes(corrupt) + frame(b'(230.1 50.0')))
+
+    assert reader.read_frame(1.0) == b'(230.1 50.0'
+    assert reader.crc_errors == 1
+
+
+def test_corrupt_frame_only():
+    corrupt = bytearray(frame(b'(230.0 50.0'))
+    corrupt[3] ^= 0x01
+
+    with pytest.raises(FrameCRCError):
+        FrameReader(ChunkedSerial(bytes(corrupt))).read_frame(1.0)
+
+
+def test_no_answer():
+    with pytest.raises(FrameTimeoutError):
+        FrameReader(ChunkedSerial()).read_frame(0.02)
@@ -1,59 +1,86 @@
-"""Test Solar Assistant MQTT connection"""
+"""
+Test Solar Assistant MQTT connection
 
+Usage: python test_mqtt.py [host] [port]
+(defaults to SOLAR_ASSISTANT_MQTT_HOST / SOLAR_ASSISTANT_MQTT_PORT from .env)
+
+Without a live Solar Assistant, replay a recording instead:
+python mqtt_replay.py replay <recording.jsonl.gz>
+"""
+
+import os
+import sys
 import time
+from pathlib import Path
+from dotenv import load_dotenv
 from solar_assistant_mqtt import SolarAssistantMQTT
 import logging
 
 logging.basicConfig(level=logging.INFO)
+load_dotenv(Path(__file__).parent / '.env')
+
 
-# Test connection
-print("🔌 Testing Solar Assistant MQTT connection...")
-print(f"   Host: 192.168.1.162")
-print(f"   Port: 1883\n")
+def main():
+    host = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('SOLAR_ASSISTANT_MQTT_HOST', '')
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else int(os.environ.get('SOLAR_ASSISTANT_MQTT_PORT', '1883'))
+    if not host:
+        print("Usage: python test_mqtt.py <host> [port] (or set SOLAR_ASSISTANT_MQTT_HOST)")
+        sys.exit(1)
 
-client = SolarAssistantMQTT("192.168.1.162", 1883)
+    # Test connection
+    print("🔌 Testing Solar Assistant MQTT connection...")
+    print(f"   Host: {host}")
+    print(f"   Port: {port}\n")
 
-if client.connect():
-    print("✅ Connected successfully!\n")
-    print("📡 Waiting for data (10 seconds)...\n")
+    client = SolarAssistantMQTT(host, port, os.environ.get('SOLAR_ASSISTANT_MQTT_USERNAME'),
+                                os.environ.get('SOLAR_ASSISTANT_MQTT_PASSWORD'))
+
+    # connect() only starts the session, wait for the broker to accept it
+    if client.connect() and client.connected_event.wait(5):
+        print("✅ Connected successfully!\n")
+        print("📡 Waiting for data (10 seconds)...\n")
     
-    time.sleep(10)
+        time.sleep(10)
     
-    # Get all data
-    all_data = client.get_all_data()
+        # Get all data
+        all_data = client.get_all_data()
     
-    if all_data:
-        print(f"📊 Received data from {len(all_data)} inverter(s):\n")
-        for inverter_id, data in all_data.items():
-            print(f"🔋 {inverter_id}:")
-            for key, value in sorted(data.items()):
-                if key != 'last_update':
-                    print(f"   {key}: {value}")
-            print()
-        
-        # Get aggregated
-        print("📈 Aggregated data:")
-        aggregated = client.get_aggregated_data()
-        for key, value in sorted(aggregated.items()):
-            print(f"   {key}: {value}")
-        
-    else:
-        print("⚠️ No data received yet")
-        print("   This could mean:")
-        print("   - MQTT is not enabled in Solar Assistant")
-        print("   - Solar Assistant is not publishing data")
-        print("   - Network connectivity issues")
+        if all_data:
+            print(f"📊 Received data from {len(all_data)} inverter(s):\n")
+            for inverter_id, data in all_data.items():
+                print(f"🔋 {inverter_id}:")
+                for key, value in sorted(data.items()):
+                    if key != 'last_update':
+                        print(f"   {key}: {value}")
+                print()
     
-    client.disconnect()
-else:
-    print("❌ Failed to connect")
-    print("\n💡 Possible issues:")
-    print("   1. MQTT not enabled in Solar Assistant")
-    print("   2. Firewall blocking port 1883")
-    print("   3. Solar Assistant not running")
-    print("   4. Wrong IP address")
-    print("\n📝 To enable MQTT in Solar Assistant:")
-    print("   1. Open Solar Assistant web interface (http://192.168.1.162)")
-    print("   2. Go to Configuration tab")
-    print("   3. Enable 'MQTT Output'")
-    print("   4. Save and restart Solar Assistant")
+            # Get aggregated
+            print("📈 Aggregated data:")
+            aggregated = client.get_aggregated_data()
+            for key, value in sorted(aggregated.items()):
+                print(f"   {key}: {value}")
+    
+        else:
+            print("⚠️ No data received yet")
+            print("   This could mean:")
+            print("   - MQTT is not enabled in Solar Assistant")
+            print("   - Solar Assistant is not publishing data")
+            print("   - Network connectivity issues")
+    
+        client.disconnect()
+    else:
+        print("❌ Failed to connect")
+        print("\n💡 Possible issues:")
+        print("   1. MQTT not enabled in Solar Assistant")
+        print("   2. Firewall blocking port 1883")
+        print("   3. Solar Assistant not running")
+        print("   4. Wrong IP address")
+        print("\n📝 To enable MQTT in Solar Assistant:")
+        print(f"   1. Open Solar Assistant web interface (http://{host})")
+        print("   2. Go to Configuration tab")
+        print("   3. Enable 'MQTT Output'")
+        print("   4. Save and restart Solar Assistant")
+
+
+if __name__ == "__main__":
+    main()
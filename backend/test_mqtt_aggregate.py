@@ -0,0 +1,80 @@
+"""
+Test the Solar Assistant site aggregate when inverters go stale (no broker needed)
+
+Usage: python test_mqtt_aggregate.py
+
+Messages are fed to SolarAssistantMQTT._on_message directly. Three
+inverters publish, two of them stop: the emitted reading must keep
+matching the live aggregate (window means of stale inverters are not
+added), also when one of them comes back. A message arriving while a
+reading is built waits for it, so the reading sees it entirely or not at all.
+"""
+
+import logging
+import threading
+import time
+
+from mqtt_replay import Message
+from script_checks import check, exit_with_summary
+from solar_assistant_mqtt import SolarAssistantMQTT
+
+logging.basicConfig(level=logging.ERROR)
+
+# Short stale delay so the test runs in about a second
+STALE_AFTER = 0.3
+
+
+def publish(client: SolarAssistantMQTT, inverter_id: str, pv_power: float):
+    """One pv_power and load_power message of an inverter"""
+    for metric, value in (("pv_power", pv_power), ("load_power", pv_power / 2)):
+        client._on_message(None, None, Message(f"solar_assistant/{inverter_id}/{metric}/state", str(value).encode()))
+
+
+def check_reading(client: SolarAssistantMQTT, expected_power: float, inverters: set):
+    """Emitted reading, live aggregate and window inverters agree"""
+    aggregated = client.get_aggregated_data()
+    reading = client.emit_reading()
+    check(reading is not None, "reading emitted")
+    if reading is None:
+        return
+    check(abs(aggregated["pv_power"] - expected_power) < 1e-6, f"live aggregate {aggregated['pv_power']:.0f} W")
+    check(abs(reading["ac_power"] - expected_power) < 1e-6, f"stored reading {reading['ac_power']:.0f} W")
+    check(abs(reading["load_power"] - expected_power / 2) < 1e-6, f"stored load {reading['load_power']:.0f} W")
+    check(set(reading.get("window", {})) == inverters, f"window statistics of {sorted(reading.get('window', {}))}")
+
+
+def main():
+    client = SolarAssistantMQTT("localhost")
+    client.stale_after = STALE_AFTER
+
+    print("🔋 Three inverters publishing")
+    for inverter_id in ("inverter_1", "inverter_2", "inverter_3"):
+        publish(client, inverter_id, 1000.0)
+    check_reading(client, 3000.0, {"inverter_1", "inverter_2", "inverter_3"})
+
+    print("🔋 inverter_2 and inverter_3 stale")
+    time.sleep(STALE_AFTER + 0.05)
+    publish(client, "inverter_1", 1000.0)
+    check(len(client.active_inverters) == 1, f"{len(client.active_inverters)} active inverter(s)")
+    check_reading(client, 1000.0, {"inverter_1"})
+
+    print("🔋 inverter_2 back")
+    publish(client, "inverter_2", 2000.0)
+    time.sleep(0.05)
+    check_reading(client, 3000.0, {"inverter_1", "inverter_2"})
+
+    print("🔋 Message while a reading is built")
+    with client.data_lock:
+        network_thread = threading.Thread(target=publish, args=(client, "inverter_1", 1500.0))
+        network_thread.start()
+        network_thread.join(0.1)
+        check(network_thread.is_alive(), "message waits for the reading")
+        check(client.get_aggregated_data()["pv_power"] == 3000.0, "aggregate unchanged meanwhile")
+    network_thread.join()
+    check(client.get_aggregated_data()["pv_power"] == 3500.0, "message applied once the reading is built")
+
+    exit_with_summary()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Tests of the typed block decoding into ReadingRecord
+
+Usage: python -m pytest test_reading_record.py
+"""
+
+import struct
+
+from growatt_registers import IDENTITY_GROUP, ReadBlock, RegisterField
+from reading_record import READING_FIELDS, ReadingRecord
+
+BLOCK = ReadBlock('main', 'holding', [
+    RegisterField('dc_power', 1, scale=0.1),
+    RegisterField('dc_power', 2, scale=0.1),
+    RegisterField('ac_power', 4, width=2, scale=0.1),
+    RegisterField('battery_current', 7, scale=0.1, signed=True),
+])
+
+
+def test_block_layout_pads_gaps():
+    assert (BLOCK.address, BLOCK.count) == (1, 7)
+    assert BLOCK.layout.size == 2 * BLOCK.count
+
+
+def test_decode_in_place_from_response_bytes():
+    response = bytearray(struct.pack('>7H', 1200, 800, 0xFFFF, 1, 0x3880, 0xFFFF, 65526))
+    record = ReadingRecord()
+    BLOCK.decode(memoryview(response), record.values)
+
+    assert record['dc_power'] == 200.0  # Repeated targets are summed
+    assert record['ac_power'] == 8000.0  # 32 bits, high word first
+    assert record['battery_current'] == -1.0
+    assert 'ac_voltage' not in record
+
+
+def test_decode_identity_fields():
+    block = ReadBlock(IDENTITY_GROUP, 'holding', [
+        RegisterField('serial', 0, width=3, group=IDENTITY_GROUP),
+        RegisterField('module_code', 3, width=2, group=IDENTITY_GROUP),
+    ])
+    response = b'AB1234' + struct.pack('>I', 6000)
+
+    assert block.decode_fields(response) == {'serial': 'AB1234', 'module_code': 6000.0}
+
+
+def test_document_defaults():
+    record = ReadingRecord.from_dict({'ac_power': 1500, 'status': 'warning', 'unknown': 1})
+    document = record.to_document('inv-1')
+
+    assert document['inverter_id'] == 'inv-1'
+    assert document['ac_power'] == 1500.0
+    assert document['status'] == 'warning'
+    # Unreported metrics get the values always stored in REAL mode
+    assert document['dc_power'] == 0.0
+    assert document['frequency'] == 50.0
+    assert document['load_power'] is None and document['pv2_power'] is None
+    assert set(READING_FIELDS) <= set(document)
+
+    assert record.to_dict() == {'ac_power': 1500.0, 'status': 'warning', 'timestamp': record.timestamp.isoformat()}
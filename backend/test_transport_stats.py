@@ -0,0 +1,32 @@
+"""
+Tests of the per port transport statistics
+
+Usage: python -m pytest test_transport_stats.py
+"""
+
+from growatt_driver import AsyncModbusBus, ModbusTcpGateway
+from transport_stats import CRC_ERROR, TIMEOUT, TransportStats, port_summary
+
+
+def test_retries_counted():
+    stats = TransportStats()
+    stats.corrupt(1, retried=True)
+    stats.success(0.02, 8, 110)
+    stats.corrupt(2)
+    stats.failure(CRC_ERROR, 0.5, 8, 20)
+
+    data = stats.to_dict()
+    assert (data['retries'], data['crc_errors'], data['transactions'], data['ok']) == (1, 3, 2, 1)
+    assert port_summary('/dev/ttyUSB0', 'mppsolar', {None: stats})['totals']['retries'] == 1
+
+
+def test_modbus_statistics_without_retries():
+    for bus in (AsyncModbusBus('/dev/ttyUSB1'), ModbusTcpGateway('tcp://127.0.0.1:502')):
+        stats = bus.stats_for(1)
+        stats.failure(TIMEOUT, 1.0, 8)
+        stats.success(0.05, 8, 37)
+
+        summary = port_summary(bus.port, 'modbus', bus.stats)
+        assert 'retries' not in summary['devices'][0]
+        assert 'retries' not in summary['totals']
+        assert summary['totals']['timeouts'] == 1
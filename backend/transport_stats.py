@@ -0,0 +1,201 @@
+"""
+Statistiques de transport par port et par esclave (Modbus, série MPPSOLAR)
+
+Every transaction of the drivers is recorded: latency (histogram), outcome
+(ok, timeout, corrupt frame, exception answer, other error), bytes on the
+wire and retries (MPPSOLAR answers that followed a corrupt frame; the
+Modbus drivers never re-send a request, their statistics have no retries
+field). Per port totals tell whether a bus is saturated (busy
+ratio close to 1), noisy (CRC errors, retries) or mis-configured (timeouts,
+exception answers) before more devices are added to it.
+
+Modbus RTU frames failing their CRC are dropped by pymodbus and show up as
+timeouts. Modbus byte counts of serial buses are computed from the frame
+sizes (pymodbus does not expose the raw frames).
+"""
+
+import bisect
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# Upper bounds of the latency histogram buckets (ms), plus one overflow bucket
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Transaction failure kinds
+TIMEOUT = "timeout"
+CRC_ERROR = "crc"
+EXCEPTION = "exception"  # Answer refusing the request (Modbus exception, MPPSOLAR NAK)
+ERROR = "error"          # Port / connection error
+
+
+class TransportStats:
+    """Transaction counters and latency histogram of one device (port + slave)"""
+
+    __slots__ = (
+        'since', 'transactions', 'failed', 'timeouts', 'crc_errors', 'exceptions', 'exception_codes', 'errors',
+        'retries', 'bytes_sent', 'bytes_received', 'latency_buckets', 'latency_total', 'latency_max',
+        'last_error', 'last_error_at', 'counts_retries'
+    )
+
+    def __init__(self, counts_retries: bool = True):
+        """
+        Args:
+            counts_retries: The transport retries transactions (False leaves
+                retries out of the snapshot instead of reporting 0)
+        """
+        self.counts_retries = counts_retries
+        self.since = time.time()
+        self.transactions = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.crc_errors = 0  # Corrupt frames received (the answer may have followed)
+        self.exceptions = 0
+        self.exception_codes: Dict[int, int] = {}
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+
+    def _observe(self, latency: float, sent: int, received: int):
+        """Count one transaction (latency in seconds)"""
+        self.transactions += 1
+        self.bytes_sent += sent
+        self.bytes_received += received
+        milliseconds = latency * 1000
+        self.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, milliseconds)] += 1
+        self.latency_total += latency
+        if milliseconds > self.latency_max:
+            self.latency_max = milliseconds
+
+    def success(self, latency: float, sent: int, received: int):
+        """Transaction answered"""
+        self._observe(latency, sent, received)
+
+    def failure(self, kind: str, latency: float, sent: int = 0, received: int = 0,
+                error: Any = None, code: Optional[int] = None):
+        """
+        Transaction failed
+
+        Args:
+            kind: TIMEOUT, CRC_ERROR, EXCEPTION or ERROR
+            latency: Time until the failure (s)
+            sent: Bytes written
+            received: Bytes read
+            error: Exception or message (kept as last error)
+            code: Exception code of an EXCEPTION answer
+        """
+        self._observe(latency, sent, received)
+        self.failed += 1
+        if kind == TIMEOUT:
+            self.timeouts += 1
+        elif kind == CRC_ERROR:
+            pass  # Corrupt frames are counted by corrupt()
+        elif kind == EXCEPTION:
+            self.exceptions += 1
+            if code is not None:
+                self.exception_codes[code] = self.exception_codes.get(code, 0) + 1
+        else:
+            self.errors += 1
+        self.last_error = f"{kind}: {error!r}" if error is not None else kind
+        self.last_error_at = time.time()
+
+    def corrupt(self, frames: int, retried: bool = False):
+        """Corrupt frames received; retried when a valid answer followed"""
+        self.crc_errors += frames
+        if retried:
+            self.retries += 1
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Upper bound (ms) of the bucket holding the given fraction of transactions"""
+        if not self.transactions:
+            return None
+        rank = fraction * self.transactions
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.latency_buckets):
+            seen += count
+            if seen >= rank:
+                return float(bound)
+        return round(self.latency_max, 1)
+
+    def merge(self, other: 'TransportStats'):
+        """Add another device's counters (port totals)"""
+        self.since = min(self.since, other.since)
+        for name in ('transactions', 'failed', 'timeouts', 'crc_errors', 'exceptions', 'errors', 'retries',
+                     'bytes_sent', 'bytes_received', 'latency_total'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for code, count in other.exception_codes.items():
+            self.exception_codes[code] = self.exception_codes.get(code, 0) + count
+        self.latency_buckets = [a + b for a, b in zip(self.latency_buckets, other.latency_buckets)]
+        self.latency_max = max(self.latency_max, other.latency_max)
+        if other.last_error_at is not None and (self.last_error_at is None or other.last_error_at > self.last_error_at):
+            self.last_error, self.last_error_at = other.last_error, other.last_error_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly snapshot"""
+        elapsed = max(time.time() - self.since, 1e-9)
+        return {
+            "since": datetime.fromtimestamp(self.since, timezone.utc).isoformat(),
+            "transactions": self.transactions,
+            "ok": self.transactions - self.failed,
+            "timeouts": self.timeouts,
+            "crc_errors": self.crc_errors,
+            "exceptions": self.exceptions,
+            "exception_codes": {str(code): count for code, count in sorted(self.exception_codes.items())},
+            "errors": self.errors,
+            **({"retries": self.retries} if self.counts_retries else {}),
+            "error_rate": round(self.failed / self.transactions, 4) if self.transactions else 0.0,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            # Share of the time with a transaction on the wire (serialized buses;
+            # pipelined gateways overlap transactions and can exceed 1)
+            "busy_ratio": round(self.latency_total / elapsed, 4),
+            "latency_ms": {
+                "avg": round(self.latency_total / self.transactions * 1000, 1) if self.transactions else None,
+                "p50": self.percentile(0.5),
+                "p95": self.percentile(0.95),
+                "max": round(self.latency_max, 1),
+                "buckets": [
+                    {"le": bound, "count": count}
+                    for bound, count in zip(LATENCY_BUCKETS_MS + (None,), self.latency_buckets)
+                ],
+            },
+            "last_error": self.last_error,
+            "last_error_at": (
+                datetime.fromtimestamp(self.last_error_at, timezone.utc).isoformat()
+                if self.last_error_at is not None else None
+            ),
+        }
+
+
+def port_summary(port: str, transport: str, devices: Dict[Optional[int], TransportStats],
+                 connects: int = 0, pipelining: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Totals and per-device statistics of one port
+
+    Args:
+        port: Port or gateway URL
+        transport: "modbus_rtu", "modbus_tcp" or "mppsolar"
+        devices: Slave ID (None for single-device ports) -> statistics
+        connects: Port (re)openings
+        pipelining: Pipelining state of a Modbus TCP gateway (fallbacks to
+            one request at a time)
+    """
+    totals = TransportStats(counts_retries=any(stats.counts_retries for stats in devices.values()))
+    for stats in devices.values():
+        totals.merge(stats)
+    summary = {
+        "port": port,
+        "transport": transport,
+        "connects": connects,
+        "totals": totals.to_dict(),
+        "devices": [{"slave_id": slave_id, **stats.to_dict()} for slave_id, stats in devices.items()],
+    }
+    if pipelining is not None:
+        summary["pipelining"] = pipelining
+    return summary
@@ -6,13 +6,14 @@ import { Card } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs";
 import { LineChart, Line, AreaChart, Area, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from "recharts";
-import { ArrowLeft, Zap, Battery, Gauge, Thermometer } from "lucide-react";
+import { ArrowLeft, Zap, Battery, Gauge, Thermometer, Activity } from "lucide-react";
 import toast from "react-hot-toast";
 
 const InverterDetail = () => {
   const { id } = useParams();
   const [inverter, setInverter] = useState(null);
   const [reading, setReading] = useState(null);
+  const [transport, setTransport] = useState(null);
   const [chartData, setChartData] = useState([]);
   const [period, setPeriod] = useState("today");
   const [loading, setLoading] = useState(true);
@@ -36,6 +37,7 @@ const InverterDetail = () => {
       setInverter(invRes.data);
       setReading(readRes.data);
       setLoading(false);
+      fetchTransport();
     } catch (error) {
       console.error("Error fetching data:", error);
       toast.error("Erreur de chargement");
@@ -50,6 +52,16 @@ const InverterDetail = () => {
     } catch (error) {
       console.error("Error fetching realtime data:", error);
     }
+    fetchTransport();
+  };
+
+  const fetchTransport = async () => {
+    try {
+      const res = await axios.get(`${API}/inverters/${id}/transport`);
+      setTransport(res.data);
+    } catch (error) {
+      console.error("Error fetching transport stats:", error);
+    }
   };
 
   const fetchChartData = async () => {
@@ -89,10 +101,25 @@ const InverterDetail = () => {
         </a>
         <div>
           <h1 className="text-4xl lg:text-5xl font-bold gradient-text" data-testid="inverter-detail-name">{inverter.name}</h1>
-          <p className="text-base text-slate-600">{inverter.brand} • {inverter.connection_type}</p>
+          <p className="text-base text-slate-600">
+            {inverter.brand} • {inverter.connection_type}
+            {reading?.mode && <span data-testid="inverter-mode"> • Mode : {reading.mode}</span>}
+          </p>
         </div>
       </div>
 
+      {/* Warnings (MPPSOLAR QPIWS) */}
+      {reading?.warnings?.length > 0 && (
+        <Card className="p-4 mb-8 bg-amber-50 border-amber-200" data-testid="inverter-warnings">
+          <h3 className="font-semibold text-amber-800 mb-2">⚠️ Alertes onduleur</h3>
+          <div className="flex flex-wrap gap-2">
+            {reading.warnings.map((warning) => (
+              <span key={warning} className="px-2 py-1 text-xs rounded bg-amber-100 text-amber-800">{warning}</span>
+            ))}
+          </div>
+        </Card>
+      )}
+
       {/* Real-time Metrics */}
       {reading && (
         <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-4 gap-6 mb-8">
@@ -215,6 +242,11 @@ const InverterDetail = () => {
         </div>
       )}
 
+      {/* Transport statistics (REAL mode) */}
+      {transport?.active && transport.device && (
+        <TransportCard transport={transport} />
+      )}
+
       {/* Charts */}
       <Card className="p-6 bg-white/80 backdrop-blur-sm" data-testid="charts-card">
         <div className="flex items-center justify-between mb-6">
@@ -283,4 +315,98 @@ const InverterDetail = () => {
   );
 };
 
+// Statistiques de liaison (latence, erreurs, octets) de l'onduleur et de son port
+const TransportCard = ({ transport }) => {
+  const device = transport.device;
+  const totals = transport.port_totals;
+  const maxBucket = Math.max(1, ...device.latency_ms.buckets.map((bucket) => bucket.count));
+  const formatBytes = (bytes) => bytes >= 1048576 ? `${(bytes / 1048576).toFixed(1)} Mo` : `${(bytes / 1024).toFixed(1)} ko`;
+
+  return (
+    <Card className="p-6 mb-8 bg-white/80 backdrop-blur-sm" data-testid="transport-card">
+      <div className="flex items-center gap-2 mb-4">
+        <Activity className="w-5 h-5 text-slate-600" />
+        <h3 className="font-semibold text-slate-700">Liaison</h3>
+        <span className="text-sm text-slate-500">
+          {transport.port} • {transport.transport} • {transport.devices_on_port} appareil(s) sur le port
+        </span>
+      </div>
+
+      <div className="grid grid-cols-1 md:grid-cols-3 gap-6">
+        <div className="space-y-2">
+          <div className="flex justify-between">
+            <span className="text-sm text-slate-600">Transactions:</span>
+            <span className="font-semibold" data-testid="transport-transactions">{device.ok} / {device.transactions}</span>
+          </div>
+          <div className="flex justify-between">
+            <span className="text-sm text-slate-600">Taux d'erreur:</span>
+            <span className={`font-semibold ${device.error_rate > 0.05 ? "text-red-600" : ""}`} data-testid="transport-error-rate">
+              {(device.error_rate * 100).toFixed(1)}%
+            </span>
+          </div>
+          <div className="flex justify-between">
+            <span className="text-sm text-slate-600">Timeouts / CRC / Exceptions:</span>
+            <span className="font-semibold" data-testid="transport-errors">
+              {device.timeouts} / {device.crc_errors} / {device.exceptions}
+            </span>
+          </div>
+          <div className="flex justify-between">
+            <span className="text-sm text-slate-600">
+              {device.retries !== undefined ? "Erreurs port / Reprises:" : "Erreurs port:"}
+            </span>
+            <span className="font-semibold">
+              {device.errors}{device.retries !== undefined && ` / ${device.retries}`}
+            </span>
+          </div>
+        </div>
+
+        <div className="space-y-2">
+          <div className="flex justify-between">
+            <span className="text-sm text-slate-600">Latence moy. / p95 / max:</span>
+            <span className="font-semibold" data-testid="transport-latency">
+              {device.latency_ms.avg ?? "-"} / {device.latency_ms.p95 ?? "-"} / {device.latency_ms.max} ms
+            </span>
+          </div>
+          <div className="flex justify-between">
+            <span className="text-sm text-slate-600">Octets envoyés / reçus:</span>
+            <span className="font-semibold">{formatBytes(device.bytes_sent)} / {formatBytes(device.bytes_received)}</span>
+          </div>
+          <div className="flex justify-between">
+            <span className="text-sm text-slate-600">Occupation du port:</span>
+            <span className={`font-semibold ${totals.busy_ratio > 0.8 ? "text-amber-600" : ""}`} data-testid="transport-busy">
+              {(totals.busy_ratio * 100).toFixed(1)}%
+            </span>
+          </div>
+          <div className="flex justify-between">
+            <span className="text-sm text-slate-600">Connexions du port:</span>
+            <span className="font-semibold">{transport.connects}</span>
+          </div>
+        </div>
+
+        <div>
+          <p className="text-sm text-slate-600 mb-2">Histogramme de latence (ms)</p>
+          <div className="flex items-end gap-1 h-20" data-testid="transport-histogram">
+            {device.latency_ms.buckets.map((bucket) => (
+              <div key={bucket.le ?? "inf"} className="flex-1 flex flex-col items-center justify-end h-full">
+                <div
+                  className="w-full bg-emerald-400 rounded-t"
+                  style={{ height: `${(bucket.count / maxBucket) * 100}%` }}
+                  title={`≤ ${bucket.le ?? "∞"} ms: ${bucket.count}`}
+                />
+                <span className="text-[10px] text-slate-500">{bucket.le ?? "+"}</span>
+              </div>
+            ))}
+          </div>
+        </div>
+      </div>
+
+      {device.last_error && (
+        <p className="text-xs text-slate-500 mt-4">
+          Dernière erreur : {device.last_error} ({new Date(device.last_error_at).toLocaleString('fr-FR')})
+        </p>
+      )}
+    </Card>
+  );
+};
+
 export default InverterDetail;
\ No newline at end of file
@@ -724,6 +724,11 @@ const AddInverterForm = ({ onSuccess }) => {
           placeholder="/dev/ttyUSB0"
           required
         />
+        {formData.brand === "GROWATT" && (
+          <p className="text-xs text-slate-500 mt-1">
+            Passerelle Ethernet : tcp://192.168.1.50:502 (Modbus TCP) ou rtu+tcp://192.168.1.50:8899 (RS485 transparent)
+          </p>
+        )}
       </div>
 
       <div>